@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import json
+import os
+import os.path
+import platform
+import subprocess
+import sys
+import time
+
+import tornado
+
+
+class Results(object):
+    """ benchmark measurements, written out as json so runs can be compared over time """
+
+    def __init__(self, args):
+        self.meta = {
+            "started": time.time(),
+            "args": args,
+            "python": platform.python_version(),
+            "tornado": tornado.version,
+            "platform": platform.platform(),
+            "cpus": os.sysconf('SC_NPROCESSORS_ONLN'),
+            "revision": revision()
+        }
+        self.results = []
+
+    def add(self, name, **fields):
+        result = dict(fields, name=name)
+        self.results.append(result)
+
+        details = ", ".join("{0}={1}".format(key, format_value(value)) for key, value in sorted(fields.items()))
+        print "{0}: {1}".format(name, details)
+        sys.stdout.flush()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump({"meta": self.meta, "results": self.results}, f, indent=2, sort_keys=True)
+
+        print "wrote {0} results to {1}".format(len(self.results), path)
+
+
+def summarize(seconds):
+    """ the usual statistics for a list of timings, in milliseconds """
+
+    seconds = sorted(seconds)
+    count = len(seconds)
+
+    return {
+        "count": count,
+        "mean_ms": 1000 * sum(seconds) / count,
+        "p50_ms": 1000 * seconds[int(count * 0.5)],
+        "p99_ms": 1000 * seconds[min(count - 1, int(count * 0.99))],
+        "max_ms": 1000 * seconds[-1]
+    }
+
+
+def revision():
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root, stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return "{0:.3f}".format(value)
+    return str(value)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+"""
+benchmarks for pyjojo's hot paths, written out as json to compare runs over time
+
+    python bench/run.py --sizes 10,1000,50000 --json results.json
+    python bench/run.py --only exec,output
+
+each benchmark runs pyjojo in this process, against synthetic script trees
+generated from --seed, so runs with the same arguments measure the same thing.
+"""
+
+import base64
+import os
+import os.path
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from passlib.apache import HtpasswdFile
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPError, HTTPRequest
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+
+from pyjojo.config import config
+from pyjojo.options import command_line_options
+from pyjojo.scripts import create_collection
+from pyjojo.util import create_application
+
+from results import Results, summarize
+from tree import generate_tree, write_persistent_script, write_script
+
+BENCHMARKS = ['collection', 'tags', 'auth', 'exec', 'output']
+
+TAG_QUERIES = ['', 'tags=deploy', 'tags=team-7', 'tags=deploy,web', 'any_tags=team-1,team-2', 'tags=db&not_tags=web']
+
+
+def configure(args):
+    """ set up pyjojo's config, like the command line would """
+
+    sys.argv = ['pyjojo'] + list(args)
+    command_line_options()
+
+
+class Server(object):
+    """ a pyjojo application listening on a free local port """
+
+    def __init__(self, concurrency=10):
+        self.application = create_application(False)
+        sockets = bind_sockets(0, '127.0.0.1')
+        self.port = sockets[0].getsockname()[1]
+        self.server = HTTPServer(self.application)
+        self.server.add_sockets(sockets)
+        self.client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+
+    def url(self, path):
+        return "http://127.0.0.1:{0}{1}".format(self.port, path)
+
+    @gen.coroutine
+    def timed(self, path, **kwargs):
+        """ fetch the path, returning the response and how long it took """
+
+        started = time.time()
+        try:
+            response = yield self.client.fetch(HTTPRequest(self.url(path), **kwargs))
+        except HTTPError as e:
+            if e.code != 304:
+                raise
+            response = e.response
+        raise gen.Return((response, time.time() - started))
+
+    @gen.coroutine
+    def repeat(self, path, count, before=None, **kwargs):
+        timings = []
+        for i in range(count):
+            if before is not None:
+                before()
+            response, seconds = yield self.timed(path, **kwargs)
+            timings.append(seconds)
+        raise gen.Return((response, timings))
+
+    def stop(self):
+        self.server.stop()
+        self.client.close()
+
+
+def tree_for(workdir, size, seed):
+    directory = os.path.join(workdir, 'tree-{0}'.format(size))
+    if not os.path.isdir(directory):
+        generate_tree(directory, size, seed)
+    return directory
+
+
+def bench_collection(options, results, workdir):
+    """ startup time parsing the script tree, from scratch and from a manifest """
+
+    for size in options.sizes:
+        directory = tree_for(workdir, size, options.seed)
+
+        configure(['--dir', directory])
+        started = time.time()
+        create_collection(directory)
+        results.add('collection.create', scripts=size, seconds=time.time() - started)
+
+        manifest = os.path.join(workdir, 'manifest-{0}.json'.format(size))
+        configure(['--dir', directory, '--manifest', manifest])
+        create_collection(directory)
+        started = time.time()
+        create_collection(directory)
+        results.add('collection.create_from_manifest', scripts=size, seconds=time.time() - started)
+
+
+def bench_tags(options, results, workdir):
+    """ latency of tag filtered listings, computed fresh, cached, and answered with a 304 """
+
+    for size in options.sizes:
+        configure(['--dir', tree_for(workdir, size, options.seed)])
+        server = Server()
+
+        @gen.coroutine
+        def run():
+            for query in TAG_QUERIES:
+                path = '/scripts?' + query
+                count = max(5, options.requests // 10) if size >= 10000 else options.requests
+
+                # a changed collection drops its cached listings
+                response, timings = yield server.repeat(path, count, before=lambda: server.application.settings['scripts'].changed())
+                results.add('scripts.tags', scripts=size, query=query, cached=False, **summarize(timings))
+
+                response, timings = yield server.repeat(path, options.requests)
+                results.add('scripts.tags', scripts=size, query=query, cached=True, bytes=len(response.body), **summarize(timings))
+
+                etag = response.headers['Etag']
+                response, timings = yield server.repeat(path, options.requests, headers={'If-None-Match': etag})
+                results.add('scripts.tags_not_modified', scripts=size, query=query, **summarize(timings))
+
+        IOLoop.instance().run_sync(run)
+        server.stop()
+
+
+def bench_auth(options, results, workdir):
+    """ request overhead of basic auth, with and without the credential cache """
+
+    directory = tree_for(workdir, 10, options.seed)
+    passfile = os.path.join(workdir, 'htpasswd')
+
+    htpasswd = HtpasswdFile(passfile, new=True)
+    htpasswd.set_password('bench', 'secret')
+    htpasswd.save()
+
+    headers = {'Authorization': 'Basic ' + base64.b64encode('bench:secret')}
+
+    for name, args, request_headers in [
+            ('none', [], {}),
+            ('cached', ['--auth-cache-ttl', '300', passfile], headers),
+            ('uncached', ['--auth-cache-ttl', '0', passfile], headers)]:
+
+        configure(['--dir', directory] + args)
+        server = Server()
+
+        @gen.coroutine
+        def run():
+            response, timings = yield server.repeat('/script_names', options.requests, headers=request_headers)
+            results.add('auth', mode=name, **summarize(timings))
+
+        IOLoop.instance().run_sync(run)
+        server.stop()
+
+
+def bench_exec(options, results, workdir):
+    """ throughput running a script that does nothing, with each spawn backend, and as a persistent script """
+
+    directory = os.path.join(workdir, 'exec')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+        write_script(directory, 'noop', 'exit 0')
+        write_persistent_script(directory, 'persistent', options.concurrency)
+
+    for name, path, spawner in [
+            ('exec.noop', '/scripts/noop', 'fork'),
+            ('exec.noop', '/scripts/noop', 'helper'),
+            ('exec.persistent', '/scripts/persistent', 'fork')]:
+
+        configure(['--dir', directory, '--spawner', spawner, '--max-children', str(options.concurrency)])
+        server = Server(options.concurrency)
+
+        @gen.coroutine
+        def run():
+            # one warm up run, which also starts the spawn helper or persistent children
+            yield server.timed(path)
+
+            per_client = options.runs // options.concurrency
+            started = time.time()
+            timings = yield [server.repeat(path, per_client) for i in range(options.concurrency)]
+            elapsed = time.time() - started
+
+            timings = [seconds for response, client_timings in timings for seconds in client_timings]
+            results.add(name, spawner=spawner, concurrency=options.concurrency,
+                        runs_per_second=len(timings) / elapsed, **summarize(timings))
+
+        IOLoop.instance().run_sync(run)
+        server.stop()
+
+
+def bench_output(options, results, workdir):
+    """ time and memory to run a script with a lot of output, buffered and streamed """
+
+    directory = os.path.join(workdir, 'output')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+        write_script(directory, 'large', "yes 'a line of output from a chatty script' | head -c {0}".format(options.output_mb * 1024 * 1024))
+
+    configure(['--dir', directory])
+    server = Server()
+
+    @gen.coroutine
+    def run():
+        for mode, path in [('buffered', '/scripts/large'), ('streamed', '/scripts/large?stream=ndjson')]:
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            response, timings = yield server.repeat(path, 3, request_timeout=600)
+            results.add('output.large', mode=mode, output_mb=options.output_mb, response_bytes=len(response.body),
+                        max_rss_growth_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss,
+                        **summarize(timings))
+
+    IOLoop.instance().run_sync(run)
+    server.stop()
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--sizes', action="store", dest="sizes", default="10,1000,10000",
+                      help="Comma separated numbers of scripts in the synthetic trees.")
+    parser.add_option('--requests', action="store", dest="requests", type="int", default=200,
+                      help="Requests to time for each latency measurement.")
+    parser.add_option('--runs', action="store", dest="runs", type="int", default=400,
+                      help="Scripts to run for the exec benchmark.")
+    parser.add_option('--concurrency', action="store", dest="concurrency", type="int", default=8,
+                      help="Requests in flight at once for the exec benchmark.")
+    parser.add_option('--output-mb', action="store", dest="output_mb", type="int", default=64,
+                      help="Megabytes written by the script in the output benchmark.")
+    parser.add_option('--seed', action="store", dest="seed", type="int", default=0,
+                      help="Seed for generating the script trees.")
+    parser.add_option('--only', action="store", dest="only", default=','.join(BENCHMARKS),
+                      help="Comma separated benchmarks to run, from: {0}.".format(', '.join(BENCHMARKS)))
+    parser.add_option('--workdir', action="store", dest="workdir", default=None,
+                      help="Directory for the generated trees, kept between runs.  A temporary one by default.")
+    parser.add_option('--json', action="store", dest="json", default="bench-results.json",
+                      help="File to write the results to.")
+    options, args = parser.parse_args()
+
+    options.sizes = [int(size) for size in options.sizes.split(',')]
+    results = Results(vars(options))
+
+    workdir = options.workdir or tempfile.mkdtemp(prefix='pyjojo-bench-')
+    try:
+        for name in options.only.split(','):
+            globals()['bench_' + name](options, results, workdir)
+    finally:
+        if options.workdir is None:
+            shutil.rmtree(workdir)
+
+    results.write(options.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""
+measure how long it takes to start a child with each spawn backend
+
+the server is padded out with --ballast megabytes of memory first, since the
+cost of forking grows with the size of the process doing it.
+
+    python bench/spawn.py --count 200 --ballast 1024
+"""
+
+import os
+import os.path
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.process import Subprocess
+
+from pyjojo.spawner import spawner
+
+from results import Results, summarize
+
+CHILD = '/bin/true'
+
+
+@gen.engine
+def spawn_fork(callback):
+    started = time.time()
+    child = Subprocess([CHILD], stdout=subprocess.PIPE, preexec_fn=os.setsid)
+    spawned = time.time()
+
+    yield gen.Task(child.set_exit_callback)
+    child.stdout.close()
+
+    callback((spawned - started, spawned - started))
+
+
+@gen.engine
+def spawn_helper(callback):
+    blocked = []
+
+    def start(callback):
+        before = time.time()
+        spawner().spawn(CHILD, {}, True, callback)
+        blocked.append(time.time() - before)
+
+    started = time.time()
+    child, error = yield gen.Task(start)
+    if child is None:
+        raise Exception(error)
+    spawned = time.time()
+
+    child.stdout.close()
+    yield gen.Task(child.set_exit_callback)
+
+    callback((spawned - started, blocked[0]))
+
+
+@gen.engine
+def measure(spawn, count, callback):
+    # the helper starts on first use, which isn't what we're measuring
+    yield gen.Task(spawn)
+
+    latencies = []
+    blocked = []
+    for i in range(count):
+        latency, block = yield gen.Task(spawn)
+        latencies.append(latency)
+        blocked.append(block)
+
+    callback((latencies, blocked))
+
+
+@gen.engine
+def run(options, results):
+    ballast = 'x' * (options.ballast * 1024 * 1024)
+
+    for name, spawn in [('fork', spawn_fork), ('helper', spawn_helper)]:
+        latencies, blocked = yield gen.Task(measure, spawn, options.count)
+        results.add('spawn', spawner=name, ballast_mb=options.ballast,
+                    ioloop_blocked_mean_ms=1000 * sum(blocked) / len(blocked), **summarize(latencies))
+
+    IOLoop.instance().stop()
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--count', action="store", dest="count", type="int", default=200,
+                      help="Children to start with each backend.")
+    parser.add_option('--ballast', action="store", dest="ballast", type="int", default=512,
+                      help="Megabytes to grow the process by before spawning.")
+    parser.add_option('--json', action="store", dest="json", default=None,
+                      help="File to write the results to, as json.")
+    options, args = parser.parse_args()
+
+    results = Results(vars(options))
+    run(options, results)
+    IOLoop.instance().start()
+
+    if options.json is not None:
+        results.write(options.json)
+
+
+if __name__ == '__main__':
+    main()
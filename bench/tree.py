@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import os
+import os.path
+import random
+import sys
+
+SCRIPT = """#!/bin/sh
+
+# -- jojo --
+# description: synthetic script {index}
+# param: text - some text
+# tags: {tags}
+# http_method: {http_method}
+# -- jojo --
+
+exit 0
+"""
+
+PERSISTENT_SCRIPT = """#!{python}
+
+# -- jojo --
+# http_method: get
+# persistent: True
+# pool_size: {pool_size}
+# -- jojo --
+
+import json
+import sys
+
+for line in iter(sys.stdin.readline, ''):
+    sys.stdout.write(json.dumps({{"retcode": 0, "stdout": "ok"}}) + "\\n")
+    sys.stdout.flush()
+"""
+
+# a few very common tags, and a long tail of rare ones
+COMMON_TAGS = ['deploy', 'db', 'web', 'cache', 'batch']
+RARE_TAGS = ['team-{0}'.format(i) for i in range(200)]
+
+
+def generate_tree(directory, count, seed=0):
+    """ write count synthetic scripts with varied tags into directory, the same ones for the same seed """
+
+    rng = random.Random(seed)
+
+    for index in range(count):
+        tags = rng.sample(COMMON_TAGS, rng.randint(0, 2)) + rng.sample(RARE_TAGS, rng.randint(1, 2))
+
+        # spread the scripts over a few subdirectories, like a real tree
+        subdirectory = os.path.join(directory, 'group{0}'.format(index % 10))
+        if not os.path.isdir(subdirectory):
+            os.makedirs(subdirectory)
+
+        path = os.path.join(subdirectory, 'script{0}.sh'.format(index))
+        with open(path, 'w') as f:
+            f.write(SCRIPT.format(index=index, tags=', '.join(tags), http_method=rng.choice(['get', 'post'])))
+        os.chmod(path, 0o755)
+
+
+def write_script(directory, name, body, jojo_block="# http_method: get"):
+    """ write a single script for a benchmark to run """
+
+    path = os.path.join(directory, '{0}.sh'.format(name))
+    with open(path, 'w') as f:
+        f.write("#!/bin/sh\n\n# -- jojo --\n{0}\n# -- jojo --\n\n{1}\n".format(jojo_block, body))
+    os.chmod(path, 0o755)
+
+    return path
+
+
+def write_persistent_script(directory, name, pool_size):
+    """ write a persistent script that answers every request straight away """
+
+    path = os.path.join(directory, '{0}.py'.format(name))
+    with open(path, 'w') as f:
+        f.write(PERSISTENT_SCRIPT.format(python=sys.executable, pool_size=pool_size))
+    os.chmod(path, 0o755)
+
+    return path
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from passlib.apache import HtpasswdFile
+from tornado import gen
+
+from pyjojo.config import config
+from pyjojo.pool import executor
+
+log = logging.getLogger(__name__)
+
+
+class PasswordFile(object):
+    """ an htpasswd file, only re-parsed when it changes on disk """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.signature = None
+        self.htpasswd = None
+        self.lock = threading.Lock()
+
+    def stat(self):
+        """ identify the current version of the file by inode, mtime and size """
+
+        stat = os.stat(self.filename)
+        return (stat.st_ino, stat.st_mtime, stat.st_size)
+
+    def check_password(self, username, password):
+        """
+        verify the password, reloading the file first if needed, returning whether
+        it's good and the signature of the file it was checked against
+        """
+
+        with self.lock:
+            signature = self.stat()
+            if signature != self.signature:
+                log.info("Loading password file {0}".format(self.filename))
+                self.htpasswd = HtpasswdFile(self.filename)
+                self.signature = signature
+            htpasswd = self.htpasswd
+
+        # is the user in the password file?
+        if not username in htpasswd.users():
+            return False, signature
+
+        return bool(htpasswd.check_password(username, password)), signature
+
+
+class CredentialCache(object):
+    """
+    bounded, ttl evicted set of recently verified credentials, each tagged with
+    the signature of the password file it was verified against
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.signature = None
+
+        # passwords are never kept around, only a keyed digest of them
+        self.secret = os.urandom(32)
+
+    def key(self, username, password):
+        return (username, hmac.new(self.secret, password, hashlib.sha256).digest())
+
+    def verified(self, key, signature):
+        """ were the credentials verified against this version of the file, and recently """
+
+        # a new version of the file makes everything verified against the old one useless
+        if signature != self.signature:
+            self.clear()
+            self.signature = signature
+            return False
+
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+
+        expires, verified_signature = entry
+        if (expires < time.time()) or (verified_signature != signature):
+            del self.entries[key]
+            return False
+
+        return True
+
+    def add(self, key, signature):
+        # a check that started before the file changed can finish after
+        if signature != self.signature:
+            return
+
+        self.entries.pop(key, None)
+        self.entries[key] = (time.time() + self.ttl, signature)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class Authenticator(object):
+    """ checks credentials against an htpasswd file """
+
+    def __init__(self, filename, ttl, max_size):
+        self.passfile = PasswordFile(filename)
+        self.cache = CredentialCache(ttl, max_size)
+
+    @gen.coroutine
+    def authenticate(self, username, password):
+        """
+        answer from the cache if we can, otherwise hash on the thread pool
+
+        the password file is only looked at on the thread pool too, and if it
+        can't be read, for instance while it's being replaced, nobody gets in
+        """
+
+        key = self.cache.key(username, password)
+
+        try:
+            if self.cache.ttl > 0:
+                signature = yield executor().submit(self.passfile.stat)
+                if self.cache.verified(key, signature):
+                    raise gen.Return(True)
+
+            authenticated, signature = yield executor().submit(self.passfile.check_password, username, password)
+        except (IOError, OSError) as e:
+            log.error("Can't read password file {0}: {1}".format(self.passfile.filename, e))
+            raise gen.Return(False)
+
+        if authenticated and self.cache.ttl > 0:
+            self.cache.add(key, signature)
+
+        raise gen.Return(authenticated)
+
+
+def create_authenticator(passfile):
+    """ create the authenticator for the password file, if there is one """
+
+    if passfile is None:
+        return None
+
+    return Authenticator(passfile, config['auth_cache_ttl'], config['auth_cache_size'])
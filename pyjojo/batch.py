@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+import functools
+import logging
+from collections import deque, OrderedDict
+
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from tornado.web import HTTPError
+
+log = logging.getLogger(__name__)
+
+
+class Batch(object):
+    """
+    scripts to run together, each once the items it comes after have succeeded, a few at a time
+
+    the request body looks like:
+
+        {
+            "items": [
+                {"id": "build", "script": "build", "params": {"ref": "master"}},
+                {"id": "deploy", "script": "deploy", "params": {}, "after": ["build"]},
+                {"id": "check", "script": "status", "method": "get", "after": ["deploy"]}
+            ],
+            "concurrency": 4,
+            "fail_fast": false
+        }
+    """
+
+    def __init__(self, scripts, body, max_concurrency, max_items):
+        if (not isinstance(body, dict)) or (not isinstance(body.get('items'), list)) or (not body['items']):
+            raise HTTPError(400, "A batch needs a list of items")
+
+        if len(body['items']) > max_items:
+            raise HTTPError(400, "A batch can have at most {0} items".format(max_items))
+
+        self.items = OrderedDict()
+        for index, item in enumerate(body['items']):
+            item = self.parse_item(scripts, index, item)
+            if item['id'] in self.items:
+                raise HTTPError(400, "Batch item id '{0}' is used more than once".format(item['id']))
+            self.items[item['id']] = item
+
+        # who is waiting on each item
+        self.dependents = dict((item_id, []) for item_id in self.items)
+        for item in self.items.values():
+            for after in item['after']:
+                if after not in self.items:
+                    raise HTTPError(400, "Batch item '{0}' comes after unknown item '{1}'".format(item['id'], after))
+                self.dependents[after].append(item['id'])
+
+        self.check_cycles()
+
+        try:
+            concurrency = int(body.get('concurrency', max_concurrency))
+        except (TypeError, ValueError):
+            raise HTTPError(400, "Batch concurrency must be a number")
+
+        self.concurrency = max(1, min(concurrency, max_concurrency))
+        self.fail_fast = bool(body.get('fail_fast', False))
+
+        self.results = {}
+        self.running = 0
+        self.failed = False
+        self.done = False
+
+    def parse_item(self, scripts, index, item):
+        if (not isinstance(item, dict)) or ('script' not in item):
+            raise HTTPError(400, "Batch item {0} needs a script".format(index))
+
+        script = scripts.get(item['script'])
+        if script is None:
+            raise HTTPError(400, "Script with name '{0}' not found".format(item['script']))
+
+        # items say how they'd run the script on its own, which has to be the way the script allows
+        method = item.get('method', 'post')
+        if (not isinstance(method, basestring)) or (method.lower() != script.http_method):
+            raise HTTPError(400, "Wrong HTTP method for script '{0}' in batch item {1}. Use '{2}'".format(
+                script.name, index, script.http_method.upper()))
+
+        params = item.get('params', {})
+        after = item.get('after', [])
+        if (not isinstance(params, dict)) or (not isinstance(after, list)):
+            raise HTTPError(400, "Batch item {0} has bad params or after".format(index))
+
+        return {
+            'id': unicode(item.get('id', index)),
+            'script': script,
+            'params': params,
+            'after': [unicode(after_id) for after_id in after]
+        }
+
+    def check_cycles(self):
+        """ make sure every item can eventually run """
+
+        waiting = dict((item_id, len(item['after'])) for item_id, item in self.items.items())
+        ready = [item_id for item_id, count in waiting.items() if count == 0]
+        seen = 0
+
+        while ready:
+            item_id = ready.pop()
+            seen += 1
+            for dependent in self.dependents[item_id]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+
+        if seen != len(self.items):
+            raise HTTPError(400, "Batch items depend on each other in a cycle")
+
+    def run(self, run_item, on_result):
+        """
+        run_item(item) returns a future for the result of one item, on_result(item, result)
+        is called as each one finishes or is skipped, returns a future for the results
+        """
+
+        self.run_item = run_item
+        self.on_result = on_result
+        self.future = Future()
+
+        self.waiting = dict((item_id, set(item['after'])) for item_id, item in self.items.items())
+        self.ready = deque(item_id for item_id in self.items if not self.waiting[item_id])
+
+        self.start_ready()
+        return self.future
+
+    def start_ready(self):
+        while self.ready and (self.running < self.concurrency) and not (self.fail_fast and self.failed):
+            item = self.items[self.ready.popleft()]
+            self.running += 1
+            IOLoop.instance().add_future(self.run_item(item), functools.partial(self.item_finished, item))
+
+        if (self.running == 0) and not self.done:
+            self.finish()
+
+    def item_finished(self, item, future):
+        result = future.result()
+        self.running -= 1
+        self.record(item, result)
+
+        if succeeded(result):
+            for dependent in self.dependents[item['id']]:
+                self.waiting[dependent].discard(item['id'])
+                if (not self.waiting[dependent]) and (dependent not in self.results):
+                    self.ready.append(dependent)
+        else:
+            self.failed = True
+            self.skip_dependents(item)
+
+        self.start_ready()
+
+    def skip_dependents(self, item):
+        for dependent in self.dependents[item['id']]:
+            if dependent not in self.results:
+                self.record(self.items[dependent], {"status": "skipped", "reason": "'{0}' did not succeed".format(item['id'])})
+                self.skip_dependents(self.items[dependent])
+
+    def finish(self):
+        self.done = True
+
+        # whatever never got to run, because an item failed with fail_fast set
+        for item_id, item in self.items.items():
+            if item_id not in self.results:
+                self.record(item, {"status": "skipped", "reason": "an earlier item did not succeed"})
+
+        results = [self.results[item_id] for item_id in self.items]
+        self.future.set_result({
+            "status": "failed" if self.failed else "finished",
+            "results": results
+        })
+
+    def record(self, item, result):
+        result['id'] = item['id']
+        result['script'] = item['script'].name
+        self.results[item['id']] = result
+        self.on_result(item, result)
+
+
+def succeeded(result):
+    return (result['status'] == 'finished') and (result.get('retcode') == 0)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+import hashlib
+import hmac
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from tornado.ioloop import IOLoop
+from tornado.web import HTTPError
+
+from pyjojo.config import config
+
+log = logging.getLogger(__name__)
+
+# rough per line cost of keeping output in memory, on top of the text itself
+LINE_OVERHEAD = 64
+
+
+class ResultCache(object):
+    """ lru cache of script results, bounded by an estimate of the memory they use """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+        # key -> future, for results still being worked out
+        self.in_flight = {}
+
+        # parameter values, filtered ones included, are only kept as a keyed digest
+        self.secret = os.urandom(32)
+
+    def key(self, script, values):
+        """ the cache key for the script's result, given the environment create_env built or other identifying values """
+
+        digest = hmac.new(self.secret, repr(sorted(values.items())), hashlib.sha256).hexdigest()
+        return (script.name, digest)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        expires, size, response, fingerprint = entry
+        if expires < time.time():
+            self.remove(key)
+            return None
+
+        # most recently used goes to the back of the line
+        del self.entries[key]
+        self.entries[key] = entry
+
+        return response
+
+    def put(self, key, response, ttl, fingerprint=None):
+        size = estimate_size(response)
+
+        if size > self.max_bytes:
+            log.debug("Not caching result for {0}, it is too large".format(key[0]))
+            return
+
+        if key in self.entries:
+            self.remove(key)
+
+        self.entries[key] = (time.time() + ttl, size, response, fingerprint)
+        self.size += size
+
+        while self.size > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+
+    def fingerprint(self, key):
+        """ the fingerprint the result was stored with, if it's still here """
+
+        entry = self.entries.get(key)
+        return entry[3] if entry is not None else None
+
+    def remove(self, key):
+        expires, size, response, fingerprint = self.entries.pop(key)
+        self.size -= size
+
+    def purge(self, script_name=None):
+        """ drop every cached result, or just those for one script.  returns how many were dropped """
+
+        keys = [key for key in self.entries if (script_name is None) or (key[0] == script_name)]
+
+        for key in keys:
+            self.remove(key)
+
+        return len(keys)
+
+
+class IdempotencyCache(ResultCache):
+    """
+    results of requests made with an Idempotency-Key, to replay for retries
+
+    each result is stored with a fingerprint of the request's params, so a key
+    reused for a different request is turned away instead of replayed
+    """
+
+    def __init__(self, max_bytes):
+        ResultCache.__init__(self, max_bytes)
+
+        # key -> fingerprint, for requests still running
+        self.claims = {}
+
+    def check(self, key, fingerprint):
+        """ raise a 422 if the key was used for a request with other params """
+
+        claimed = self.claims.get(key, self.fingerprint(key))
+        if (claimed is not None) and (claimed != fingerprint):
+            raise HTTPError(422, "Idempotency-Key was already used for a request with different params",
+                            reason="Unprocessable Entity")
+
+
+def estimate_size(response):
+    """ approximate memory used by a (retcode, stdout[, stderr]) response """
+
+    size = 0
+    for lines in response[1:]:
+        size += sum(len(line) + LINE_OVERHEAD for line in lines)
+    return size
+
+
+def single_flight(in_flight, key, start):
+    """
+    return a future for the result of start(), which returns a future itself
+
+    every caller using the same key while it runs shares the one call, and its
+    result or exception
+    """
+
+    future = in_flight.get(key)
+
+    if future is None:
+        future = in_flight[key] = start()
+        IOLoop.instance().add_future(future, lambda future: landed(in_flight, key, future))
+
+    return future
+
+
+def landed(in_flight, key, future):
+    if in_flight.get(key) is future:
+        del in_flight[key]
+
+
+_result_cache = None
+_idempotency_cache = None
+
+
+def result_cache():
+    """ the server wide result cache """
+
+    global _result_cache
+
+    if _result_cache is None:
+        _result_cache = ResultCache(config['cache_max_bytes'])
+
+    return _result_cache
+
+
+def idempotency_cache():
+    """ the results of requests made with an Idempotency-Key, to replay for retries """
+
+    global _idempotency_cache
+
+    if _idempotency_cache is None:
+        _idempotency_cache = IdempotencyCache(config['cache_max_bytes'])
+
+    return _idempotency_cache
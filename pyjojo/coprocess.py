@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+import errno
+import json
+import logging
+import os
+import signal
+import subprocess
+import time
+from collections import deque
+
+from tornado import gen
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.iostream import StreamClosedError
+from tornado.process import Subprocess
+
+from pyjojo.metrics import metrics
+from pyjojo.output import LineReader
+
+log = logging.getLogger(__name__)
+
+# seconds between checks on idle children
+HEALTH_INTERVAL = 10.0
+
+# seconds a retired child gets to exit after its stdin is closed
+RETIRE_GRACE = 5.0
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class Coprocess(object):
+    """
+    a long lived child, answering one request at a time
+
+    each request is a line of json on the child's stdin, and each reply a line
+    of json on its stdout.  the child should exit once its stdin is closed
+    """
+
+    def __init__(self, script, io_loop=None):
+        self.script = script
+        self.io_loop = io_loop or IOLoop.instance()
+        self.requests = 0
+        self.callback = None
+        self.alive = True
+
+        started = time.time()
+        self.child = Subprocess(
+                script.filename,
+                env={},
+                stdin=Subprocess.STREAM,
+                stdout=Subprocess.STREAM,
+                stderr=subprocess.PIPE,
+                preexec_fn=os.setsid,
+                io_loop=self.io_loop
+            )
+        metrics().spawn_seconds.observe((script.name,), time.time() - started)
+
+        log.info("Started persistent child with pid {0} for script {1}".format(self.child.pid, script.name))
+
+        self.child.set_exit_callback(self.exited)
+        self.child.stdout.set_close_callback(self.closed)
+
+        # whatever the child says on stderr goes to our log
+        LineReader(self.child.stderr, 'stderr', self.log_lines, self.io_loop).read_until_close(lambda: None)
+
+    def request(self, message, callback):
+        """ send a request, callback(reply) with the decoded reply, or None if the child failed """
+
+        self.callback = callback
+        self.requests += 1
+
+        try:
+            self.child.stdin.write(json.dumps(message) + '\n')
+            self.child.stdout.read_until('\n', self.answered)
+        except StreamClosedError:
+            self.closed()
+
+    def answered(self, line):
+        try:
+            reply = json.loads(line)
+        except ValueError:
+            log.error("Persistent child with pid {0} sent a reply that isn't json: {1!r}".format(self.child.pid, line[:200]))
+            self.kill()
+            reply = None
+
+        self.respond(reply)
+
+    def closed(self):
+        self.alive = False
+        self.respond(None)
+
+    def exited(self, retcode):
+        self.alive = False
+        log.info("Persistent child with pid {0} exited with {1}".format(self.child.pid, retcode))
+
+    def respond(self, reply):
+        callback, self.callback = self.callback, None
+        if callback is not None:
+            callback(reply)
+
+    def rss(self):
+        """ resident memory of the child in bytes, or None if we can't tell """
+
+        try:
+            with open("/proc/{0}/statm".format(self.child.pid)) as f:
+                return int(f.read().split()[1]) * PAGE_SIZE
+        except (IOError, ValueError, IndexError):
+            return None
+
+    def retire(self):
+        """ ask the child to exit by closing its stdin, killing it if it doesn't """
+
+        if not self.alive:
+            return
+
+        self.child.stdin.close()
+        self.io_loop.add_timeout(time.time() + RETIRE_GRACE, self.kill)
+
+    def kill(self):
+        if not self.alive:
+            return
+
+        self.alive = False
+        try:
+            os.killpg(self.child.pid, signal.SIGKILL)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    def log_lines(self, stream, lines, resume):
+        for line in lines:
+            log.info("{0} [{1}]: {2}".format(self.script.name, self.child.pid, line))
+        resume()
+
+
+class CoprocessPool(object):
+    """ keeps between min_size and max_size coprocesses running a script, recycling worn out ones """
+
+    def __init__(self, script, min_size, max_size, max_requests=None, max_memory=None, io_loop=None):
+        self.script = script
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.max_requests = max_requests
+        self.max_memory = max_memory
+        self.io_loop = io_loop or IOLoop.instance()
+        self.idle = deque()
+        self.busy = set()
+        self.waiters = deque()
+        self.started = False
+        self.stopped = False
+        self.health_check = PeriodicCallback(self.check_health, HEALTH_INTERVAL * 1000, self.io_loop)
+
+    def size(self):
+        return len(self.idle) + len(self.busy)
+
+    def start(self):
+        """ children are only started on first use, so nothing forks before the workers do """
+
+        self.started = True
+        self.fill()
+        self.health_check.start()
+
+    def stop(self):
+        """ retire every child, the busy ones once they answer """
+
+        self.stopped = True
+        self.health_check.stop()
+
+        while self.idle:
+            self.idle.popleft().retire()
+
+    @gen.coroutine
+    def run(self, message, timeout):
+        """ a future for (reply, timed_out), the reply is None if the child died or sent nonsense """
+
+        if not self.started:
+            self.start()
+
+        coprocess = yield gen.Task(self.checkout)
+
+        deadline = None
+        expired = []
+        if timeout:
+            def expire():
+                log.warn("Persistent child with pid {0} timed out, killing it".format(coprocess.child.pid))
+                expired.append(True)
+                coprocess.kill()
+                coprocess.respond(None)
+
+            deadline = self.io_loop.add_timeout(time.time() + timeout, expire)
+
+        try:
+            reply = yield gen.Task(coprocess.request, message)
+        finally:
+            if deadline is not None:
+                self.io_loop.remove_timeout(deadline)
+            self.checkin(coprocess)
+
+        raise gen.Return((reply, bool(expired)))
+
+    def checkout(self, callback):
+        """ callback(coprocess) with an idle child, starting one if we're under max_size """
+
+        while self.idle:
+            coprocess = self.idle.popleft()
+            if coprocess.alive:
+                self.busy.add(coprocess)
+                callback(coprocess)
+                return
+
+        if self.size() < self.max_size:
+            coprocess = Coprocess(self.script, self.io_loop)
+            self.busy.add(coprocess)
+            callback(coprocess)
+            return
+
+        self.waiters.append(callback)
+
+    def checkin(self, coprocess):
+        self.busy.discard(coprocess)
+
+        if self.stopped or not self.healthy(coprocess):
+            coprocess.retire()
+            if self.waiters:
+                self.checkout(self.waiters.popleft())
+            elif not self.stopped:
+                self.fill()
+            return
+
+        if self.waiters:
+            self.busy.add(coprocess)
+            self.waiters.popleft()(coprocess)
+        else:
+            self.idle.append(coprocess)
+
+    def healthy(self, coprocess):
+        """ is the child still running, and not due to be recycled """
+
+        if not coprocess.alive:
+            return False
+
+        if self.max_requests and coprocess.requests >= self.max_requests:
+            log.info("Recycling persistent child with pid {0} after {1} requests".format(coprocess.child.pid, coprocess.requests))
+            return False
+
+        if self.max_memory:
+            rss = coprocess.rss()
+            if (rss is not None) and (rss > self.max_memory):
+                log.info("Recycling persistent child with pid {0} using {1} bytes".format(coprocess.child.pid, rss))
+                return False
+
+        return True
+
+    def check_health(self):
+        """ drop idle children that died or grew too large, and top the pool back up """
+
+        for coprocess in list(self.idle):
+            if not self.healthy(coprocess):
+                self.idle.remove(coprocess)
+                coprocess.retire()
+
+        self.fill()
+
+    def fill(self):
+        while self.size() < self.min_size:
+            self.idle.append(Coprocess(self.script, self.io_loop))
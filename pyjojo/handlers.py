@@ -6,24 +6,66 @@ import json
 import crypt
 import base64
 import difflib
+import functools
+import mmap
+import os
+import re
+import signal
+import time
 
-from passlib.apache import HtpasswdFile
 from tornado import gen
+from tornado.concurrent import Future
 from tornado.web import RequestHandler, HTTPError, asynchronous
 
+from pyjojo.batch import Batch
+from pyjojo.cache import result_cache, idempotency_cache, single_flight
 from pyjojo.config import config
-from pyjojo.scripts import create_collection
+from pyjojo.locks import locks
+from pyjojo.metrics import metrics, exposition, CONTENT_TYPE
+from pyjojo.output import ReturnValues, spill_store
+from pyjojo.ratelimit import rate_limiter
+from pyjojo.scheduler import scheduler, PRIORITIES
+from pyjojo.scripts import TimedOut
 from pyjojo.util import route
 
 log = logging.getLogger(__name__)
 
+# bytes of spilled output to send at a time
+OUTPUT_CHUNK = 65536
+
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream'
+}
+
 
 class BaseHandler(RequestHandler):
     """ Contains helper methods for all request handlers """    
 
+    # requests that run scripts count against the rate limits
+    rate_limited = False
+
+    @gen.coroutine
     def prepare(self):
+        self.username = None
+
+        # without a password file, turn away clients over their limits before doing any
+        # work for them.  otherwise nothing is charged until the password checks out, so
+        # requests without one can't use up the limits for everyone else
+        limited = self.rate_limited and (self.request.method != 'OPTIONS')
+        if limited and (self.settings['authenticator'] is None):
+            rate_limiter().check(self.limited_script(), self.request.remote_ip)
+
         self.handle_params()
-        self.handle_auth()
+        yield self.handle_auth()
+
+        if limited and (self.username is not None):
+            rate_limiter().check(self.limited_script(), self.username)
+
+    def limited_script(self):
+        """ the script whose rate_limit the request counts against, if any """
+
+        return None
 
     def handle_params(self):
         """ automatically parse the json body of the request """
@@ -40,11 +82,12 @@ class BaseHandler(RequestHandler):
             # we only handle json, and say so
             raise HTTPError(400, "This application only support json, please set the http header Content-Type to application/json")
 
+    @gen.coroutine
     def handle_auth(self):
         """ authenticate the user """
         
         # no passwords set, so they're good to go
-        if config['passfile'] == None:
+        if self.settings['authenticator'] is None:
             return
         
         # grab the auth header, returning a demand for the auth if needed
@@ -53,22 +96,28 @@ class BaseHandler(RequestHandler):
             self.auth_challenge()
             return
         
-        # decode the username and password
+        # decode the username and password, which may have colons in it
         auth_decoded = base64.decodestring(auth_header[6:])
-        username, password = auth_decoded.split(':', 2)
+        if ':' not in auth_decoded:
+            self.auth_challenge()
+            return
+
+        username, password = auth_decoded.split(':', 1)
                 
-        if not self.is_user_authenticated(username, password):
+        started = time.time()
+        authenticated = yield self.is_user_authenticated(username, password)
+        metrics().auth_seconds.observe(('ok' if authenticated else 'denied',), time.time() - started)
+
+        if not authenticated:
             self.auth_challenge()
             return
+
+        self.username = username
     
     def is_user_authenticated(self, username, password):
-        passfile = HtpasswdFile(config['passfile'])
-        
-        # is the user in the password file?
-        if not username in passfile.users():
-            return False
-        
-        return passfile.check_password(username, password)
+        """ returns a future resolving to whether the credentials are good """
+
+        return self.settings['authenticator'].authenticate(username, password)
     
     def auth_challenge(self):
         """ return the standard basic auth challenge """
@@ -77,6 +126,31 @@ class BaseHandler(RequestHandler):
         self.set_status(401)
         self.finish()
             
+    def get_tag_filters(self):
+        """ parse the tags, not_tags and any_tags query parameters, which may be combined """
+
+        tags = {'tags': [], 'not_tags': [], 'any_tags': []}
+
+        for tag_arg in ['tags', 'not_tags', 'any_tags']:
+            for value in self.get_arguments(tag_arg):
+                tags[tag_arg].extend([tag.strip() for tag in value.split(',') if tag.strip()])
+
+        return tags
+
+    def finish_encoded(self, body, etag):
+        """ finish with an already encoded json body, or a 304 if the client has it already """
+
+        self.set_header("Etag", etag)
+
+        if_none_match = self.request.headers.get("If-None-Match", "")
+        if (if_none_match.strip() == '*') or (etag in [item.strip() for item in if_none_match.split(',')]):
+            self.set_status(304)
+            self.finish()
+            return
+
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.finish(body)
+
     def write(self, chunk):
         """ if we get a dict, automatically change it to json and set the content-type """
 
@@ -89,16 +163,26 @@ class BaseHandler(RequestHandler):
     def write_error(self, status_code, **kwargs):
         """ return an exception as an error json dict """
 
-        if kwargs['exc_info'] and hasattr(kwargs['exc_info'][1], 'log_message'):
-            message = kwargs['exc_info'][1].log_message
+        exc_info = kwargs.get('exc_info')
+
+        if exc_info and hasattr(exc_info[1], 'log_message'):
+            message = exc_info[1].log_message
         else:
             # TODO: What should go here?
             message = ''
 
+        if exc_info and hasattr(exc_info[1], 'retry_after'):
+            self.set_header("Retry-After", str(exc_info[1].retry_after))
+
+        # codes newer than httplib, like 429, bring their own reason
+        reason = httplib.responses.get(status_code)
+        if reason is None and exc_info:
+            reason = getattr(exc_info[1], 'reason', None)
+
         self.write({
             'error': {
                 'code': status_code,
-                'type': httplib.responses[status_code],
+                'type': reason,
                 'message': message
             }
         })
@@ -110,16 +194,8 @@ class ScriptNamesCollectionHandler(BaseHandler):
     def get(self):
         """ get the requirements for all of the scripts """
 
-        tags = {'tags': [], 'not_tags': [], 'any_tags': []}
-
-        for tag_arg in ['tags', 'not_tags', 'any_tags']:
-            try:
-                tags[tag_arg] = self.get_arguments(tag_arg)[0].split(',')
-                break
-            except IndexError:
-                continue
-       
-        self.finish({'script_names': self.settings['scripts'].name(tags)})
+        body, etag = self.settings['scripts'].encoded('script_names', self.get_tag_filters())
+        self.finish_encoded(body, etag)
 
 
 @route(r"/scripts/?")
@@ -128,131 +204,314 @@ class ScriptCollectionHandler(BaseHandler):
     def get(self):
         """ get the requirements for all of the scripts """
        
-        tags = {'tags': [], 'not_tags': [], 'any_tags': []}
-
-        for tag_arg in ['tags', 'not_tags', 'any_tags']:
-            try:
-                tags[tag_arg] = self.get_arguments(tag_arg)[0].split(',')
-                break
-            except IndexError:
-                continue
-
-        self.finish({'scripts': self.settings['scripts'].metadata(tags)})
+        body, etag = self.settings['scripts'].encoded('scripts', self.get_tag_filters())
+        self.finish_encoded(body, etag)
 
 
 @route(r"/scripts/([\w\-]+)/?")
 class ScriptDetailsHandler(BaseHandler):
+
+    rate_limited = True
+
+    def initialize(self):
+        self.paused_readers = []
+        self.client_closed = False
+        self.abandoned = Future()
+        self.script = None
+        self.priority = None
+
+    def on_finish(self):
+        if self.script is not None:
+            metrics().requests.inc((self.script.name, str(self.get_status())))
+            metrics().request_seconds.observe((self.script.name,), self.request.request_time())
     
+    def limited_script(self):
+        return self.settings['scripts'].get(self.path_args[0])
+
     def options(self, script_name):
         """ get the requirements for this script """
         
         script = self.get_script(script_name, 'options')
         self.finish({'script': script.metadata()})
     
-    @asynchronous
-    @gen.engine
+    @gen.coroutine
     def get(self, script_name):
         """ run the script """
-        
-        if config['force_json']:
-            self.set_header("Content-Type", "application/json; charset=UTF-8")
+        yield self.run_script(script_name, 'get')
 
-        script = self.get_script(script_name, 'get')
-
-        if script.output == 'combined':
-            retcode, stdout = yield gen.Task(script.execute, self.params)
-            self.finish({
-                "stdout": stdout,
-                "return_values": self.find_return_values(stdout),
-                "retcode": retcode
-            })
-        else:
-            retcode, stdout, stderr = yield gen.Task(script.execute, self.params)
-            self.finish({
-                "stdout": stdout,
-                "stderr": stderr,
-                "return_values": self.find_return_values(stdout),
-                "retcode": retcode
-            })
-        
-    @asynchronous
-    @gen.engine
+    @gen.coroutine
     def delete(self, script_name):
         """ run the script """
-                
-        if config['force_json']:
-            self.set_header("Content-Type", "application/json; charset=UTF-8")
-
-        script = self.get_script(script_name, 'delete')
+        yield self.run_script(script_name, 'delete')
 
-        if script.output == 'combined':
-            retcode, stdout = yield gen.Task(script.execute, self.params)
-            self.finish({
-                "stdout": stdout,
-                "return_values": self.find_return_values(stdout),
-                "retcode": retcode
-            })
-        else:
-            retcode, stdout, stderr = yield gen.Task(script.execute, self.params)
-            self.finish({
-                "stdout": stdout,
-                "stderr": stderr,
-                "return_values": self.find_return_values(stdout),
-                "retcode": retcode
-            })
-        
-    @asynchronous
-    @gen.engine
+    @gen.coroutine
     def put(self, script_name):
         """ run the script """
-                
-        if config['force_json']:
-            self.set_header("Content-Type", "application/json; charset=UTF-8")
-
-        script = self.get_script(script_name, 'put')
+        yield self.run_script(script_name, 'put')
 
-        if script.output == 'combined':
-            retcode, stdout = yield gen.Task(script.execute, self.params)
-            self.finish({
-                "stdout": stdout,
-                "return_values": self.find_return_values(stdout),
-                "retcode": retcode,
-            })
-        else:
-            retcode, stdout, stderr = yield gen.Task(script.execute, self.params)
-            self.finish({
-                "stdout": stdout,
-                "stderr": stderr,
-                "return_values": self.find_return_values(stdout),
-                "retcode": retcode
-            })
-        
-    @asynchronous
-    @gen.engine
+    @gen.coroutine
     def post(self, script_name):
         """ run the script """
+        yield self.run_script(script_name, 'post')
+
+    @gen.coroutine
+    def run_script(self, script_name, http_method):
+        """ run the script, responding with all of its output, streaming it or as a background job """
                 
         if config['force_json']:
             self.set_header("Content-Type", "application/json; charset=UTF-8")
 
-        script = self.get_script(script_name, 'post')
+        script = self.script = self.get_script(script_name, http_method)
+        self.priority = self.get_priority([script])
+
+        if self.wants_async():
+            yield self.start_job(script)
+            return
+
+        stream_format = self.get_stream_format()
+        if stream_format is not None:
+            yield self.stream_script(script, stream_format)
+            return
+
+        try:
+            response = yield self.execute_script(script)
+        except TimedOut as e:
+            self.set_status(e.status_code)
+            self.finish(self.timed_out_result(script, e))
+            return
+
+        self.finish(self.script_result(script, response))
+
+    @gen.coroutine
+    def execute_script(self, script):
+        """ run the script, unless a retry with the same Idempotency-Key can replay an earlier result """
+
+        idempotency_key = self.request.headers.get("Idempotency-Key")
+        if idempotency_key is None:
+            response, cache_status = yield self.execute_cached(script, self.params)
+            self.set_cache_header(cache_status)
+            raise gen.Return(response)
+
+        replays = idempotency_cache()
+        key = replays.key(script, {'user': self.username, 'key': idempotency_key})
+        fingerprint = replays.key(script, script.create_env(self.params))[1]
+        response = replays.get(key)
+        replays.check(key, fingerprint)
+
+        if response is not None:
+            self.set_header("Idempotent-Replayed", "true")
+            raise gen.Return(response)
+
+        # a retry while the first request is still running waits for its result
+        replays.claims[key] = fingerprint
+        try:
+            response, cache_status = yield single_flight(replays.in_flight, key, functools.partial(self.execute_cached, script, self.params))
+        finally:
+            replays.claims.pop(key, None)
+
+        self.set_cache_header(cache_status)
+        replays.put(key, response, config['idempotency_ttl'], fingerprint)
+
+        raise gen.Return(response)
+
+    @gen.coroutine
+    def execute_cached(self, script, params):
+        """ run the script, answering from the result cache if the script allows it, a future for (response, HIT, MISS or None) """
+
+        if not script.cache_ttl:
+            response = yield script.execute(params, user=self.username, priority=self.priority, abandoned=self.abandoned)
+            raise gen.Return((response, None))
+
+        cache = result_cache()
+        key = cache.key(script, script.create_env(params))
+        response = cache.get(key)
+
+        if response is not None:
+            raise gen.Return((response, "HIT"))
+
+        response = yield script.execute(params, user=self.username, priority=self.priority, abandoned=self.abandoned)
+
+        # unless the script was reloaded while it ran, and this is the old one's result
+        if (response[0] == 0) and (self.settings['scripts'].get(script.name) is script):
+            cache.put(key, response, script.cache_ttl)
+
+        raise gen.Return((response, "MISS"))
+
+    def set_cache_header(self, cache_status):
+        if cache_status is not None:
+            self.set_header("X-Cache", cache_status)
+
+    def script_result(self, script, response):
+        """ build the response body for a finished script """
 
         if script.output == 'combined':
-            retcode, stdout = yield gen.Task(script.execute, self.params)
-            self.finish({
+            retcode, stdout = response
+            result = {
                 "stdout": stdout,
                 "return_values": self.find_return_values(stdout),
                 "retcode": retcode
-            })
+            }
         else:
-            retcode, stdout, stderr = yield gen.Task(script.execute, self.params)
-            self.finish({
+            retcode, stdout, stderr = response
+            result = {
                 "stdout": stdout,
                 "stderr": stderr,
                 "return_values": self.find_return_values(stdout),
                 "retcode": retcode
-            })
-        
+            }
+
+        # output too large to respond with is left on disk, with just its start and end here
+        truncated = {}
+        for stream in ['stdout', 'stderr']:
+            if getattr(result.get(stream), 'truncated', None):
+                truncated[stream] = result[stream].truncated
+
+        if truncated:
+            result['truncated'] = truncated
+
+        return result
+
+    def timed_out_result(self, script, e):
+        """ build the response body for a script that was killed, with the output it wrote first """
+
+        result = self.script_result(script, e.response)
+        result['timed_out'] = True
+        return result
+
+    def wants_async(self):
+        """ did the client ask for the script to be run as a background job """
+
+        if self.get_argument('async', None) in ['1', 'true']:
+            return True
+
+        prefer = self.request.headers.get('Prefer', '')
+        return 'respond-async' in [item.strip() for item in prefer.split(',')]
+
+    @gen.coroutine
+    def start_job(self, script):
+        """ run the script in the background, responding right away with the job id """
+
+        jobs = self.settings['jobs']
+        job = yield gen.Task(jobs.create, script.name)
+        if job is None:
+            raise HTTPError(500, "Unable to start a job for script '{0}'".format(script.name))
+
+        self.run_job(jobs, job, script, self.params)
+
+        self.set_status(202)
+        self.set_header("Location", "/jobs/{0}".format(job.id))
+        self.finish({'job': job.status()})
+
+    @gen.coroutine
+    def run_job(self, jobs, job, script, params):
+        try:
+            response = yield script.execute(params, user=self.username, priority=self.priority)
+            jobs.finish(job, 'finished', self.script_result(script, response))
+        except TimedOut as e:
+            jobs.finish(job, 'timed_out', self.timed_out_result(script, e))
+        except Exception as e:
+            log.exception("Job {0} for script {1} failed".format(job.id, script.name))
+            jobs.finish(job, 'failed', {'error': str(e)})
+
+    def get_priority(self, scripts):
+        """ the priority asked for with the X-Priority header, if any, otherwise the scripts' own are used.
+            only --priority-users may ask for more urgency than a script has """
+
+        priority = self.request.headers.get('X-Priority')
+        if priority is None:
+            return None
+
+        if priority not in PRIORITIES:
+            raise HTTPError(400, "X-Priority should be one of: {0}".format(", ".join(PRIORITIES)))
+
+        if self.username in config['priority_users']:
+            return priority
+
+        for script in scripts:
+            if PRIORITIES.index(priority) < PRIORITIES.index(script.priority):
+                raise HTTPError(403, "Script '{0}' may not be run at more than {1} priority".format(script.name, script.priority))
+
+        return priority
+
+    def get_stream_format(self):
+        """ the streaming format requested by the ?stream= flag or the Accept header, if any """
+
+        stream = self.get_argument('stream', None)
+        if stream in STREAM_FORMATS:
+            return stream
+        if stream in ['1', 'true']:
+            return 'ndjson'
+
+        accept = self.request.headers.get('Accept', '')
+        for stream_format, content_type in STREAM_FORMATS.items():
+            if content_type in accept:
+                return stream_format
+
+        return None
+
+    @gen.coroutine
+    def stream_script(self, script, stream_format):
+        """ send output lines to the client as they arrive, ending with the retcode """
+
+        self.stream_format = stream_format
+        self.return_values = ReturnValues(config['max_return_bytes'])
+
+        self.set_header("Content-Type", "{0}; charset=UTF-8".format(STREAM_FORMATS[stream_format]))
+        self.set_header("Cache-Control", "no-cache")
+
+        timed_out = False
+        try:
+            retcode = yield script.execute(self.params, on_lines=self.write_lines, user=self.username, priority=self.priority,
+                                           abandoned=self.abandoned)
+        except TimedOut as e:
+            retcode = e.retcode
+            timed_out = True
+
+        if self.client_closed:
+            return
+
+        self.write_frame('exit', {
+            "return_values": self.return_values,
+            "retcode": retcode,
+            "timed_out": timed_out
+        })
+        self.finish()
+
+    def write_lines(self, stream, lines, resume):
+        """ write a batch of output lines, resuming the reader once the client has them """
+
+        if self.client_closed:
+            resume()
+            return
+
+        if stream == 'stdout':
+            self.return_values.scan(lines)
+
+        for line in lines:
+            self.write_frame(stream, {"stream": stream, "line": line})
+
+        self.paused_readers.append(resume)
+        self.flush(callback=self.resume_readers)
+
+    def resume_readers(self):
+        paused, self.paused_readers = self.paused_readers, []
+        for resume in paused:
+            resume()
+
+    def write_frame(self, event, data):
+        if self.stream_format == 'sse':
+            self.write("event: {0}\ndata: {1}\n\n".format(event, json.dumps(data)))
+        else:
+            self.write(json.dumps(data) + "\n")
+
+    def on_connection_close(self):
+        # keep draining the child's output, nobody is waiting on a flush anymore
+        self.client_closed = True
+        self.resume_readers()
+
+        # and give up on anything still waiting to start
+        self.abandoned.set_result(None)
+
     def get_script(self, script_name, http_method):
         script = self.settings['scripts'].get(script_name, None)
         
@@ -268,22 +527,275 @@ class ScriptDetailsHandler(BaseHandler):
         return script
 
     def find_return_values(self, output):
-        """ parse output array for return values """
+        """ the return values already picked out of the output while it was read """
+
+        if output.return_values is None:
+            return {}
+
+        return dict(output.return_values)
+
+
+@route(r"/batch/?")
+class BatchHandler(ScriptDetailsHandler):
+
+    SUPPORTED_METHODS = ("POST",)
+
+    def limited_script(self):
+        # a batch counts once against the server and client limits, its items against their scripts' in post
+        return None
+
+    @gen.coroutine
+    def post(self):
+        """ run many scripts, a few at a time, each after the items it depends on """
+
+        if config['force_json']:
+            self.set_header("Content-Type", "application/json; charset=UTF-8")
+
+        batch = Batch(self.settings['scripts'], self.params, config['batch_concurrency'], config['batch_max_items'])
+        self.priority = self.get_priority([item['script'] for item in batch.items.values()])
+
+        # every item counts against its script's rate_limit, and none run unless all of them can
+        rate_limiter().check_scripts([item['script'] for item in batch.items.values()])
+
+        self.stream_format = self.get_stream_format()
+        if self.stream_format is None:
+            results = yield batch.run(self.run_item, lambda item, result: None)
+            self.finish(results)
+            return
+
+        self.set_header("Content-Type", "{0}; charset=UTF-8".format(STREAM_FORMATS[self.stream_format]))
+        self.set_header("Cache-Control", "no-cache")
+        results = yield batch.run(self.run_item, self.write_result)
+        self.finish_stream(results)
+
+    @gen.coroutine
+    def run_item(self, item):
+        """ run one item of the batch, a future for its result however it went """
+
+        script = item['script']
+
+        try:
+            response, cache_status = yield self.execute_cached(script, item['params'])
+        except TimedOut as e:
+            result = self.timed_out_result(script, e)
+            result['status'] = 'timed_out'
+        except HTTPError as e:
+            result = {"status": "failed", "error": {"code": e.status_code, "message": e.log_message}}
+        except Exception as e:
+            log.exception("Batch item {0} running script {1} failed".format(item['id'], script.name))
+            result = {"status": "failed", "error": {"code": 500, "message": str(e)}}
+        else:
+            result = self.script_result(script, response)
+            result['status'] = 'finished'
+            if cache_status is not None:
+                result['cache'] = cache_status
+
+        raise gen.Return(result)
+
+    def write_result(self, item, result):
+        if not self.client_closed:
+            self.write_frame('result', result)
+            self.flush()
+
+    def finish_stream(self, results):
+        if self.client_closed:
+            return
+
+        self.write_frame('exit', {"status": results['status']})
+        self.finish()
+
+
+@route(r"/jobs/(\w+)/?")
+class JobHandler(BaseHandler):
+
+    @gen.coroutine
+    def get(self, job_id):
+        """ get the status of a background job """
+
+        job = yield get_job(self.settings['jobs'], job_id)
+        self.finish({'job': job.status()})
+
+
+@route(r"/jobs/(\w+)/result/?")
+class JobResultHandler(BaseHandler):
 
-        return_values = {}
-        for line in output:
-            if line.startswith('jojo_return_value'):
-                temp = line.replace("jojo_return_value","").strip()
-                key, value = [item.strip() for item in temp.split('=')]
-                return_values[key] = value
+    @gen.coroutine
+    def get(self, job_id):
+        """ get the result of a background job, once it is done """
 
-        return return_values
+        jobs = self.settings['jobs']
+        job = yield get_job(jobs, job_id)
+
+        if job.state == 'running':
+            self.set_status(202)
+            self.finish({'job': job.status()})
+            return
+
+        result = yield gen.Task(jobs.load_result, job)
+        self.finish(result)
+
+
+@gen.coroutine
+def get_job(jobs, job_id):
+    job = yield gen.Task(jobs.get, job_id)
+
+    if job is None:
+        raise HTTPError(404, "Job with id '{0}' not found".format(job_id))
+
+    raise gen.Return(job)
+
+
+@route(r"/output/(\w+)/(stdout|stderr)/?")
+class OutputHandler(BaseHandler):
+
+    def initialize(self):
+        self.client_closed = False
+        self.flushed = None
+
+    @gen.coroutine
+    def get(self, output_id, stream):
+        """ get spilled script output, supporting a single byte range """
+
+        path = spill_store().find(output_id, stream)
+        if path is None:
+            raise HTTPError(404, "Output with id '{0}' not found".format(output_id))
+
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = self.get_range(size)
+
+            self.set_header("Content-Type", "text/plain; charset=UTF-8")
+            self.set_header("Accept-Ranges", "bytes")
+            self.set_header("Content-Length", str(end - start))
+
+            if end == start:
+                self.finish()
+                return
+
+            # page the file in through mmap, a chunk at a time as the client takes it
+            contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            for offset in range(start, end, OUTPUT_CHUNK):
+                if self.client_closed:
+                    return
+                self.write(contents[offset:min(offset + OUTPUT_CHUNK, end)])
+                yield gen.Task(self.wait_for_flush)
+        finally:
+            contents.close()
+
+        self.finish()
+
+    def wait_for_flush(self, callback):
+        # a flush never finishes once the client has gone, on_connection_close resumes us instead
+        self.flushed = callback
+        self.flush(callback=self.resume)
+
+    def resume(self):
+        callback, self.flushed = self.flushed, None
+        if callback is not None:
+            callback()
+
+    def on_connection_close(self):
+        self.client_closed = True
+        self.resume()
+
+    def get_range(self, size):
+        """ the (start, end) bytes to send, from the Range header if there is one """
+
+        header = self.request.headers.get("Range")
+        if header is None:
+            return 0, size
+
+        match = re.match(r'^bytes=(\d*)-(\d*)$', header.strip())
+        if match is None or match.groups() == ('', ''):
+            raise HTTPError(416, "Only a single byte range is supported")
+
+        first, last = match.groups()
+        if first == '':
+            start, end = max(size - int(last), 0), size
+        else:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+
+        if start >= end:
+            raise HTTPError(416, "Range not satisfiable, the output is {0} bytes".format(size))
+
+        self.set_status(206)
+        self.set_header("Content-Range", "bytes {0}-{1}/{2}".format(start, end - 1, size))
+        return start, end
+
+
+@route(r"/cache/?")
+class CacheHandler(BaseHandler):
+
+    def delete(self):
+        """ purge every cached script result """
+
+        self.finish({"status": "ok", "purged": result_cache().purge()})
+
+
+@route(r"/cache/([\w\-]+)/?")
+class ScriptCacheHandler(BaseHandler):
+
+    def delete(self, script_name):
+        """ purge the cached results of one script """
+
+        self.finish({"status": "ok", "purged": result_cache().purge(script_name)})
+
+
+@route(r"/metrics/?")
+class MetricsHandler(BaseHandler):
+
+    def get(self):
+        """ counters and histograms for the server, across its workers, in the prometheus text format """
+
+        self.set_header("Content-Type", CONTENT_TYPE)
+        self.finish(exposition())
+
+
+@route(r"/locks/?")
+class LocksHandler(BaseHandler):
+
+    def get(self):
+        """ who holds each script lock, for how long, and who is waiting for it """
+
+        self.finish({"locks": locks().status()})
+
+
+@route(r"/queue/?")
+class QueueHandler(BaseHandler):
+
+    def get(self):
+        """ how many scripts are running and who is waiting, server wide and for scripts with a max_concurrency """
+
+        slots = [scheduler().children] + [script.slots for script in self.settings['scripts'].values() if script.slots is not None]
+        self.finish({"queues": [queue.status() for queue in slots]})
 
 
 @route(r"/reload/?")
 class ReloadHandler(BaseHandler):
     
+    @asynchronous
     def post(self):
-        """ reload the scripts from the script directory """
-        self.settings['scripts'] = create_collection(config['directory'])
-        self.finish({"status": "ok"})
+        """ reload the changed scripts from the script directory """
+
+        # the supervisor passes this on to every worker, including us
+        if config['workers'] > 1:
+            os.kill(os.getppid(), signal.SIGHUP)
+            self.finish({"status": "ok"})
+            return
+
+        self.settings['reloader'].reload(self.reloaded)
+
+    def reloaded(self, changes):
+        if changes is None:
+            self.send_error(500)
+            return
+
+        self.finish({
+            "status": "ok",
+            "added": changes['added'],
+            "modified": changes['modified'],
+            "removed": changes['removed']
+        })
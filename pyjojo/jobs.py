@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+import errno
+import json
+import logging
+import os
+import os.path
+import time
+import uuid
+from collections import OrderedDict
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from pyjojo.config import config
+from pyjojo.locks import running
+from pyjojo.pool import executor
+
+log = logging.getLogger(__name__)
+
+# seconds between sweeps for the old jobs of workers that have gone
+SWEEP_INTERVAL = 60.0
+
+
+class Job(object):
+    """ a script run in the background """
+
+    def __init__(self, script_name, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.script_name = script_name
+        self.state = 'running'
+        self.created = time.time()
+        self.finished = None
+        self.retcode = None
+        self.result = None
+        self.pid = os.getpid()
+
+    def status(self):
+        return {
+            "id": self.id,
+            "script": self.script_name,
+            "status": self.state,
+            "created": self.created,
+            "finished": self.finished,
+            "retcode": self.retcode
+        }
+
+    def record(self):
+        """ the status, along with the process running the job, to keep on disk """
+
+        record = self.status()
+        record['pid'] = self.pid
+        return record
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(record['script'], record['id'])
+        job.state = record['status']
+        job.created = record['created']
+        job.finished = record['finished']
+        job.retcode = record['retcode']
+        job.pid = record['pid']
+        return job
+
+
+class JobTable(object):
+    """ bounded, in memory table of jobs, finished jobs are evicted by age and count """
+
+    def __init__(self, max_age, max_jobs):
+        self.max_age = max_age
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.done = OrderedDict()
+
+    def create(self, script_name, callback):
+        """ start a job, callback(job) once anyone asking after it can find it """
+
+        self.evict()
+        job = Job(script_name)
+        self.jobs[job.id] = job
+        callback(job)
+
+    def get(self, job_id, callback):
+        """ callback(job), or callback(None) if there's no such job """
+
+        self.evict()
+        callback(self.jobs.get(job_id))
+
+    def finish(self, job, state, result):
+        """ record the outcome of a job """
+
+        job.state = state
+        job.finished = time.time()
+        job.retcode = result.get('retcode')
+        self.done[job.id] = job
+        self.store_result(job, result)
+        self.evict()
+
+    def store_result(self, job, result):
+        job.result = result
+
+    def load_result(self, job, callback):
+        callback(job.result)
+
+    def remove(self, job):
+        del self.jobs[job.id]
+        del self.done[job.id]
+
+    def evict(self):
+        """ drop finished jobs that are too old, or too many """
+
+        cutoff = time.time() - self.max_age
+
+        while self.done:
+            job = next(iter(self.done.values()))
+            if (job.finished > cutoff) and (len(self.done) <= self.max_jobs):
+                break
+            log.debug("Evicting job {0}".format(job.id))
+            self.remove(job)
+
+
+class DiskJobTable(JobTable):
+    """
+    job table that keeps jobs in a directory, so every worker process can answer
+    for them, and finished results on disk instead of in memory
+
+    each job has a JOB_ID.job file with its status, written when it starts and
+    again when it finishes, after its result is in JOB_ID.json.  workers evict
+    their own jobs, and sweep up after workers that died.
+    """
+
+    def __init__(self, directory, max_age, max_jobs, io_loop=None):
+        JobTable.__init__(self, max_age, max_jobs)
+        self.directory = directory
+        self.io_loop = io_loop or IOLoop.instance()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.sweeper = PeriodicCallback(self.sweep, SWEEP_INTERVAL * 1000, io_loop=self.io_loop)
+        self.sweeper.start()
+
+    def path(self, job_id, extension='json'):
+        return os.path.join(self.directory, "{0}.{1}".format(job_id, extension))
+
+    def create(self, script_name, callback):
+        self.evict()
+        job = Job(script_name)
+        self.jobs[job.id] = job
+
+        # only answer once the other workers can find the job too
+        future = executor().submit(self.write_record, job.record())
+        self.io_loop.add_future(future, lambda future: callback(job) if self.written(job, future) else callback(None))
+
+    def get(self, job_id, callback):
+        self.evict()
+
+        # our own jobs are up to date in memory
+        job = self.jobs.get(job_id)
+        if job is not None:
+            callback(job)
+            return
+
+        future = executor().submit(self.read_job, job_id)
+        self.io_loop.add_future(future, lambda future: callback(future.result()))
+
+    def store_result(self, job, result):
+        # keep the result in memory until it is safely on disk
+        job.result = result
+        future = executor().submit(self.write_finished, job.record(), result)
+        self.io_loop.add_future(future, lambda future: self.result_written(job, future))
+
+    def write_finished(self, record, result):
+        with open(self.path(record['id']), 'w') as f:
+            json.dump(result, f)
+        self.write_record(record)
+
+    def write_record(self, record):
+        # written to the side, then renamed into place, so readers never see half of it
+        path = self.path(record['id'], 'job')
+        temp_path = "{0}.{1}".format(path, os.getpid())
+        with open(temp_path, 'w') as f:
+            json.dump(record, f)
+        os.rename(temp_path, path)
+
+    def written(self, job, future):
+        if future.exception() is not None:
+            log.error("Unable to store job {0}: {1}".format(job.id, future.exception()))
+            return False
+        return True
+
+    def result_written(self, job, future):
+        if not self.written(job, future):
+            return
+
+        if job.id in self.jobs:
+            job.result = None
+        else:
+            executor().submit(self.delete_job, job.id)
+
+    def read_job(self, job_id):
+        """ a job from the directory, which may have been started by another worker """
+
+        try:
+            with open(self.path(job_id, 'job')) as f:
+                job = Job.from_record(json.load(f))
+        except (IOError, ValueError):
+            return None
+
+        # the worker running it died, it'll never finish
+        if (job.state == 'running') and not running(job.pid):
+            job.state = 'failed'
+            job.result = {'error': "The worker running the job exited"}
+
+        return job
+
+    def load_result(self, job, callback):
+        if job.result is not None:
+            callback(job.result)
+            return
+
+        future = executor().submit(self.read_result, job)
+        self.io_loop.add_future(future, lambda future: callback(future.result()))
+
+    def read_result(self, job):
+        with open(self.path(job.id)) as f:
+            return json.load(f)
+
+    def remove(self, job):
+        JobTable.remove(self, job)
+        if job.result is None:
+            executor().submit(self.delete_job, job.id)
+
+    def delete_job(self, job_id):
+        for extension in ['json', 'job']:
+            try:
+                os.remove(self.path(job_id, extension))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    log.error("Unable to remove job {0}: {1}".format(job_id, e))
+
+    def sweep(self):
+        """ clear out the old jobs of workers that are gone, which nobody else will evict """
+
+        executor().submit(self.sweep_directory, set(self.jobs), time.time() - self.max_age)
+
+    def sweep_directory(self, ours, cutoff):
+        for filename in os.listdir(self.directory):
+            job_id, extension = os.path.splitext(filename)
+            if (extension != '.job') or (job_id in ours):
+                continue
+
+            job = self.read_job(job_id)
+            if job is None:
+                continue
+
+            # a worker that's still around evicts its own
+            if running(job.pid) and (job.pid != os.getpid()):
+                continue
+
+            if (job.finished or job.created) < cutoff:
+                log.debug("Sweeping job {0}".format(job_id))
+                self.delete_job(job_id)
+
+
+def create_job_table():
+    """ create the job table, on disk if a job directory is configured """
+
+    if config['job_dir'] is not None:
+        log.info("Storing jobs in {0}".format(config['job_dir']))
+        return DiskJobTable(config['job_dir'], config['job_max_age'], config['job_max_count'])
+
+    return JobTable(config['job_max_age'], config['job_max_count'])
@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+
+import errno
+import fcntl
+import functools
+import json
+import logging
+import os
+import os.path
+import socket
+import time
+from collections import deque
+
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.web import HTTPError
+
+from pyjojo.config import config
+from pyjojo.scheduler import Abandoned
+
+log = logging.getLogger(__name__)
+
+MIN_POLL = 0.01
+MAX_POLL = 0.1
+
+# a place in a lock file's queue that hasn't been touched for this long belongs to a dead process
+STALE_TICKET = 10.0
+
+HOSTNAME = socket.gethostname()
+
+
+class LockTimeout(HTTPError):
+    """ waited too long for a script's lock, try again later """
+
+    def __init__(self, name, timeout):
+        HTTPError.__init__(self, 503, "Timed out after {0} seconds waiting for the lock on '{1}'".format(timeout, name))
+        self.retry_after = max(1, int(timeout))
+
+
+class Waiter(object):
+    """ someone waiting for, or holding, a lock """
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.future = Future()
+        self.queued = time.time()
+        self.since = None
+        self.timeout = None
+        self.ticket = None
+
+    def status(self):
+        now = time.time()
+        status = {
+            "host": HOSTNAME,
+            "pid": os.getpid(),
+            "waited_seconds": (self.since or now) - self.queued
+        }
+
+        if self.owner is not None:
+            status['owner'] = self.owner
+
+        if self.since is not None:
+            status['since'] = self.since
+            status['held_seconds'] = now - self.since
+
+        return status
+
+
+class LocalLock(object):
+    """
+    a lock inside this process, handed to waiters in the order they asked for it
+
+    on_idle(lock) is called whenever the last holder or waiter is done with it
+    """
+
+    def __init__(self, name, key=None, on_idle=None, io_loop=None):
+        self.name = name
+        self.key = key
+        self.on_idle = on_idle
+        self.io_loop = io_loop or IOLoop.instance()
+        self.holder = None
+        self.waiters = deque()
+        self.taking = None
+
+    def acquire(self, owner=None, timeout=None, abandoned=None):
+        """
+        a future that resolves once we hold the lock, or fails with LockTimeout after
+        timeout seconds, or with Abandoned if the abandoned future resolves first
+        """
+
+        waiter = Waiter(owner)
+        if timeout:
+            waiter.timeout = self.io_loop.add_timeout(time.time() + timeout, functools.partial(self.expire, waiter, timeout))
+
+        self.waiters.append(waiter)
+        self.join_queue(waiter)
+        self.grant()
+
+        if abandoned is not None:
+            abandoned.add_done_callback(lambda future: self.abandon(waiter))
+
+        return waiter.future
+
+    def release(self):
+        self.holder = None
+        self.grant()
+        self.check_idle()
+
+    def idle(self):
+        """ nobody holds the lock or is waiting for it """
+
+        return (self.holder is None) and not self.waiters
+
+    def check_idle(self):
+        if self.idle() and (self.on_idle is not None):
+            self.on_idle(self)
+
+    def close(self):
+        pass
+
+    def grant(self):
+        # the first in line stays there until the lock is really theirs, so nobody can jump ahead
+        if (self.holder is not None) or (self.taking is not None) or not self.waiters:
+            return
+
+        self.taking = self.waiters[0]
+        self.take(self.taking)
+
+    def join_queue(self, waiter):
+        pass
+
+    def leave_queue(self, waiter):
+        pass
+
+    def take(self, waiter):
+        """ get hold of the lock for the first waiter, calling granted(waiter) once we have it """
+
+        self.granted(waiter)
+
+    def cancel_take(self, waiter):
+        """ stop trying to get hold of the lock for a waiter that gave up """
+
+        pass
+
+    def granted(self, waiter):
+        self.taking = None
+        self.waiters.popleft()
+        self.leave_queue(waiter)
+        if waiter.timeout is not None:
+            self.io_loop.remove_timeout(waiter.timeout)
+
+        waiter.since = time.time()
+        self.holder = waiter
+        waiter.future.set_result(None)
+
+    def expire(self, waiter, timeout):
+        log.warn("Timed out waiting for the lock on {0}".format(self.name))
+        self.give_up(waiter, LockTimeout(self.name, timeout))
+
+    def abandon(self, waiter):
+        # the client went away, unless the lock is already theirs
+        if waiter not in self.waiters:
+            return
+
+        log.info("Client went away waiting for the lock on {0}".format(self.name))
+        self.give_up(waiter, Abandoned(self.name))
+
+    def give_up(self, waiter, error):
+        self.waiters.remove(waiter)
+        self.leave_queue(waiter)
+        if waiter.timeout is not None:
+            self.io_loop.remove_timeout(waiter.timeout)
+        if self.taking is waiter:
+            self.taking = None
+            self.cancel_take(waiter)
+
+        waiter.future.set_exception(error)
+        self.grant()
+        self.check_idle()
+
+    def status(self):
+        status = {
+            "name": self.name,
+            "holder": self.holder.status() if self.holder is not None else None,
+            "waiting": [waiter.status() for waiter in self.waiters]
+        }
+
+        if self.key is not None:
+            status['key'] = self.key
+
+        return status
+
+
+class FileLock(LocalLock):
+    """
+    a lock shared with every process, on any host, using the same lock directory
+
+    the lock itself is an fcntl() lock on NAME.lock, which the kernel drops if the
+    process holding it dies, and which works over NFS.  fcntl() can't tell us when
+    the lock is free without blocking, so waiting is done by polling with a backoff
+    from the IOLoop.  polling alone would let whoever happens to look at the right
+    time jump the queue, so waiters also take a ticket in the NAME.queue directory,
+    and only the oldest live ticket tries for the lock.
+
+    fcntl() locks belong to the process rather than the file descriptor, and closing
+    any descriptor for the file drops them, so there must only be one FileLock for
+    each name in a process, see Locks.get().
+    """
+
+    def __init__(self, name, directory, key=None, on_idle=None, io_loop=None):
+        LocalLock.__init__(self, name, key, on_idle, io_loop)
+        self.path = os.path.join(directory, "{0}.lock".format(name))
+        self.holder_path = os.path.join(directory, "{0}.holder".format(name))
+        self.queue_path = os.path.join(directory, "{0}.queue".format(name))
+        self.fd = None
+        self.poll = None
+        self.tickets = 0
+
+    def join_queue(self, waiter):
+        waiter.ticket = self.enqueue()
+
+    def leave_queue(self, waiter):
+        self.dequeue(waiter.ticket)
+
+    def take(self, waiter):
+        self.try_lock(waiter, MIN_POLL)
+
+    def try_lock(self, waiter, poll):
+        self.poll = None
+
+        tickets = self.live_tickets()
+        if waiter.ticket not in tickets:
+            # given up on by another process, after we went quiet for too long
+            log.warn("Lost our place in the queue for the lock on {0}".format(self.name))
+            waiter.ticket = self.enqueue()
+            tickets = self.live_tickets()
+
+        # our own waiters are already in order, it's the other processes we mustn't jump ahead of
+        ahead = [ticket for ticket in tickets if (ticket < waiter.ticket) and not self.owns(ticket)]
+        if (not ahead) and self.lock_file():
+            self.granted(waiter)
+            self.write_holder(waiter)
+            return
+
+        self.poll = self.io_loop.add_timeout(time.time() + poll, functools.partial(self.try_lock, waiter, min(poll * 2, MAX_POLL)))
+
+    def cancel_take(self, waiter):
+        if self.poll is not None:
+            self.io_loop.remove_timeout(self.poll)
+            self.poll = None
+
+    def refresh(self):
+        """ show the other processes our waiters are still there """
+
+        for waiter in self.waiters:
+            try:
+                os.utime(os.path.join(self.queue_path, waiter.ticket), None)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def release(self):
+        remove(self.holder_path)
+
+        # the last one out cleans up, so keyed locks don't leave files behind for every key
+        if (not self.waiters) and (not self.live_tickets()):
+            remove(self.path)
+            remove_directory(self.queue_path)
+
+        fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        LocalLock.release(self)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+        remove_directory(self.queue_path)
+
+    def lock_file(self):
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return False
+
+        # the file may have been cleaned up since we opened it, then we hold a lock nobody else can see
+        opened = os.fstat(self.fd)
+        try:
+            current = os.stat(self.path)
+        except OSError:
+            current = None
+
+        if (current is None) or ((current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino)):
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+            self.close()
+            return self.lock_file()
+
+        return True
+
+    def enqueue(self):
+        """ take a ticket, named so they sort in the order they were taken """
+
+        self.tickets += 1
+        ticket = "{0:.6f}_{1}_{2}_{3}".format(time.time(), os.getpid(), self.tickets, HOSTNAME)
+
+        # the queue directory goes away whenever the lock is idle, maybe while we're here
+        while True:
+            try:
+                os.makedirs(self.queue_path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+            try:
+                open(os.path.join(self.queue_path, ticket), 'w').close()
+                return ticket
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def dequeue(self, ticket):
+        remove(os.path.join(self.queue_path, ticket))
+
+    def owns(self, ticket):
+        queued, pid, count, host = ticket.split('_', 3)
+        return (host == HOSTNAME) and (int(pid) == os.getpid())
+
+    def live_tickets(self):
+        """ the tickets in the queue in order, clearing out any left behind by dead processes """
+
+        try:
+            tickets = sorted(os.listdir(self.queue_path))
+        except OSError:
+            return []
+
+        live = []
+        for ticket in tickets:
+            path = os.path.join(self.queue_path, ticket)
+            if stale_ticket(ticket, path):
+                log.info("Removing stale ticket {0} for the lock on {1}".format(ticket, self.name))
+                remove(path)
+            else:
+                live.append(ticket)
+
+        return live
+
+    def write_holder(self, waiter):
+        # written to the side, then renamed into place, so readers never see half of it
+        temp_path = "{0}.{1}".format(self.holder_path, os.getpid())
+        status = waiter.status()
+        if self.key is not None:
+            status['key'] = self.key
+
+        with open(temp_path, 'w') as f:
+            json.dump(status, f)
+        os.rename(temp_path, self.holder_path)
+
+    def status(self):
+        """ who holds the lock and who is waiting, across every process sharing the lock directory """
+
+        holder = None
+        try:
+            with open(self.holder_path) as f:
+                holder = json.load(f)
+        except (IOError, ValueError):
+            pass
+
+        # left behind by a process that died holding the lock, which the kernel has dropped
+        if (holder is not None) and (holder.get('host') == HOSTNAME) and not running(holder.get('pid')):
+            holder = None
+
+        key = self.key
+        if holder is not None:
+            holder['held_seconds'] = time.time() - holder['since']
+            key = holder.pop('key', key)
+
+        waiting = []
+        for ticket in self.live_tickets():
+            queued, pid, count, host = ticket.split('_', 3)
+            waiting.append({"host": host, "pid": int(pid), "waited_seconds": time.time() - float(queued)})
+
+        status = {
+            "name": self.name,
+            "holder": holder,
+            "waiting": waiting
+        }
+
+        if key is not None:
+            status['key'] = key
+
+        return status
+
+
+def stale_ticket(ticket, path):
+    try:
+        queued, pid, count, host = ticket.split('_', 3)
+        pid = int(pid)
+    except ValueError:
+        return True
+
+    # we can only check on our own host's processes, the others have to keep their tickets fresh
+    if host == HOSTNAME:
+        return not running(pid)
+
+    try:
+        return os.path.getmtime(path) < time.time() - STALE_TICKET
+    except OSError:
+        return True
+
+
+def running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        if e.errno == errno.ESRCH:
+            return False
+    return True
+
+
+def remove(path):
+    try:
+        os.unlink(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def remove_directory(path):
+    """ remove a directory, unless someone has just put something in it """
+
+    try:
+        os.rmdir(path)
+    except OSError as e:
+        if e.errno not in (errno.ENOENT, errno.ENOTEMPTY, errno.EEXIST):
+            raise
+
+
+class Locks(object):
+    """ every lock in this process, by name, from the configured backend """
+
+    def __init__(self, backend, directory):
+        self.backend = backend
+        self.directory = directory
+        self.locks = {}
+
+        if backend == 'file':
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            self.heartbeat = PeriodicCallback(self.refresh, 1000 * STALE_TICKET / 4)
+            self.heartbeat.start()
+
+    def get(self, name, key=None):
+        """ the lock with this name, created when it's first needed and dropped once nobody is using it """
+
+        lock = self.locks.get(name)
+
+        if lock is None:
+            lock = self.locks[name] = self.create(name, key, self.discard)
+
+        return lock
+
+    def create(self, name, key=None, on_idle=None):
+        if self.backend == 'file':
+            return FileLock(name, self.directory, key, on_idle)
+        else:
+            return LocalLock(name, key, on_idle)
+
+    def discard(self, lock):
+        if self.locks.get(lock.name) is lock:
+            del self.locks[lock.name]
+        lock.close()
+
+    def refresh(self):
+        for lock in self.locks.values():
+            if lock.waiters:
+                lock.refresh()
+
+    def status(self):
+        names = set(self.locks)
+
+        # the locks other processes are using, which we may never have touched
+        if self.backend == 'file':
+            for filename in os.listdir(self.directory):
+                name, extension = os.path.splitext(filename)
+                if extension in ('.holder', '.queue'):
+                    names.add(name)
+
+        statuses = []
+        for name in sorted(names):
+            lock = self.locks.get(name) or self.create(name)
+            statuses.append(lock.status())
+
+        return statuses
+
+
+_locks = None
+
+
+def locks():
+    """ the locks for this process """
+
+    global _locks
+
+    if _locks is None:
+        backend = config['lock_backend'] or ('file' if config['lock_dir'] is not None else 'local')
+        _locks = Locks(backend, config['lock_dir'])
+
+    return _locks
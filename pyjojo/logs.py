@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+import json
+import logging
+import os
+import Queue
+import random
+import sys
+import threading
+import time
+
+from tornado.ioloop import IOLoop
+
+from pyjojo.config import config
+from pyjojo.metrics import metrics
+
+# records of scripts run, one per execution
+execution_log = logging.getLogger('pyjojo.execution')
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(filename)s:%(lineno)d] %(message)s"
+
+# seconds to wait for queued records to be written on the way out
+CLOSE_TIMEOUT = 5.0
+
+
+class LogQueue(logging.Handler):
+    """
+    hands records to a background thread that writes them, so a slow stdout
+    never holds up the IOLoop
+
+    the queue is bounded, past which records are dropped and counted rather than
+    waited on.  the thread doesn't survive a fork, so each worker starts its own
+    on the first record it logs.
+    """
+
+    def __init__(self, target, max_size):
+        logging.Handler.__init__(self)
+        self.target = target
+        self.max_size = max_size
+        self.drop_lock = None
+        self.dropped = {}
+        self.pid = None
+        self.queue = None
+        self.thread = None
+
+    def start(self):
+        # anything the parent had queued, or locked, at the fork is left behind with it
+        self.pid = os.getpid()
+        self.drop_lock = threading.Lock()
+        self.dropped = {}
+        self.queue = Queue.Queue(self.max_size)
+        self.thread = threading.Thread(target=self.write_records, name="pyjojo-log")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.start()
+
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Queue.Full:
+            # records come from any thread, but the metrics are only touched from the IOLoop
+            with self.drop_lock:
+                first = not self.dropped
+                self.dropped[record.name] = self.dropped.get(record.name, 0) + 1
+
+            if first:
+                IOLoop.instance().add_callback(self.count_dropped)
+
+    def count_dropped(self):
+        """ add the records dropped since the last time to the metrics, on the IOLoop """
+
+        with self.drop_lock:
+            dropped, self.dropped = self.dropped, {}
+
+        for name, count in dropped.items():
+            metrics().log_dropped.inc((name,), count)
+
+    def prepare(self, record):
+        """ format the message and traceback now, while the args and frames are still as they were """
+
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def write_records(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            self.target.handle(record)
+
+    def close(self):
+        """ write out what's queued, as long as it doesn't take too long """
+
+        if (self.pid == os.getpid()) and self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=CLOSE_TIMEOUT)
+                self.thread.join(CLOSE_TIMEOUT)
+            except Queue.Full:
+                pass
+
+        self.target.close()
+        logging.Handler.close(self)
+
+
+class TextFormatter(logging.Formatter):
+    """ the usual log lines, with the fields of structured records on the end as json """
+
+    def __init__(self):
+        logging.Formatter.__init__(self, TEXT_FORMAT)
+
+    def format(self, record):
+        line = logging.Formatter.format(self, record)
+
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += " " + json.dumps(fields, default=str, sort_keys=True)
+
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """ a json object per line, with the fields of structured records at the top level """
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "file": "{0}:{1}".format(record.filename, record.lineno),
+            "pid": record.process
+        }
+
+        entry.update(getattr(record, 'fields', None) or {})
+
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+
+        return json.dumps(entry, default=str, sort_keys=True)
+
+
+def create_handler(log_format, max_queue, stream=None):
+    """ the queue in front of a stream handler writing to stdout """
+
+    target = logging.StreamHandler(stream or sys.stdout)
+    target.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+
+    if not max_queue:
+        return target
+
+    return LogQueue(target, max_queue)
+
+
+def log_execution(script, user, params, started, retcode, status, priority=None, error=None):
+    """
+    log a record of a script being run, with its filtered params
+
+    runs that succeed are sampled at --log-sample, and say so, since there can be
+    a great many of them.  anything else is always logged, as a warning.
+    """
+
+    succeeded = (status == 'finished') and (retcode == 0)
+    level = logging.INFO if succeeded else logging.WARNING
+
+    if not execution_log.isEnabledFor(level):
+        return
+
+    sample_rate = config['log_sample'] if succeeded else 1.0
+    if (sample_rate < 1.0) and (random.random() >= sample_rate):
+        return
+
+    duration = time.time() - started
+    fields = {
+        "script": script.name,
+        "user": user,
+        "params": script.filter_params(params),
+        "priority": priority or script.priority,
+        "duration": round(duration, 6),
+        "retcode": retcode,
+        "status": status
+    }
+    if sample_rate < 1.0:
+        fields["sample_rate"] = sample_rate
+    if error is not None:
+        fields["error"] = error
+
+    execution_log.log(level, "Ran script {0} in {1:.3f}s, {2}".format(script.name, duration, status), extra={'fields': fields})
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+import bisect
+import glob
+import json
+import logging
+import os
+import os.path
+from collections import OrderedDict
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+log = logging.getLogger(__name__)
+
+# upper bounds, in seconds, from a quick auth check to a long running script
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds between each worker writing its metrics out for the others
+SHARE_INTERVAL = 1.0
+
+
+class Counter(object):
+    """ a count that only goes up, one per set of label values """
+
+    kind = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, label_values=(), amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in sorted(self.values.items()):
+            yield self.name, zip(self.labels, label_values), value
+
+    def snapshot(self):
+        return [[list(label_values), value] for label_values, value in self.values.items()]
+
+    def merge(self, snapshot):
+        for label_values, value in snapshot:
+            self.inc(tuple(label_values), value)
+
+
+class Gauge(Counter):
+    """ a value that goes up and down, one per set of label values """
+
+    kind = 'gauge'
+
+
+class Histogram(object):
+    """ counts of observations falling in fixed buckets, with their sum, one per set of label values """
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, label_values, value):
+        series = self.values.get(label_values)
+        if series is None:
+            # one count per bucket, one for +Inf, then the sum
+            series = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for label_values, series in sorted(self.values.items()):
+            labels = zip(self.labels, label_values)
+
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                total += count
+                yield self.name + '_bucket', labels + [('le', bound)], total
+
+            yield self.name + '_sum', labels, series[-1]
+            yield self.name + '_count', labels, total
+
+    def snapshot(self):
+        return [[list(label_values), series] for label_values, series in self.values.items()]
+
+    def merge(self, snapshot):
+        for label_values, series in snapshot:
+            label_values = tuple(label_values)
+            current = self.values.get(label_values)
+            if current is None:
+                self.values[label_values] = list(series)
+            elif len(current) == len(series):
+                self.values[label_values] = [a + b for a, b in zip(current, series)]
+
+
+class Registry(object):
+    """
+    a set of metrics, written out in the prometheus text format
+
+    metrics are only recorded from the IOLoop, so they need no locking.  series are
+    labelled by script, and dropped once the script is removed, or by authenticated
+    user, so there are only as many as the script directory and password file allow
+    """
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+
+    def counter(self, name, description, labels=()):
+        return self.register(Counter(name, description, labels))
+
+    def gauge(self, name, description, labels=()):
+        return self.register(Gauge(name, description, labels))
+
+    def histogram(self, name, description, labels=(), buckets=SECONDS_BUCKETS):
+        return self.register(Histogram(name, description, labels, buckets))
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def remove_series(self, label, value):
+        """ drop every series with the label's value, like those of a script that was removed """
+
+        for metric in self.metrics.values():
+            if label not in metric.labels:
+                continue
+
+            index = metric.labels.index(label)
+            for label_values in [label_values for label_values in metric.values if label_values[index] == value]:
+                del metric.values[label_values]
+
+    def snapshot(self):
+        """ every metric's values, as json """
+
+        return dict((name, metric.snapshot()) for name, metric in self.metrics.items())
+
+    def merge(self, snapshot, kinds=('counter', 'gauge', 'histogram')):
+        """ add the values from a snapshot to ours """
+
+        for name, values in snapshot.items():
+            metric = self.metrics.get(name)
+            if (metric is not None) and (metric.kind in kinds):
+                metric.merge(values)
+
+    def exposition(self):
+        lines = []
+
+        for metric in self.metrics.values():
+            lines.append("# HELP {0} {1}".format(metric.name, metric.description))
+            lines.append("# TYPE {0} {1}".format(metric.name, metric.kind))
+
+            for name, labels, value in metric.samples():
+                if labels:
+                    name += '{' + ','.join('{0}="{1}"'.format(k, escape(v)) for k, v in labels) + '}'
+                lines.append("{0} {1}".format(name, format_value(value)))
+
+        return '\n'.join(lines) + '\n'
+
+
+class Metrics(Registry):
+    """ everything pyjojo measures """
+
+    def __init__(self):
+        Registry.__init__(self)
+
+        self.requests = self.counter('pyjojo_requests_total', "Requests to run a script, by response code.", ('script', 'code'))
+        self.request_seconds = self.histogram('pyjojo_request_seconds', "Time to answer requests to run a script.", ('script',))
+        self.wait_seconds = self.histogram('pyjojo_wait_seconds', "Time spent waiting on the script lock or the queue.", ('script',))
+        self.user_wait_seconds = self.histogram('pyjojo_user_wait_seconds', "Time spent waiting on the script lock or the queue, by user and priority.", ('user', 'priority'))
+        self.queued = self.gauge('pyjojo_queued', "Requests waiting in the queue for a slot, by user.", ('user',))
+        self.spawn_seconds = self.histogram('pyjojo_spawn_seconds', "Time to fork and exec the script.", ('script',))
+        self.run_seconds = self.histogram('pyjojo_run_seconds', "Time the script ran for.", ('script',))
+        self.output_bytes = self.counter('pyjojo_output_bytes_total', "Bytes of output written by the script.", ('script', 'stream'))
+        self.retcodes = self.counter('pyjojo_retcodes_total', "Runs of the script, by return code.", ('script', 'retcode'))
+        self.rate_limited = self.counter('pyjojo_rate_limited_total', "Requests turned away by a rate limit, by the limit they hit.", ('level',))
+        self.auth_seconds = self.histogram('pyjojo_auth_seconds', "Time to check credentials.", ('result',))
+        self.log_dropped = self.counter('pyjojo_log_dropped_total', "Log records dropped because the log queue was full, by logger.", ('logger',))
+
+
+class SharedMetrics(object):
+    """
+    the metrics of a server with many workers, which each keep their own
+
+    every worker writes its metrics to a file in directory, and adds up all of the
+    files to answer /metrics, so whichever worker is asked answers for the whole
+    server.  a restarted worker carries on counting from where the one it replaced
+    left off, so the counters don't look like they were reset.
+    """
+
+    def __init__(self, directory, worker_id, registry, io_loop=None):
+        self.directory = directory
+        self.filename = os.path.join(directory, 'worker-{0}.json'.format(worker_id))
+        self.registry = registry
+
+        # gauges are about now, which the last worker's aren't
+        self.registry.merge(read_snapshot(self.filename), kinds=('counter', 'histogram'))
+
+        self.writer = PeriodicCallback(self.write, SHARE_INTERVAL * 1000, io_loop=io_loop or IOLoop.instance())
+        self.writer.start()
+
+    def write(self):
+        temp = "{0}.{1}.tmp".format(self.filename, os.getpid())
+        with open(temp, 'w') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.rename(temp, self.filename)
+
+    def exposition(self):
+        self.write()
+
+        total = Metrics()
+        for filename in sorted(glob.glob(os.path.join(self.directory, 'worker-*.json'))):
+            total.merge(read_snapshot(filename))
+
+        return total.exposition()
+
+
+def read_snapshot(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except IOError:
+        return {}
+    except ValueError:
+        log.warn("Ignoring unreadable metrics in {0}".format(filename))
+        return {}
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+_metrics = None
+_shared = None
+
+
+def metrics():
+    """ the metrics for this process """
+
+    global _metrics
+
+    if _metrics is None:
+        _metrics = Metrics()
+
+    return _metrics
+
+
+def share_metrics(directory, worker_id):
+    """ add this worker's metrics to those of the others, for /metrics """
+
+    global _shared
+
+    _shared = SharedMetrics(directory, worker_id, metrics())
+
+
+def exposition():
+    """ the metrics for the server, in the prometheus text format """
+
+    if _shared is not None:
+        return _shared.exposition()
+
+    return metrics().exposition()
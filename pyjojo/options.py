@@ -1,11 +1,13 @@
 #!/usr/bin/env python
 
+import logging
 from optparse import OptionParser, IndentedHelpFormatter
 
 from pyjojo.config import config
+from pyjojo.ratelimit import parse_rate
 
-def command_line_options():
-    """ command line configuration """
+def command_line_options(args=None):
+    """ command line configuration, from sys.argv unless args are given """
     
     parser = OptionParser(usage="usage: %prog [options] <htpasswd>")
     
@@ -42,7 +44,132 @@ Use the apache htpasswd utility to create your htpasswd files."""
     parser.add_option('-u', '--unix-socket', action="store", dest="unix_socket", default=None,
                       help="Bind pyjojo to a unix domain socket")
 
-    options, args = parser.parse_args()
+    parser.add_option('--threads', action="store", dest="threads", type="int", default=4,
+                      help="Size of the thread pool used for blocking work, like password hashing.")
+
+    parser.add_option('--auth-cache-ttl', action="store", dest="auth_cache_ttl", type="float", default=300,
+                      help="Seconds to remember a verified username and password, 0 to disable.")
+
+    parser.add_option('--auth-cache-size', action="store", dest="auth_cache_size", type="int", default=1024,
+                      help="Maximum number of verified credentials to remember.")
+
+    parser.add_option('--job-dir', action="store", dest="job_dir", default=None,
+                      help="Directory to keep background jobs and their results in, instead of memory. A temporary one with --workers.")
+
+    parser.add_option('--job-max-age', action="store", dest="job_max_age", type="float", default=3600,
+                      help="Seconds to keep the results of finished background jobs.")
+
+    parser.add_option('--job-max-count', action="store", dest="job_max_count", type="int", default=1000,
+                      help="Maximum number of finished background jobs to keep.")
+
+    parser.add_option('--max-children', action="store", dest="max_children", type="int", default=64,
+                      help="Maximum number of scripts running at once, across all scripts.")
+
+    parser.add_option('--max-queue', action="store", dest="max_queue", type="int", default=128,
+                      help="Maximum number of requests waiting to run, after which they are rejected.")
+
+    parser.add_option('--queue-timeout', action="store", dest="queue_timeout", type="float", default=30,
+                      help="Seconds a request may wait to run before it is rejected, 0 to wait forever.")
+
+    parser.add_option('--user-weights', action="store", dest="user_weights", default="",
+                      help="Comma separated user=weight shares of the queue, like 'alice=2,batchbot=0.5'.  Users not listed have a weight of 1.")
+
+    parser.add_option('--priority-users', action="store", dest="priority_users", default="",
+                      help="Comma separated users allowed to ask for a more urgent X-Priority than a script's own.")
+
+    parser.add_option('--rate-limit', action="store", dest="rate_limit", default=None,
+                      help="Requests to run scripts to allow across the server, like '50' a second, '600/m' or '600/m, 100' with a burst of 100.  Unlimited by default.")
+
+    parser.add_option('--client-rate-limit', action="store", dest="client_rate_limit", default=None,
+                      help="Requests to run scripts to allow from each user, or each address without a password file, like --rate-limit.  See the 'rate_limit' jojo field.")
+
+    parser.add_option('--rate-limit-clients', action="store", dest="rate_limit_clients", type="int", default=10000,
+                      help="Maximum number of clients to track for --client-rate-limit, forgetting the least recently seen past that.")
+
+    parser.add_option('-w', '--workers', action="store", dest="workers", type="int", default=1,
+                      help="Number of worker processes to serve requests with.")
+
+    parser.add_option('--lock-dir', action="store", dest="lock_dir", default=None,
+                      help="Directory for the lock files that make 'lock: True' work across processes, and hosts sharing it.")
+
+    parser.add_option('--lock-backend', action="store", dest="lock_backend", type="choice", choices=["local", "file"], default=None,
+                      help="Where script locks live: 'local' only locks within this process, 'file' uses lock files in --lock-dir.  'file' whenever there is a --lock-dir by default.")
+
+    parser.add_option('--lock-timeout', action="store", dest="lock_timeout", type="float", default=0,
+                      help="Seconds to wait for a script's lock before giving up, 0 to wait forever.  See the 'lock_timeout' jojo field.")
+
+    parser.add_option('--watch', action="store_true", dest="watch", default=False,
+                      help="Reload scripts automatically when the script directory changes.")
+
+    parser.add_option('--manifest', action="store", dest="manifest", default=None,
+                      help="File to keep parsed jojo blocks in, so restarts only parse changed scripts.")
+
+    parser.add_option('--cache-max-bytes', action="store", dest="cache_max_bytes", type="int", default=64 * 1024 * 1024,
+                      help="Approximate memory to use for cached script results, see the 'cache' jojo field.")
+
+    parser.add_option('--idempotency-ttl', action="store", dest="idempotency_ttl", type="float", default=3600,
+                      help="Seconds to keep results of requests with an Idempotency-Key header, to replay for retries.")
+
+    parser.add_option('--max-output', action="store", dest="max_output", type="int", default=1024 * 1024,
+                      help="Bytes of output per stream to keep in memory, past which it spills to disk.  See the 'max_output' jojo field.")
+
+    parser.add_option('--max-spill', action="store", dest="max_spill", type="int", default=1024 * 1024 * 1024,
+                      help="Bytes of output per stream to spill to disk, past which it is dropped.")
+
+    parser.add_option('--spill-dir', action="store", dest="spill_dir", default=None,
+                      help="Directory to spill large output to, a temporary directory by default.")
+
+    parser.add_option('--timeout', action="store", dest="timeout", type="float", default=0,
+                      help="Seconds a script may run before it is killed, 0 for no limit.  See the 'timeout' jojo field.")
+
+    parser.add_option('--spawner', action="store", dest="spawner", type="choice", choices=["fork", "helper"], default="fork",
+                      help="How to start scripts: 'fork' forks the server for each one, 'helper' asks a small helper process to.")
+
+    parser.add_option('--batch-concurrency', action="store", dest="batch_concurrency", type="int", default=8,
+                      help="The most items of a /batch request to run at once.")
+
+    parser.add_option('--log-level', action="store", dest="log_level", default="info",
+                      help="Least severe level to log: debug, info, warning or error.")
+
+    parser.add_option('--log-levels', action="store", dest="log_levels", default="",
+                      help="Comma separated logger=level overrides of --log-level, like 'pyjojo.execution=warning,tornado.access=error'.")
+
+    parser.add_option('--log-format', action="store", dest="log_format", type="choice", choices=["text", "json"], default="text",
+                      help="How to write log records: 'text' lines, or 'json' objects, one per line.")
+
+    parser.add_option('--log-sample', action="store", dest="log_sample", type="float", default=1.0,
+                      help="Fraction of successful script runs to log, between 0 and 1.  Failures are always logged.")
+
+    parser.add_option('--log-queue', action="store", dest="log_queue", type="int", default=10000,
+                      help="Log records to queue for the background thread writing them, past which they are dropped.  0 writes them straight away instead.")
+
+    parser.add_option('--batch-max-items', action="store", dest="batch_max_items", type="int", default=100,
+                      help="The most items a /batch request may have.")
+
+    parser.add_option('--max-return-bytes', action="store", dest="max_return_bytes", type="int", default=65536,
+                      help="Bytes of return values to keep for each run, past which they are dropped.")
+
+    options, args = parser.parse_args(args)
+
+    try:
+        user_weights = parse_weights(options.user_weights)
+    except ValueError:
+        parser.error("--user-weights should look like 'alice=2,batchbot=0.5', with weights above 0")
+
+    try:
+        rate_limit = parse_rate(options.rate_limit) if options.rate_limit else None
+        client_rate_limit = parse_rate(options.client_rate_limit) if options.client_rate_limit else None
+    except ValueError:
+        parser.error("rate limits should look like '50', '600/m' or '600/m, 100', with numbers above 0")
+
+    try:
+        log_level = parse_level(options.log_level)
+        log_levels = parse_levels(options.log_levels)
+    except ValueError:
+        parser.error("log levels should be one of debug, info, warning or error, like 'pyjojo.execution=warning'")
+
+    if not (0 <= options.log_sample <= 1):
+        parser.error("--log-sample should be between 0 and 1")
 
     # TODO: only do this if they specify the ssl certfile and keyfile
     if len(args) >= 1:
@@ -52,10 +179,84 @@ Use the apache htpasswd utility to create your htpasswd files."""
         
     config['directory'] = options.directory
     config['force_json'] = options.force_json
+    config['threads'] = options.threads
+    config['auth_cache_ttl'] = options.auth_cache_ttl
+    config['auth_cache_size'] = options.auth_cache_size
+    config['job_dir'] = options.job_dir
+    config['job_max_age'] = options.job_max_age
+    config['job_max_count'] = options.job_max_count
+    config['max_children'] = options.max_children
+    config['max_queue'] = options.max_queue
+    config['queue_timeout'] = options.queue_timeout
+    config['user_weights'] = user_weights
+    config['priority_users'] = set(user.strip() for user in options.priority_users.split(',') if user.strip())
+    config['rate_limit'] = rate_limit
+    config['client_rate_limit'] = client_rate_limit
+    config['rate_limit_clients'] = options.rate_limit_clients
+    config['workers'] = options.workers
+    config['lock_dir'] = options.lock_dir
+    config['lock_backend'] = options.lock_backend
+    config['lock_timeout'] = options.lock_timeout
+    config['watch'] = options.watch
+    config['manifest'] = options.manifest
+    config['cache_max_bytes'] = options.cache_max_bytes
+    config['idempotency_ttl'] = options.idempotency_ttl
+    config['max_output'] = options.max_output
+    config['max_spill'] = options.max_spill
+    config['spill_dir'] = options.spill_dir
+    config['timeout'] = options.timeout
+    config['spawner'] = options.spawner
+    config['batch_concurrency'] = options.batch_concurrency
+    config['batch_max_items'] = options.batch_max_items
+    config['max_return_bytes'] = options.max_return_bytes
+    config['log_level'] = log_level
+    config['log_levels'] = log_levels
+    config['log_format'] = options.log_format
+    config['log_sample'] = options.log_sample
+    config['log_queue'] = options.log_queue
 
     return options
 
 
+def parse_weights(value):
+    """ user=weight pairs, separated by commas """
+
+    weights = {}
+    for pair in value.split(','):
+        if not pair.strip():
+            continue
+
+        user, weight = pair.split('=')
+        weights[user.strip()] = float(weight)
+        if weights[user.strip()] <= 0:
+            raise ValueError(pair)
+
+    return weights
+
+
+def parse_level(value):
+    """ a level name, like info """
+
+    if value.strip().lower() not in ['debug', 'info', 'warning', 'error']:
+        raise ValueError(value)
+
+    return getattr(logging, value.strip().upper())
+
+
+def parse_levels(value):
+    """ logger=level pairs, separated by commas """
+
+    levels = {}
+    for pair in value.split(','):
+        if not pair.strip():
+            continue
+
+        logger, level = pair.split('=')
+        levels[logger.strip()] = parse_level(level)
+
+    return levels
+
+
 class PlainHelpFormatter(IndentedHelpFormatter): 
     def format_description(self, description):
         if description:
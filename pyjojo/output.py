@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+
+import errno
+import fcntl
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from pyjojo.config import config
+from pyjojo.pool import executor
+from pyjojo.tempdirs import make_temp_dir
+
+log = logging.getLogger(__name__)
+
+READ_SIZE = 65536
+MAX_LINE = 65536
+
+# lines from the start and end of spilled output to respond with
+HEAD_LINES = 100
+TAIL_LINES = 100
+
+# seconds to keep spilled output around for, and between sweeps for older output
+SPILL_MAX_AGE = 3600
+EVICT_INTERVAL = 60.0
+
+
+class LineReader(object):
+    """
+    reads lines from a child's pipe, handing them to a consumer in batches
+
+    reading is paused while the consumer works through a batch, so a slow
+    consumer fills the pipe and blocks the child instead of growing our buffers
+    """
+
+    def __init__(self, pipe, name, on_lines, io_loop=None):
+        self.pipe = pipe
+        self.fd = pipe.fileno()
+        self.name = name
+        self.on_lines = on_lines
+        self.io_loop = io_loop or IOLoop.instance()
+        self.partial = ''
+        self.callback = None
+        self.bytes_read = 0
+
+        flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def read_until_close(self, callback):
+        """ start reading, callback is run once the pipe is closed and drained """
+
+        self.callback = callback
+        self.resume()
+
+    def resume(self):
+        if self.pipe.closed:
+            return
+
+        self.io_loop.add_handler(self.fd, self.handle_events, IOLoop.READ | IOLoop.ERROR)
+
+    def abandon(self):
+        """ stop reading and close the pipe, even though something still has the other end open """
+
+        if self.pipe.closed:
+            return
+
+        self.io_loop.remove_handler(self.fd)
+        self.close()
+
+    def handle_events(self, fd, events):
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except (IOError, OSError) as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            log.error("Error reading {0} of child process: {1}".format(self.name, e))
+            data = ''
+
+        # stop reading until the consumer is done with this batch
+        self.io_loop.remove_handler(self.fd)
+
+        if not data:
+            self.close()
+            return
+
+        self.bytes_read += len(data)
+
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+
+        # don't let a runaway line without a newline grow forever
+        if len(self.partial) > MAX_LINE:
+            lines.append(self.partial)
+            self.partial = ''
+
+        if not lines:
+            self.resume()
+            return
+
+        self.on_lines(self.name, [line.rstrip('\r') for line in lines], self.resume)
+
+    def close(self):
+        self.pipe.close()
+
+        if self.partial:
+            lines, self.partial = [self.partial.rstrip('\r')], ''
+            self.on_lines(self.name, lines, self.callback)
+        else:
+            self.callback()
+
+
+class Lines(list):
+    """ a stream's output lines, with details of what was left out if it was too large to keep in memory """
+
+    truncated = None
+    return_values = None
+
+
+class ReturnValues(dict):
+    """
+    return values picked out of output lines as they are read, either
+
+        jojo_return_value name=bob
+        jojo_return_json person {"name": "bob", "age": 99}
+
+    values past max_bytes in all are dropped
+    """
+
+    def __init__(self, max_bytes):
+        dict.__init__(self)
+        self.max_bytes = max_bytes
+        self.sizes = {}
+        self.size = 0
+
+    def scan(self, lines):
+        for line in lines:
+            if line.startswith('jojo_return_'):
+                self.parse(line)
+
+    def parse(self, line):
+        if line.startswith('jojo_return_value'):
+            key, sep, text = line[len('jojo_return_value'):].partition('=')
+            key, value = key.strip(), text.strip()
+            if not sep:
+                log.warn("return value without an '=': {0}".format(line[:200]))
+                return
+
+        elif line.startswith('jojo_return_json'):
+            key, sep, text = line[len('jojo_return_json'):].strip().partition(' ')
+            try:
+                value = json.loads(text)
+            except ValueError:
+                log.warn("return value that isn't json: {0}".format(line[:200]))
+                return
+
+        else:
+            return
+
+        if not key:
+            return
+
+        size = len(key) + len(text)
+        if self.size - self.sizes.get(key, 0) + size > self.max_bytes:
+            log.warn("dropping return value {0}, return values are over {1} bytes".format(key, self.max_bytes))
+            return
+
+        self.size += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+        self[key] = value
+
+
+class OutputBuffer(object):
+    """
+    collects a stream's output lines in memory, up to max_output bytes
+
+    past that, the output goes to a spill file instead, and only the first and
+    last lines are kept in memory
+    """
+
+    def __init__(self, output_id, name, max_output):
+        self.output_id = output_id
+        self.name = name
+        self.max_output = max_output
+        self.lines = Lines()
+        self.size = 0
+        self.count = 0
+        self.spill = None
+        self.spilled = 0
+        self.tail = None
+        self.return_values = ReturnValues(config['max_return_bytes'])
+
+    def add(self, lines, callback):
+        """ take a batch of lines, callback() once they're stored """
+
+        self.return_values.scan(lines)
+
+        size = sum(len(line) + 1 for line in lines)
+        self.size += size
+        self.count += len(lines)
+
+        if self.spill is None:
+            self.lines.extend(lines)
+            if self.size > self.max_output:
+                self.start_spill(callback)
+            else:
+                callback()
+            return
+
+        self.tail.extend(lines)
+        self.write_spill(lines, size, callback)
+
+    def start_spill(self, callback):
+        log.info("Output of {0} is over {1} bytes, spilling it to disk".format(self.name, self.max_output))
+
+        self.spill = spill_store().create(self.output_id, self.name)
+        lines = list(self.lines)
+
+        # the tail starts after the head, so short output isn't in both
+        self.tail = deque(self.lines[HEAD_LINES:][-TAIL_LINES:], TAIL_LINES)
+        del self.lines[HEAD_LINES:]
+
+        self.write_spill(lines, self.size, callback)
+
+    def write_spill(self, lines, size, callback):
+        """
+        write to the spill file on the thread pool, then callback().  the reader
+        waits for the callback before reading more, so there's only ever one write
+        in flight, and a slow disk slows down the child rather than the IOLoop
+        """
+
+        # past the limit the output is counted, but dropped
+        if self.spilled + size > config['max_spill']:
+            callback()
+            return
+
+        self.spilled += size
+        future = executor().submit(self.spill.write, '\n'.join(lines) + '\n')
+        IOLoop.instance().add_future(future, lambda future: self.written(future, callback))
+
+    def written(self, future, callback):
+        if future.exception() is not None:
+            log.error("Unable to spill output of {0}: {1}".format(self.name, future.exception()))
+        callback()
+
+    def finish(self):
+        """ the lines to respond with """
+
+        if self.spill is None:
+            self.lines.return_values = self.return_values
+            return self.lines
+
+        self.spill.close()
+
+        lines = Lines(self.lines + list(self.tail))
+        lines.return_values = self.return_values
+        lines.truncated = {
+            "lines": self.count,
+            "bytes": self.size,
+            "stored_bytes": self.spilled,
+            "url": "/output/{0}/{1}".format(self.output_id, self.name)
+        }
+
+        return lines
+
+
+class SpillStore(object):
+    """ temporary files holding output too large to keep in memory, removed after a while """
+
+    def __init__(self, directory, max_age, io_loop=None):
+        self.directory = directory
+        self.max_age = max_age
+
+        # swept on a timer, so nothing outlives max_age by much on an idle server
+        self.evictor = PeriodicCallback(self.evict, EVICT_INTERVAL * 1000, io_loop=io_loop or IOLoop.instance())
+        self.evictor.start()
+
+    def path(self, output_id, name):
+        return os.path.join(self.directory, "{0}.{1}".format(output_id, name))
+
+    def create(self, output_id, name):
+        return open(self.path(output_id, name), 'w')
+
+    def find(self, output_id, name):
+        """ the path of the spilled output, if it is still around """
+
+        path = self.path(output_id, name)
+
+        if not os.path.exists(path):
+            return None
+
+        return path
+
+    def evict(self):
+        executor().submit(self.remove_old, time.time() - self.max_age)
+
+    def remove_old(self, cutoff):
+        """ remove the files last written before the cutoff, including those of workers that have gone """
+
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    log.error("Unable to remove spilled output {0}: {1}".format(path, e))
+
+
+_spill_store = None
+
+
+def spill_store():
+    """ the server wide store of spilled output """
+
+    global _spill_store
+
+    if _spill_store is None:
+        if config['spill_dir'] is None:
+            config['spill_dir'] = make_temp_dir('pyjojo-output-')
+        elif not os.path.isdir(config['spill_dir']):
+            os.makedirs(config['spill_dir'])
+        _spill_store = SpillStore(config['spill_dir'], SPILL_MAX_AGE)
+
+    return _spill_store
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from pyjojo.config import config
+
+log = logging.getLogger(__name__)
+
+_executor = None
+
+
+def executor():
+    """ the shared thread pool for blocking work that must stay off the IOLoop """
+
+    global _executor
+
+    if _executor is None:
+        log.info("Starting thread pool with {0} threads".format(config['threads']))
+        _executor = ThreadPoolExecutor(config['threads'])
+
+    return _executor
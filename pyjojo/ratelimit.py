@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+import math
+import time
+from collections import Counter, OrderedDict
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.web import HTTPError
+
+from pyjojo.config import config
+from pyjojo.metrics import metrics
+
+# seconds between sweeps for buckets that have filled back up
+EVICT_INTERVAL = 60.0
+
+UNITS = {'s': 1.0, 'm': 60.0, 'h': 3600.0}
+
+
+class RateLimited(HTTPError):
+    """ too many requests, try again later """
+
+    def __init__(self, level, retry_after):
+        # tornado doesn't know 429 yet, so it needs its reason
+        HTTPError.__init__(self, 429, "Rate limit reached for this {0}, try again in {1} seconds".format(level, retry_after),
+                           reason="Too Many Requests")
+        self.level = level
+        self.retry_after = retry_after
+
+
+class Bucket(object):
+    """ holds up to burst tokens, refilled at rate a second, each request takes one """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, now, count=1):
+        """ seconds until there are count tokens to take """
+
+        self.refill(now)
+        if self.tokens >= count:
+            return 0
+        return (count - self.tokens) / self.rate
+
+    def take(self, count=1):
+        self.tokens -= count
+
+    def full(self, now):
+        """ a full bucket is the same as no bucket, so it can be forgotten """
+
+        self.refill(now)
+        return self.tokens >= self.burst
+
+
+class RateLimiter(object):
+    """
+    token bucket limits on requests to run scripts, for the whole server, each
+    script and each client, a user when they've logged in or an address otherwise
+
+    buckets are only made for limits that are set, and are forgotten once they
+    fill back up, so an idle client costs nothing.  at most max_clients clients
+    are kept, forgetting the least recently seen past that.
+    """
+
+    def __init__(self, server_limit, client_limit, max_clients, io_loop=None):
+        self.client_limit = client_limit
+        self.max_clients = max_clients
+        self.server = None
+        if server_limit is not None:
+            self.server = Bucket(server_limit[0], server_limit[1], time.time())
+        self.scripts = {}
+        self.clients = OrderedDict()
+
+        self.evictor = PeriodicCallback(self.evict, EVICT_INTERVAL * 1000, io_loop=io_loop or IOLoop.instance())
+        self.evictor.start()
+
+    def check(self, script=None, client=None):
+        """ take a token from each bucket the request falls in, or raise RateLimited without taking any """
+
+        now = time.time()
+        buckets = []
+
+        if self.server is not None:
+            buckets.append(('server', self.server, 1))
+
+        if (script is not None) and (script.rate_limit is not None):
+            buckets.append(('script', self.script_bucket(script, now), 1))
+
+        if (client is not None) and (self.client_limit is not None):
+            buckets.append(('client', self.client_bucket(client, now), 1))
+
+        self.take(buckets, now)
+
+    def check_scripts(self, scripts):
+        """ take a token for every run of a script with a rate_limit, for a batch, or raise RateLimited without taking any """
+
+        now = time.time()
+        counts = Counter(script.name for script in scripts if script.rate_limit is not None)
+        buckets = []
+
+        for script in dict((script.name, script) for script in scripts).values():
+            if script.name not in counts:
+                continue
+
+            bucket = self.script_bucket(script, now)
+            if counts[script.name] > bucket.burst:
+                raise HTTPError(400, "Batch runs script '{0}' {1} times, more than its rate_limit allows at once".format(script.name, counts[script.name]))
+
+            buckets.append(('script', bucket, counts[script.name]))
+
+        self.take(buckets, now)
+
+    def take(self, buckets, now):
+        waits = [(bucket.wait(now, count), level) for level, bucket, count in buckets]
+        if waits and max(waits)[0] > 0:
+            wait, level = max(waits)
+            metrics().rate_limited.inc((level,))
+            raise RateLimited(level, int(math.ceil(wait)))
+
+        for level, bucket, count in buckets:
+            bucket.take(count)
+
+    def script_bucket(self, script, now):
+        rate, burst = script.rate_limit
+
+        # a reloaded script may have a new limit
+        bucket = self.scripts.get(script.name)
+        if (bucket is None) or (bucket.rate, bucket.burst) != (rate, burst):
+            bucket = self.scripts[script.name] = Bucket(rate, burst, now)
+
+        return bucket
+
+    def client_bucket(self, client, now):
+        # most recently seen last
+        bucket = self.clients.pop(client, None)
+        if bucket is None:
+            bucket = Bucket(self.client_limit[0], self.client_limit[1], now)
+            if len(self.clients) >= self.max_clients:
+                self.clients.popitem(last=False)
+
+        self.clients[client] = bucket
+        return bucket
+
+    def evict(self):
+        """ forget the buckets that have filled back up """
+
+        now = time.time()
+        for buckets in [self.scripts, self.clients]:
+            for key, bucket in buckets.items():
+                if bucket.full(now):
+                    del buckets[key]
+
+
+def parse_rate(value):
+    """
+    a rate limit like '5', '30/m' or '100/h, 20', returning (per second, burst)
+
+    the rate is per second unless it says otherwise, and the burst defaults to
+    the number in the rate, so '30/m' allows 30 at once then one every 2 seconds
+    """
+
+    rate, _, burst = value.partition(',')
+    count, _, unit = rate.partition('/')
+
+    unit = unit.strip().lower() or 's'
+    if unit not in UNITS:
+        raise ValueError(value)
+
+    count = float(count)
+    seconds = UNITS[unit]
+    burst = int(burst) if burst.strip() else max(1, int(count))
+
+    if (count <= 0) or (burst < 1):
+        raise ValueError(value)
+
+    return count / seconds, burst
+
+
+_rate_limiter = None
+
+
+def rate_limiter():
+    """ the rate limits for this process """
+
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(config['rate_limit'], config['client_rate_limit'], config['rate_limit_clients'])
+
+    return _rate_limiter
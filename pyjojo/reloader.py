@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import os.path
+import struct
+import time
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from pyjojo.cache import result_cache
+from pyjojo.metrics import metrics
+from pyjojo.pool import executor
+from pyjojo.scripts import update_collection
+
+log = logging.getLogger(__name__)
+
+# wait for changes to settle before rescanning
+DEBOUNCE = 0.5
+
+# how often to rescan when inotify isn't available
+POLL_INTERVAL = 5.0
+
+
+class Reloader(object):
+    """ keeps the application's script collection in sync with the script directory """
+
+    def __init__(self, application, directory, io_loop=None):
+        self.application = application
+        self.directory = directory
+        self.io_loop = io_loop or IOLoop.instance()
+        self.running = False
+        self.callbacks = []
+        self.pending = []
+        self.timeout = None
+        self.watcher = None
+
+    def reload(self, callback=None):
+        """ rescan the directory on the thread pool, then swap in the updated collection """
+
+        # only one rescan at a time, anyone else waits for the next one
+        if self.running:
+            self.pending.append(callback)
+            return
+
+        self.running = True
+        self.callbacks = [callback]
+
+        future = executor().submit(update_collection, self.application.settings['scripts'], self.directory)
+        self.io_loop.add_future(future, self.reloaded)
+
+    def reloaded(self, future):
+        self.running = False
+        callbacks = self.callbacks
+
+        try:
+            scripts, changes = future.result()
+        except Exception:
+            log.exception("Unable to reload scripts from {0}".format(self.directory))
+            changes = None
+        else:
+            retired = self.application.settings['scripts']
+            self.application.settings['scripts'] = scripts
+
+            # the cached results of a script that was changed or removed are no longer its
+            # results, and a removed script's metrics would only ever be stale
+            for name, script in retired.items():
+                if scripts.get(name) is not script:
+                    script.close()
+                    result_cache().purge(name)
+                if name not in scripts:
+                    metrics().remove_series('script', name)
+
+            log.info("Reloaded scripts, added: {0} modified: {1} removed: {2}".format(
+                changes['added'], changes['modified'], changes['removed']))
+
+        if self.pending:
+            pending, self.pending = self.pending, []
+            self.reload(pending[0])
+            self.callbacks.extend(pending[1:])
+
+        for callback in callbacks:
+            if callback is not None:
+                callback(changes)
+
+    def changed(self):
+        """ something in the directory changed, reload once things have been quiet for a bit """
+
+        if self.timeout is not None:
+            self.io_loop.remove_timeout(self.timeout)
+
+        self.timeout = self.io_loop.add_timeout(time.time() + DEBOUNCE, self.debounced)
+
+    def debounced(self):
+        self.timeout = None
+        self.reload()
+
+    def watch(self):
+        """ reload whenever the directory changes, falling back to polling without inotify """
+
+        try:
+            self.watcher = InotifyWatcher(self.directory, self.changed, self.io_loop)
+            self.watcher.start()
+            log.info("Watching {0} for changes with inotify".format(self.directory))
+        except (OSError, AttributeError) as e:
+            log.warn("inotify is not available ({0}), polling {1} for changes instead".format(e, self.directory))
+            self.watcher = PeriodicCallback(self.reload, POLL_INTERVAL * 1000, io_loop=self.io_loop)
+            self.watcher.start()
+
+
+class InotifyWatcher(object):
+    """ calls on_change when anything under the directory changes, linux only """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+
+    MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, directory, on_change, io_loop):
+        self.directory = directory
+        self.on_change = on_change
+        self.io_loop = io_loop
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = None
+        self.watches = {}
+
+    def start(self):
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+        self.watch_tree(self.directory)
+        self.io_loop.add_handler(self.fd, self.handle_events, IOLoop.READ)
+
+    def watch_tree(self, directory):
+        for (dirpath, _, _) in os.walk(directory):
+            wd = self.libc.inotify_add_watch(self.fd, dirpath.encode('utf-8'), self.MASK)
+            if wd < 0:
+                log.error("Unable to watch {0}: {1}".format(dirpath, os.strerror(ctypes.get_errno())))
+                continue
+            self.watches[wd] = dirpath
+
+    def handle_events(self, fd, events):
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            raise
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip('\0')
+            offset += self.EVENT.size + length
+
+            # new directories need watching too
+            if (mask & self.IN_ISDIR) and (mask & (self.IN_CREATE | self.IN_MOVED_TO)) and (wd in self.watches):
+                self.watch_tree(os.path.join(self.watches[wd], name))
+
+        self.on_change()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+import heapq
+import itertools
+import logging
+import math
+import time
+
+from tornado.ioloop import IOLoop
+from tornado.web import HTTPError
+
+from pyjojo.config import config
+from pyjojo.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# most urgent first
+PRIORITIES = ('high', 'normal', 'low')
+DEFAULT_PRIORITY = 'normal'
+
+
+class Rejected(HTTPError):
+    """ the server is too busy to run the script, try again later """
+
+    def __init__(self, message, retry_after):
+        HTTPError.__init__(self, 503, message)
+        self.retry_after = retry_after
+
+
+class Abandoned(HTTPError):
+    """ the client went away while the script was waiting to start """
+
+    def __init__(self, name):
+        HTTPError.__init__(self, 503, "Gave up waiting for '{0}', the client went away".format(name))
+
+
+class Slots(object):
+    """
+    limits how many children run at once, with a bounded queue for the rest
+
+    the queue is shared fairly between users, within priority classes.  waiters of a
+    higher priority always go first.  within a class each user gets a share of the
+    slots in proportion to their weight, by start time fair queueing: each waiter is
+    tagged 1/weight past the later of its user's last tag and the tag of the waiter
+    last let in, and the lowest tag goes next.  with one user it's first come first
+    served.
+    """
+
+    def __init__(self, name, limit, max_queue, queue_timeout, weights=None, io_loop=None):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.weights = weights or {}
+        self.io_loop = io_loop or IOLoop.instance()
+        self.active = 0
+        self.queues = dict((priority, []) for priority in PRIORITIES)
+        self.virtual_time = dict((priority, 0.0) for priority in PRIORITIES)
+        self.last_tags = dict((priority, {}) for priority in PRIORITIES)
+        self.queued = {}
+        self.waiting = 0
+        self.sequence = itertools.count()
+
+    def acquire(self, callback, user=None, priority=DEFAULT_PRIORITY, abandoned=None):
+        """
+        callback(True) once we hold a slot, callback(False) if the queue is full or we
+        waited too long.  if the abandoned future is resolved while we wait, we leave
+        the queue with callback(False) too
+        """
+
+        if (self.active < self.limit) and not self.waiting:
+            self.active += 1
+            callback(True)
+            return
+
+        if (self.waiting >= self.max_queue) and not self.make_room(user, priority):
+            log.warn("Queue for {0} is full, rejecting".format(self.name))
+            callback(False)
+            return
+
+        last_tags = self.last_tags[priority]
+        tag = max(self.virtual_time[priority], last_tags.get(user, 0.0)) + 1.0 / self.weights.get(user, 1.0)
+        last_tags[user] = tag
+
+        waiter = Waiter(callback, user, priority, tag, next(self.sequence))
+        if self.queue_timeout:
+            waiter.timeout = self.io_loop.add_timeout(time.time() + self.queue_timeout, lambda: self.expire(waiter))
+
+        heapq.heappush(self.queues[priority], waiter)
+        self.waiting += 1
+        self.queued[user] = self.queued.get(user, 0) + 1
+        metrics().queued.inc((user or '',))
+
+        if abandoned is not None:
+            abandoned.add_done_callback(lambda future: self.cancel(waiter))
+
+    def make_room(self, user, priority):
+        """
+        when the queue is full, turn away the newest waiter of the user with the most
+        of the least urgent class, by weight, so a full queue can't lock out more
+        urgent requests, or users with less of the queue.  returns whether there is
+        room now
+        """
+
+        classes = [candidate for candidate in PRIORITIES if self.queues[candidate]]
+        if not classes:
+            return False
+
+        candidate = classes[-1]
+        if PRIORITIES.index(candidate) < PRIORITIES.index(priority):
+            return False
+
+        queue = self.queues[candidate]
+        counts = {}
+        for waiter in queue:
+            counts[waiter.user] = counts.get(waiter.user, 0) + 1
+
+        share = lambda name, count: count / self.weights.get(name, 1.0)
+        heaviest = max(counts, key=lambda name: share(name, counts[name]))
+
+        # within a class, only make room for a user who'd still have less of it
+        if (candidate == priority) and share(heaviest, counts[heaviest]) <= share(user, counts.get(user, 0) + 1):
+            return False
+
+        victim = max((waiter for waiter in queue if waiter.user == heaviest), key=lambda waiter: waiter.sequence)
+        log.warn("Queue for {0} is full, turning away a {1} priority request from {2} to make room".format(self.name, candidate, heaviest))
+
+        self.remove(victim)
+        victim.callback(False)
+
+        return True
+
+    def expire(self, waiter):
+        log.warn("Timed out waiting in the queue for {0}, rejecting".format(self.name))
+
+        self.remove(waiter)
+        waiter.callback(False)
+
+    def cancel(self, waiter):
+        """ take a waiter whose client went away out of the queue, if it's still there """
+
+        if waiter not in self.queues[waiter.priority]:
+            return
+
+        log.info("Client went away waiting in the queue for {0}".format(self.name))
+        self.remove(waiter)
+        waiter.callback(False)
+
+    def remove(self, waiter):
+        queue = self.queues[waiter.priority]
+        queue.remove(waiter)
+        heapq.heapify(queue)
+        if waiter.timeout is not None:
+            self.io_loop.remove_timeout(waiter.timeout)
+        self.dequeued(waiter)
+
+    def release(self):
+        # hand our slot straight to the next in line
+        waiter = self.next_waiter()
+        if waiter is not None:
+            if waiter.timeout is not None:
+                self.io_loop.remove_timeout(waiter.timeout)
+            waiter.callback(True)
+            return
+
+        self.active -= 1
+
+    def next_waiter(self):
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            if queue:
+                waiter = heapq.heappop(queue)
+                self.virtual_time[priority] = waiter.tag
+                self.dequeued(waiter)
+                return waiter
+
+        return None
+
+    def dequeued(self, waiter):
+        self.waiting -= 1
+        self.queued[waiter.user] -= 1
+        metrics().queued.inc((waiter.user or '',), -1)
+
+        # a user with nothing queued has no claim on the future, forget them
+        if not self.queued[waiter.user]:
+            del self.queued[waiter.user]
+            last_tags = self.last_tags[waiter.priority]
+            if last_tags.get(waiter.user, 0.0) <= self.virtual_time[waiter.priority]:
+                last_tags.pop(waiter.user, None)
+
+    def status(self):
+        """ how busy we are, and who is waiting """
+
+        now = time.time()
+        users = {}
+        for priority in PRIORITIES:
+            for waiter in self.queues[priority]:
+                user = users.setdefault(waiter.user or '', {"queued": 0, "oldest_wait_seconds": 0.0, "priorities": {}})
+                user['queued'] += 1
+                user['oldest_wait_seconds'] = max(user['oldest_wait_seconds'], now - waiter.queued)
+                user['priorities'][priority] = user['priorities'].get(priority, 0) + 1
+
+        return {
+            "name": self.name,
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.waiting,
+            "users": users
+        }
+
+
+class Waiter(object):
+    """ a request queued for a slot, ordered by its tag """
+
+    def __init__(self, callback, user, priority, tag, sequence):
+        self.callback = callback
+        self.user = user
+        self.priority = priority
+        self.tag = tag
+        self.sequence = sequence
+        self.queued = time.time()
+        self.timeout = None
+
+    def __lt__(self, other):
+        return (self.tag, self.sequence) < (other.tag, other.sequence)
+
+
+class Scheduler(object):
+    """ admission control in front of script execution """
+
+    def __init__(self, max_children, max_queue, queue_timeout, weights=None):
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.weights = weights
+        self.children = Slots('all scripts', max_children, max_queue, queue_timeout, weights)
+
+    def create_slots(self, script):
+        """ the per script slots, if the script limits its concurrency """
+
+        if script.max_concurrency is None:
+            return None
+
+        return Slots(script.name, script.max_concurrency, self.max_queue, self.queue_timeout, self.weights)
+
+    def admit(self, script, user, priority, callback, abandoned=None):
+        """ wait for a slot for the script, then a server wide one, callback(False) if either is refused or abandoned """
+
+        def got_script_slot(admitted):
+            if not admitted:
+                callback(False)
+                return
+            self.children.acquire(got_child_slot, user, priority, abandoned)
+
+        def got_child_slot(admitted):
+            if not admitted and script.slots is not None:
+                script.slots.release()
+            callback(admitted)
+
+        if script.slots is not None:
+            script.slots.acquire(got_script_slot, user, priority, abandoned)
+        else:
+            self.children.acquire(got_child_slot, user, priority, abandoned)
+
+    def release(self, script):
+        self.children.release()
+
+        if script.slots is not None:
+            script.slots.release()
+
+    def rejection(self, script):
+        retry_after = int(math.ceil(self.queue_timeout)) or 1
+        return Rejected("Too many requests for script '{0}', try again later".format(script.name), retry_after)
+
+
+_scheduler = None
+
+
+def scheduler():
+    """ the server wide scheduler """
+
+    global _scheduler
+
+    if _scheduler is None:
+        _scheduler = Scheduler(config['max_children'], config['max_queue'], config['queue_timeout'], config['user_weights'])
+
+    return _scheduler
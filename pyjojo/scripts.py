@@ -1,83 +1,245 @@
 #!/usr/bin/env python
 
+import errno
+import functools
+import hashlib
+import json
 import logging
 import os
 import os.path
 import pipes
 import re
+import signal
 import subprocess
+import time
+import uuid
+from collections import OrderedDict
 
+from concurrent.futures import ThreadPoolExecutor
 from tornado import gen
 from tornado.process import Subprocess
 from tornado.ioloop import IOLoop
-import toro
+from tornado.web import HTTPError
+
+from pyjojo.cache import single_flight
+from pyjojo.config import config
+from pyjojo.coprocess import CoprocessPool
+from pyjojo.locks import locks
+from pyjojo.logs import log_execution
+from pyjojo.metrics import metrics
+from pyjojo.output import LineReader, OutputBuffer
+from pyjojo.ratelimit import parse_rate
+from pyjojo.scheduler import scheduler, Abandoned, DEFAULT_PRIORITY, PRIORITIES
+from pyjojo.spawner import spawner
 
 log = logging.getLogger(__name__)
 
+# the jojo block has to start and end within this many bytes of the top of the file
+MAX_HEADER_BYTES = 65536
+
+# bump whenever parse_script learns a new field, so old manifests are ignored
+MANIFEST_VERSION = 10
+
+# smallest and largest number of children for persistent scripts
+DEFAULT_POOL_SIZE = (1, 4)
+
+# seconds between SIGTERM and SIGKILL for a child that timed out
+KILL_GRACE = 5.0
+
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+# distinct tag queries to keep encoded responses for
+MAX_CACHED_RESPONSES = 256
+
 
 class ScriptCollection(dict):
     """ load the collection of scripts """
 
     def __init__(self, *args, **kwargs):
         dict.__init__(self, *args, **kwargs)
+
+        # full path -> (name, signature, parsed jojo block) for every file in the directory
+        self.files = {}
+
+        # tag -> names of the scripts with that tag
+        self.tag_index = {}
+        for name, script in self.items():
+            self.index(name, script)
+
+        # (endpoint, tag query) -> (json body, etag), dropped whenever the collection changes
+        self.responses = OrderedDict()
+        self.generation = None
+
+    def __setitem__(self, name, script):
+        if name in self:
+            self.unindex(name, self[name])
+
+        dict.__setitem__(self, name, script)
+        self.index(name, script)
+        self.changed()
+
+    def __delitem__(self, name):
+        self.unindex(name, self[name])
+        dict.__delitem__(self, name)
+        self.changed()
+
+    def changed(self):
+        self.responses.clear()
+        self.generation = None
+
+    def get_generation(self):
+        """ a digest of every file's signature, the same in every process looking at the same directory """
+
+        if self.generation is None:
+            digest = hashlib.sha1()
+            for full_path in sorted(self.files):
+                name, signature, fields = self.files[full_path]
+                digest.update(repr((full_path, name, signature)))
+            self.generation = digest.hexdigest()
+
+        return self.generation
+
+    def encoded(self, endpoint, tags):
+        """ the json body and etag for a script listing, encoded once per distinct query """
+
+        key = (endpoint, tuple(sorted(tags['tags'])), tuple(sorted(tags['any_tags'])), tuple(sorted(tags['not_tags'])))
+
+        if key in self.responses:
+            return self.responses[key]
+
+        if endpoint == 'scripts':
+            body = json.dumps({'scripts': self.metadata(tags)})
+        else:
+            body = json.dumps({'script_names': self.name(tags)})
+
+        etag = '"{0}"'.format(hashlib.sha1(self.get_generation() + repr(key)).hexdigest())
+
+        self.responses[key] = (body, etag)
+        while len(self.responses) > MAX_CACHED_RESPONSES:
+            self.responses.popitem(last=False)
+
+        return body, etag
+
+    def index(self, name, script):
+        for tag in script.tags:
+            self.tag_index.setdefault(tag, set()).add(name)
+
+    def unindex(self, name, script):
+        for tag in script.tags:
+            names = self.tag_index.get(tag)
+            if names is None:
+                continue
+            names.discard(name)
+            if not names:
+                del self.tag_index[tag]
+
+    def add(self, name, full_path, signature, fields):
+        """ add a parsed file to the collection """
+
+        self.files[full_path] = (name, signature, fields)
+        self.changed()
+
+        if fields is not None:
+            self[name] = Script(full_path, name, **fields)
+
+    def find(self, tags):
+        """
+        return the names of the scripts matching every tag filter given
+
+        scripts need all of 'tags', at least one of 'any_tags' and none of 'not_tags'
+        """
+
+        any_names = set().union(*[self.tag_index.get(tag, set()) for tag in tags['any_tags']])
+
+        if tags['tags']:
+            # start from the rarest tag, to keep the intersections small
+            matches = sorted([self.tag_index.get(tag, set()) for tag in tags['tags']], key=len)
+            names = matches[0].intersection(*matches[1:])
+            if tags['any_tags']:
+                names &= any_names
+        elif tags['any_tags']:
+            names = any_names
+        else:
+            names = set(self)
+
+        if tags['not_tags']:
+            names -= set().union(*[self.tag_index.get(tag, set()) for tag in tags['not_tags']])
+
+        return sorted(names)
         
     def metadata(self, tags):
         """ return the metadata for all of the scripts, keyed by name """
         
         output = {}
-        
-        for key, value in self.items():
 
-            if (tags['tags']) or (tags['not_tags']) or (tags['any_tags']):
-                if (set(tags['tags']).issubset(value.tags)) and (tags['tags']):
-                    output[key] = value.metadata()
-                    continue
-                if tags['not_tags']:
-                    output[key] = value.metadata()
-                    for tag in tags['not_tags']:
-                        if (tag in value.tags):
-                            output.pop(key,None)
-                            break
-                for tag in tags['any_tags']:
-                    if tag in value.tags:
-                        output[key] = value.metadata()
-                        break
-            else:
-                output[key] = value.metadata()
+        for name in self.find(tags):
+            output[name] = self[name].metadata()
         
         return output
 
     def name(self, tags):
         """ return a list of just the names of all scripts """
 
-        output = []
+        return [self[name].name for name in self.find(tags)]
 
-        for key, value in self.items():
-            if (tags['tags']) or (tags['not_tags']) or (tags['any_tags']):
-                if (set(tags['tags']).issubset(value.tags)) and (tags['tags']):
-                    output.append(value.name)
-                    continue
-                if tags['not_tags']:
-                    output.append(value.name)
-                    for tag in tags['not_tags']:
-                        if (tag in value.tags):
-                            output.remove(value.name)
-                            break
-                for tag in tags['any_tags']:
-                    if tag in value.tags:
-                        output.append(value.name)
-                        break
-            else:
-                output.append(value.name)
 
-        return output
+class TimedOut(HTTPError):
+    """ the script ran past its timeout and was killed """
+
+    def __init__(self, script, retcode):
+        HTTPError.__init__(self, 504, "Script '{0}' timed out after {1} seconds".format(script.name, script.timeout))
+        self.retcode = retcode
+        self.response = None
+
+
+class Deadline(object):
+    """ terminates, then kills, a child's whole process group if it runs too long """
+
+    def __init__(self, child, readers, timeout, io_loop=None):
+        self.child = child
+        self.readers = readers
+        self.io_loop = io_loop or IOLoop.instance()
+        self.expired = False
+        self.handle = self.io_loop.add_timeout(time.time() + timeout, self.terminate)
+
+    def terminate(self):
+        log.warn("Child with pid {0} timed out, sending SIGTERM".format(self.child.pid))
+        self.expired = True
+        self.signal(signal.SIGTERM)
+        self.handle = self.io_loop.add_timeout(time.time() + KILL_GRACE, self.kill)
+
+    def kill(self):
+        log.warn("Child with pid {0} is still running, sending SIGKILL".format(self.child.pid))
+        self.signal(signal.SIGKILL)
+        self.handle = self.io_loop.add_timeout(time.time() + KILL_GRACE, self.abandon)
+
+    def abandon(self):
+        # something that left the process group still has the pipes open
+        log.warn("Abandoning the output of child with pid {0}".format(self.child.pid))
+        self.handle = None
+        for reader in self.readers:
+            reader.abandon()
+
+    def signal(self, signum):
+        try:
+            os.killpg(self.child.pid, signum)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    def cancel(self):
+        if self.handle is not None:
+            self.io_loop.remove_timeout(self.handle)
+            self.handle = None
 
 
 class Script(object):
     """ a single script in the directory """
     
-    def __init__(self, filename, name, description, params, filtered_params, tags, http_method, output, needs_lock):
-        self.lock = toro.Lock()
+    def __init__(self, filename, name, description, params, filtered_params, tags, http_method, output, needs_lock,
+                 max_concurrency=None, cache_ttl=None, coalesce=False, max_output=None, timeout=None,
+                 persistent=False, pool_size=None, max_requests=None, max_memory=None, lock_timeout=None, lock_key=None,
+                 priority=None, rate_limit=None):
         self.filename = filename
         self.name = name
         self.description = description
@@ -85,8 +247,34 @@ class Script(object):
         self.filtered_params = filtered_params
         self.tags = tags
         self.http_method = http_method
-        self.needs_lock = needs_lock
+        self.needs_lock = needs_lock or bool(lock_key)
+        self.lock_timeout = lock_timeout or config['lock_timeout']
+        self.lock_key = lock_key
+        self.priority = priority or DEFAULT_PRIORITY
+        self.rate_limit = rate_limit and tuple(rate_limit)
         self.output = output
+        self.max_concurrency = max_concurrency
+        self.cache_ttl = cache_ttl
+        self.coalesce = coalesce
+        self.max_output = max_output or config['max_output']
+        self.timeout = timeout or config['timeout']
+        self.persistent = persistent
+        self.pool_size = pool_size or DEFAULT_POOL_SIZE
+        self.max_requests = max_requests
+        self.max_memory = max_memory
+        self.in_flight = {}
+        self.slots = scheduler().create_slots(self)
+
+        # long lived children, fed requests over stdin, instead of a child per request
+        self.pool = None
+        if persistent:
+            self.pool = CoprocessPool(self, self.pool_size[0], self.pool_size[1], max_requests, max_memory)
+
+    def close(self):
+        """ stop any persistent children, once the script has been removed or replaced """
+
+        if self.pool is not None:
+            self.pool.stop()
 
     def filter_params(self, params):
         filtered_params = dict(params)
@@ -95,53 +283,215 @@ class Script(object):
                 filtered_params[k] = 'FILTERED'
         return filtered_params
 
-    @gen.engine
-    def execute(self, params, callback):
-        log.info("Executing script: {0} with params: {1}".format(self.filename, self.filter_params(params)))
+    @gen.coroutine
+    def execute(self, params, on_lines=None, user=None, priority=None, abandoned=None):
+        """
+        run the script, returning a future for its buffered output
+
+        if on_lines is given the output is streamed to it instead, and the future
+        only has the return code.  user and priority decide its place in the queue,
+        the priority defaults to the script's own.  resolving the abandoned future
+        gives up on a run still waiting for its lock or a slot.  each run is logged
+        to pyjojo.execution once it's over.
+        """
+
+        started = time.time()
         
+        if on_lines is None:
+            run = functools.partial(self.do_execute, params)
+        else:
+            run = functools.partial(self.do_stream, params, on_lines)
+
+        try:
+            # identical requests in flight at the same time can share one child, which
+            # one of them going away mustn't give up on
+            if (on_lines is None) and self.coalesce:
+                key = repr(sorted(self.create_env(params).items()))
+                response = yield single_flight(self.in_flight, key, functools.partial(self.run_guarded, run, params, user, priority))
+            else:
+                response = yield self.run_guarded(run, params, user, priority, abandoned)
+        except TimedOut as e:
+            log_execution(self, user, params, started, e.retcode, 'timed_out', priority)
+            raise
+        except Exception as e:
+            log_execution(self, user, params, started, None, 'failed', priority, error=str(e))
+            raise
+
+        retcode = response if on_lines is not None else response[0]
+        log_execution(self, user, params, started, retcode, 'finished', priority)
+
+        raise gen.Return(response)
+
+    def run_guarded(self, run, params, user, priority, abandoned=None):
+        """ run under the lock, if the script needs one """
+
+        queued = time.time()
+        priority = priority or self.priority
+
         if self.needs_lock:
-            with (yield gen.Task(self.lock.aquire)):
-                response = yield gen.Task(self.do_execute, params)
+            return self.run_locked(run, queued, params, user, priority, abandoned)
         else:
-            response = yield gen.Task(self.do_execute, params)
+            return self.run_admitted(run, queued, user, priority, abandoned)
+
+    @gen.coroutine
+    def run_locked(self, run, queued, params, user, priority, abandoned=None):
+        """ run while holding the script's lock, which the file backend shares with other processes """
+
+        name, key = self.lock_name(params)
+        lock = locks().get(name, key)
+        yield lock.acquire(user, self.lock_timeout, abandoned)
+        try:
+            response = yield self.run_admitted(run, queued, user, priority, abandoned)
+        finally:
+            lock.release()
+
+        raise gen.Return(response)
+
+    def lock_name(self, params):
+        """ the name of the lock to run under, and the parameters that picked it for a lock_key """
+
+        if not self.lock_key:
+            return self.name, None
 
-        callback(response)
+        key = OrderedDict((name, unicode(params.get(name, ''))) for name in self.lock_key)
+        digest = hashlib.sha1(json.dumps(key.items())).hexdigest()[:16]
+        return "{0}.{1}".format(self.name, digest), key
+
+    @gen.coroutine
+    def run_admitted(self, run, queued, user, priority, abandoned=None):
+        """ run once the scheduler has a slot for us """
+
+        admitted = yield gen.Task(scheduler().admit, self, user, priority, abandoned=abandoned)
+        if not admitted:
+            if (abandoned is not None) and abandoned.done():
+                raise Abandoned(self.name)
+            raise scheduler().rejection(self)
+
+        waited = time.time() - queued
+        metrics().wait_seconds.observe((self.name,), waited)
+        metrics().user_wait_seconds.observe((user or '', priority), waited)
+
+        try:
+            response = yield run()
+        finally:
+            scheduler().release(self)
+
+        raise gen.Return(response)
+
+    @gen.coroutine
+    def do_execute(self, params):
+        """ run the script, collecting its output, which spills to disk past max_output bytes """
+
+        output_id = uuid.uuid4().hex
+        buffers = {
+            'stdout': OutputBuffer(output_id, 'stdout', self.max_output),
+            'stderr': OutputBuffer(output_id, 'stderr', self.max_output)
+        }
+
+        def on_lines(stream, lines, resume):
+            buffers[stream].add(lines, resume)
+
+        def response(retcode):
+            if self.output == 'combined':
+                return (retcode, buffers['stdout'].finish())
+            else:
+                return (retcode, buffers['stdout'].finish(), buffers['stderr'].finish())
+
+        try:
+            retcode = yield self.do_stream(params, on_lines)
+        except TimedOut as e:
+            # hand back whatever it managed to write
+            e.response = response(e.retcode)
+            raise
+
+        raise gen.Return(response(retcode))
+
+    @gen.coroutine
+    def do_stream(self, params, on_lines):
+        """ run the script, handing output lines to on_lines(stream, lines, resume) as they arrive """
+
+        if self.pool is not None:
+            retcode = yield self.do_persistent(params, on_lines)
+            raise gen.Return(retcode)
 
-    @gen.engine
-    def do_execute(self, params, callback):
         env = self.create_env(params)
-        
-        if self.output == 'combined':
-            child = Subprocess(
-                    self.filename,
-                    env=env,
-                    stdout=Subprocess.STREAM,
-                    stderr=subprocess.STDOUT,
-                    io_loop=IOLoop.instance()
-                )
-        
-            retcode, stdout = yield [
-                gen.Task(child.set_exit_callback),
-                gen.Task(child.stdout.read_until_close)
-            ]
-            
-            callback((child.returncode, stdout.split()))
+
+        # each child gets its own process group, so a timeout can kill everything it started
+        started = time.time()
+        if config['spawner'] == 'helper':
+            child, error = yield gen.Task(spawner().spawn, self.filename, env, self.output == 'combined')
+            if child is None:
+                raise HTTPError(500, "Unable to start script '{0}': {1}".format(self.name, error))
         else:
             child = Subprocess(
                     self.filename,
                     env=env,
-                    stdout=Subprocess.STREAM,
-                    stderr=Subprocess.STREAM,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT if self.output == 'combined' else subprocess.PIPE,
+                    preexec_fn=os.setsid,
                     io_loop=IOLoop.instance()
                 )
-        
-            retcode, stdout, stderr = yield [
-                gen.Task(child.set_exit_callback),
-                gen.Task(child.stdout.read_until_close),
-                gen.Task(child.stderr.read_until_close)
-            ]
-            
-            callback((child.returncode, stdout.splitlines(), stderr.splitlines()))
+        spawned = time.time()
+
+        readers = [LineReader(child.stdout, 'stdout', on_lines)]
+        if self.output != 'combined':
+            readers.append(LineReader(child.stderr, 'stderr', on_lines))
+
+        deadline = None
+        if self.timeout:
+            deadline = Deadline(child, readers, self.timeout)
+
+        yield [gen.Task(child.set_exit_callback)] + [gen.Task(reader.read_until_close) for reader in readers]
+
+        output_bytes = dict((reader.name, reader.bytes_read) for reader in readers)
+        self.record_run(child.returncode, output_bytes, spawned - started, time.time() - spawned)
+
+        if deadline is not None:
+            deadline.cancel()
+            if deadline.expired:
+                raise TimedOut(self, child.returncode)
+
+        raise gen.Return(child.returncode)
+
+    @gen.coroutine
+    def do_persistent(self, params, on_lines):
+        """ hand the request to one of the script's persistent children, passing on the output from its reply """
+
+        started = time.time()
+        message = {'params': dict((param['name'], params.get(param['name'], '')) for param in self.params)}
+
+        reply, timed_out = yield self.pool.run(message, self.timeout)
+
+        if timed_out:
+            raise TimedOut(self, None)
+
+        if reply is None:
+            raise HTTPError(502, "Persistent child for script '{0}' failed to answer".format(self.name))
+
+        output = OrderedDict()
+        output['stdout'] = reply_lines(reply.get('stdout'))
+        output['stderr'] = reply_lines(reply.get('stderr'))
+        if self.output == 'combined':
+            output = {'stdout': output['stdout'] + output['stderr']}
+
+        for stream, lines in output.items():
+            if lines:
+                yield gen.Task(lambda callback: on_lines(stream, lines, callback))
+
+        retcode = reply.get('retcode', 0)
+        output_bytes = dict((stream, sum(len(line) + 1 for line in lines)) for stream, lines in output.items())
+        self.record_run(retcode, output_bytes, None, time.time() - started)
+
+        raise gen.Return(retcode)
+
+    def record_run(self, retcode, output_bytes, spawn_time, run_time):
+        recorder = metrics()
+        if spawn_time is not None:
+            recorder.spawn_seconds.observe((self.name,), spawn_time)
+        recorder.run_seconds.observe((self.name,), run_time)
+        recorder.retcodes.inc((self.name, str(retcode)))
+        for stream, count in output_bytes.items():
+            recorder.output_bytes.inc((self.name, stream), count)
 
     def create_env(self, input):
         output = {}
@@ -164,7 +514,20 @@ class Script(object):
             "filtered_params": self.filtered_params,
             "tags": self.tags,
             "output": self.output,
-            "lock": self.needs_lock
+            "lock": self.needs_lock,
+            "lock_timeout": self.lock_timeout,
+            "lock_key": self.lock_key,
+            "priority": self.priority,
+            "rate_limit": self.rate_limit,
+            "max_concurrency": self.max_concurrency,
+            "cache": self.cache_ttl,
+            "coalesce": self.coalesce,
+            "max_output": self.max_output,
+            "timeout": self.timeout,
+            "persistent": self.persistent,
+            "pool_size": self.pool_size,
+            "max_requests": self.max_requests,
+            "max_memory": self.max_memory
         }
 
     def __repr__(self):
@@ -176,29 +539,170 @@ def create_collection(directory):
     log.info("Getting scripts from directory {0}".format(directory))
     
     collection = ScriptCollection()
+
+    found = scan_directory(directory)
+    parsed = parse_files(found, load_manifest(config['manifest']))
     
+    for full_path, (name, signature) in found.items():
+        log.info("Adding script with name: {0} and path: {1}".format(name, full_path))
+        collection.add(name, full_path, signature, parsed[full_path])
+
+    save_manifest(config['manifest'], collection)
+
+    return collection
+
+
+def update_collection(collection, directory):
+    """
+    rescan the directory, only re-parsing the files that were added or changed
+
+    returns a new collection, sharing the unchanged scripts with the old one,
+    and the names of the scripts that were added, modified and removed
+    """
+
+    log.info("Updating scripts from directory {0}".format(directory))
+
+    found = scan_directory(directory)
+
+    known = {}
+    for full_path, (name, signature, fields) in collection.files.items():
+        known[full_path] = (signature, fields)
+
+    parsed = parse_files(found, known)
+
+    updated = ScriptCollection(collection)
+    updated.files = dict(collection.files)
+
+    for full_path, (name, signature, fields) in collection.files.items():
+        if found.get(full_path) == (name, signature):
+            continue
+
+        del updated.files[full_path]
+        updated.changed()
+        if (name in updated) and (updated[name].filename == full_path):
+            del updated[name]
+
+    for full_path, (name, signature) in found.items():
+        if full_path in updated.files:
+            continue
+
+        log.info("Adding script with name: {0} and path: {1}".format(name, full_path))
+        updated.add(name, full_path, signature, parsed[full_path])
+
+    changes = {
+        "added": sorted(set(updated) - set(collection)),
+        "removed": sorted(set(collection) - set(updated)),
+        "modified": sorted(name for name in updated if (name in collection) and (updated[name] is not collection[name]))
+    }
+
+    save_manifest(config['manifest'], updated)
+
+    return updated, changes
+
+
+def parse_files(found, known):
+    """ parse the jojo blocks of the files whose signature we don't already know, in parallel """
+
+    parsed = {}
+    unknown = []
+
+    for full_path, (name, signature) in found.items():
+        if (full_path in known) and (known[full_path][0] == signature):
+            parsed[full_path] = known[full_path][1]
+        else:
+            unknown.append(full_path)
+
+    if unknown:
+        with ThreadPoolExecutor(config['threads']) as pool:
+            for full_path, fields in zip(unknown, pool.map(parse_script, unknown)):
+                parsed[full_path] = fields
+
+    return parsed
+
+
+def load_manifest(filename):
+    """ the jojo blocks parsed by an earlier run, keyed by path, with the signature they were parsed from """
+
+    if (filename is None) or (not os.path.exists(filename)):
+        return {}
+
+    try:
+        with open(filename) as f:
+            manifest = json.load(f)
+    except (IOError, ValueError) as e:
+        log.error("Unable to read the manifest {0}, ignoring it: {1}".format(filename, e))
+        return {}
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        log.info("The manifest {0} is from another version of pyjojo, ignoring it".format(filename))
+        return {}
+
+    known = {}
+    for full_path, entry in manifest['files'].items():
+        known[full_path] = (tuple(entry['signature']), entry['script'])
+
+    return known
+
+
+def save_manifest(filename, collection):
+    """ save the parsed jojo blocks, so the next start doesn't have to parse unchanged files """
+
+    if filename is None:
+        return
+
+    manifest = {'version': MANIFEST_VERSION, 'files': {}}
+    for full_path, (name, signature, fields) in collection.files.items():
+        manifest['files'][full_path] = {'signature': signature, 'script': fields}
+
+    # write to a temporary file first, so a crash can't leave half a manifest
+    temp_filename = "{0}.{1}".format(filename, os.getpid())
+    try:
+        with open(temp_filename, 'w') as f:
+            json.dump(manifest, f)
+        os.rename(temp_filename, filename)
+    except (IOError, OSError) as e:
+        log.error("Unable to write the manifest {0}: {1}".format(filename, e))
+
+
+def scan_directory(directory):
+    """ find the files in the directory, keyed by path, with their script name and a signature of their stat """
+
+    found = OrderedDict()
+
     for (dirpath, _, filenames) in os.walk(directory):                
         for filename in filenames:
             # grab the file's absolute path, and name
             path = os.path.join(dirpath, filename)
             full_path = os.path.abspath(path)
 
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+
             # format the name for sanity
             name = path.replace(directory + os.sep, '')
             name = '.'.join(name.split(".")[:-1])
             name = re.sub(r'(\W)+', '_', name)
-            
-            log.info("Adding script with name: {0} and path: {1}".format(name, full_path))
-            script = create_script(name, full_path)
-            
-            if script is not None:
-                collection[name] = script
 
-    return collection
+            found[full_path] = (name, (stat.st_mtime, stat.st_size, stat.st_ino, stat.st_mode))
+
+    return found
 
 
 def create_script(script_name, filename):
     """ parse a script, returning a Script object """
+
+    fields = parse_script(filename)
+
+    if fields is None:
+        return None
+
+    return Script(filename, script_name, **fields)
+
+
+def parse_script(filename):
+    """ parse a script's jojo block, returning the fields for its Script, or None if it can't be run """
     
     # script defaults
     description = None
@@ -208,111 +712,298 @@ def create_script(script_name, filename):
     http_method = 'post'
     output = 'split'
     lock = False
+    lock_timeout = None
+    lock_key = None
+    priority = None
+    rate_limit = None
+    max_concurrency = None
+    cache_ttl = None
+    coalesce = False
+    max_output = None
+    timeout = None
+    persistent = False
+    pool_size = None
+    max_requests = None
+    max_memory = None
     
     # warn the user if we can't execute this file
     if not os.access(filename, os.X_OK):
         log.error("file with filename {0} is not executable, Ignoring.".format(filename))
         return None
     
-    # grab file contents
-    with open(filename) as f:
-        contents = list(f)
-    
     in_block = False
+    header_bytes = 0
+    lineno = 0
     
-    # loop over the contents of the file
-    for line in contents:        
+    # loop over the lines of the file, the jojo block is near the top so we stop at the end of it
+    with open(filename) as f:
+        # don't read a whole file looking for a block that isn't there
+        while header_bytes < MAX_HEADER_BYTES:
+            line = f.readline(MAX_HEADER_BYTES - header_bytes)
+            if not line:
+                break
+            header_bytes += len(line)
+            lineno += 1
         
-        # all lines should be bash style comments
-        if not line.startswith("#"):
-            continue
+            # all lines should be bash style comments
+            if not line.startswith("#"):
+                continue
                 
-        # we don't need the first comment, or extranious whitespace
-        line = line.replace("#", "").strip()
+            # we don't need the first comment, or extranious whitespace
+            line = line.replace("#", "").strip()
         
-        # start of the jojo block
-        if not in_block and line.startswith("-- jojo --"):
-            in_block = True
-            continue
+            # start of the jojo block
+            if not in_block and line.startswith("-- jojo --"):
+                in_block = True
+                continue
         
-        # end of the jojo block, so we'll stop here
-        if in_block and line.startswith("-- jojo --"):
-            in_block = False
-            break
+            # end of the jojo block, so we'll stop here
+            if in_block and line.startswith("-- jojo --"):
+                in_block = False
+                break
         
-        # make sure the line is good
-        if not ':' in line:
-            continue
+            # comments outside of the block are none of our business
+            if not in_block:
+                continue
+
+            # make sure the line is good
+            if not ':' in line:
+                if line:
+                    warn_line(filename, lineno, "skipping line without a field", line)
+                continue
         
-        # prep work for later
-        key, value = [item.strip() for item in line.split(':')]
+            # prep work for later, values can have colons of their own
+            key, value = [item.strip() for item in line.split(':', 1)]
         
-        # description
-        if in_block and key == "description":
-            description = value
-            continue
+            # description
+            if in_block and key == "description":
+                description = value
+                continue
+        
+            # http_method
+            if in_block and key == "http_method":
+                if value.lower() in ['get','post','put','delete']:
+                    http_method = value.lower()
+                    continue
+                else:
+                    warn_line(filename, lineno, "unrecognized http_method type", value.lower())
+                    continue
         
-        # http_method
-        if in_block and key == "http_method":
-            if value.lower() in ['get','post','put','delete']:
-                http_method = value.lower()
+            # output
+            if in_block and key == "output":
+                if value.lower() in ['split','combined']:
+                    output = value.lower()
+                    continue
+                else:
+                    warn_line(filename, lineno, "unrecognized output type", value.lower())
+                    continue
+        
+            # param
+            if in_block and key == "param":
+                # handle the optional description
+                if "-" in value:
+                    name, desc = [item.strip() for item in value.split('-', 1)]
+                    params.append({'name': name, 'description': desc})
+                    continue
+            
+                params.append({'name': value})
                 continue
-            else:
-                log.warn("unrecognized http_method type in jojo block: {0}".format(value.lower()))
+
+            # filtered_params
+            if in_block and key == "filtered_params":
+                filter_values = [filter_value.strip() for filter_value in value.split(',')]
+                if len(filter_values) > 1:
+                    for filter_value in filter_values:
+                        filtered_params.append(filter_value)
+                    continue
+
+                filtered_params.append(value)
+                continue
+
+            # tags
+            if in_block and key == "tags":
+                tag_values = [tag_value.strip() for tag_value in value.split(',')]
+                if len(tag_values) > 1:
+                    for tag_value in tag_values:
+                        tags.append(tag_value)
+                    continue
+
+                tags.append(value)
                 continue
         
-        # output
-        if in_block and key == "output":
-            if value.lower() in ['split','combined']:
-                output = value.lower()
+            # lock
+            if in_block and key == "lock":
+                lock = (value == "True")
                 continue
-            else:
-                log.warn("unrecognized output type in jojo block: {0}".format(value.lower()))
+
+            # lock_key, the params that pick which lock to take
+            if in_block and key == "lock_key":
+                lock_key = [name.strip() for name in value.split(',') if name.strip()]
                 continue
-        
-        # param
-        if in_block and key == "param":
-            # handle the optional description
-            if "-" in value:
-                name, desc = [item.strip() for item in value.split('-')]
-                params.append({'name': name, 'description': desc})
+
+            # priority
+            if in_block and key == "priority":
+                if value in PRIORITIES:
+                    priority = value
+                else:
+                    warn_line(filename, lineno, "unrecognized priority", value)
                 continue
-            
-            params.append({'name': value})
-            continue
 
-        # filtered_params
-        if in_block and key == "filtered_params":
-            filter_values = [filter_value.strip() for filter_value in value.split(',')]
-            if len(filter_values) > 1:
-                for filter_value in filter_values:
-                    filtered_params.append(filter_value)
+            # lock_timeout
+            if in_block and key == "lock_timeout":
+                try:
+                    lock_timeout = float(value)
+                except ValueError:
+                    warn_line(filename, lineno, "unrecognized lock_timeout", value)
                 continue
 
-            filtered_params.append(value)
-            continue
+            # rate_limit, requests a second or a minute or an hour, with an optional burst
+            if in_block and key == "rate_limit":
+                try:
+                    rate_limit = parse_rate(value)
+                except ValueError:
+                    warn_line(filename, lineno, "unrecognized rate_limit", value)
+                continue
+
+            # max_concurrency
+            if in_block and key == "max_concurrency":
+                if value.isdigit() and int(value) > 0:
+                    max_concurrency = int(value)
+                    continue
+                else:
+                    warn_line(filename, lineno, "unrecognized max_concurrency", value)
+                    continue
 
-        # tags
-        if in_block and key == "tags":
-            tag_values = [tag_value.strip() for tag_value in value.split(',')]
-            if len(tag_values) > 1:
-                for tag_value in tag_values:
-                    tags.append(tag_value)
+            # cache
+            if in_block and key == "cache":
+                try:
+                    cache_ttl = float(value)
+                except ValueError:
+                    warn_line(filename, lineno, "unrecognized cache ttl", value)
                 continue
 
-            tags.append(value)
-            continue
-        
-        # lock
-        if in_block and key == "lock":
-            lock = (value == "True")
-            continue
+            # coalesce
+            if in_block and key == "coalesce":
+                coalesce = (value == "True")
+                continue
+
+            # max_output
+            if in_block and key == "max_output":
+                max_output = parse_size(value)
+                if max_output is None:
+                    warn_line(filename, lineno, "unrecognized max_output", value)
+                continue
+
+            # timeout
+            if in_block and key == "timeout":
+                try:
+                    timeout = float(value)
+                except ValueError:
+                    warn_line(filename, lineno, "unrecognized timeout", value)
+                continue
+
+            # persistent
+            if in_block and key == "persistent":
+                persistent = (value == "True")
+                continue
+
+            # pool_size, either a number or min-max
+            if in_block and key == "pool_size":
+                sizes = [size.strip() for size in value.split('-', 1)]
+                if all(size.isdigit() for size in sizes) and int(sizes[-1]) > 0:
+                    pool_size = (int(sizes[0]), int(sizes[-1]))
+                else:
+                    warn_line(filename, lineno, "unrecognized pool_size", value)
+                continue
+
+            # max_requests
+            if in_block and key == "max_requests":
+                if value.isdigit() and int(value) > 0:
+                    max_requests = int(value)
+                else:
+                    warn_line(filename, lineno, "unrecognized max_requests", value)
+                continue
+
+            # max_memory
+            if in_block and key == "max_memory":
+                max_memory = parse_size(value)
+                if max_memory is None:
+                    warn_line(filename, lineno, "unrecognized max_memory", value)
+                continue
         
-        log.warn("unrecognized line in jojo block: {0}".format(line))
-    
+            warn_line(filename, lineno, "unrecognized line", line)
     # if in_bock is true, then we never got an end to the block, which is bad
     if in_block:
         log.error("file with filename {0} is missing an end block, Ignoring".format(filename))
         return None
     
-    return Script(filename, script_name, description, params, filtered_params, tags, http_method, output, lock)
+    return {
+        "description": description,
+        "params": params,
+        "filtered_params": filtered_params,
+        "tags": tags,
+        "http_method": http_method,
+        "output": output,
+        "needs_lock": lock,
+        "lock_timeout": lock_timeout,
+        "lock_key": lock_key_params(lock_key, params, filename),
+        "priority": priority,
+        "rate_limit": rate_limit,
+        "max_concurrency": max_concurrency,
+        "cache_ttl": cache_ttl,
+        "coalesce": coalesce,
+        "max_output": max_output,
+        "timeout": timeout,
+        "persistent": persistent,
+        "pool_size": pool_size,
+        "max_requests": max_requests,
+        "max_memory": max_memory
+    }
+
+
+def warn_line(filename, lineno, message, value):
+    """ point at the line of a jojo block that couldn't be used """
+
+    log.warn("{0} in jojo block of {1}, line {2}: {3}".format(message, filename, lineno, value))
+
+
+def lock_key_params(lock_key, params, filename):
+    """ the declared params named by a lock_key, in any case, since they're passed in the environment upper cased """
+
+    if not lock_key:
+        return None
+
+    names = dict((param['name'].lower(), param['name']) for param in params)
+    for name in lock_key:
+        if name.lower() not in names:
+            log.warn("lock_key in {0} names an unknown param: {1}".format(filename, name))
+
+    return [names.get(name.lower(), name) for name in lock_key]
+
+
+def reply_lines(output):
+    """ output from a persistent child's reply, which may be a string or a list of lines """
+
+    if not output:
+        return []
+
+    if isinstance(output, basestring):
+        return output.rstrip('\n').split('\n')
+
+    return [unicode(line) for line in output]
+
+
+def parse_size(value):
+    """ parse a size in bytes, with an optional K, M or G suffix, returning None if it isn't one """
+
+    multiplier = 1
+    value = value.strip().upper()
+
+    if value[-1:] in SIZE_SUFFIXES:
+        multiplier = SIZE_SUFFIXES[value[-1]]
+        value = value[:-1]
+
+    if not value.isdigit():
+        return None
+
+    return int(value) * multiplier
@@ -1,12 +1,17 @@
 #!/usr/bin/env python
 
 import logging
+import signal
 
 from tornado.ioloop import IOLoop
 
+from pyjojo.config import config
+from pyjojo.metrics import share_metrics
 from pyjojo.options import command_line_options
 from pyjojo.util import setup_logging, create_application
-from pyjojo.servers import http_server, https_server, unix_socket_server
+from pyjojo.servers import bind, http_server, https_server, unix_socket_server
+from pyjojo.supervisor import Supervisor
+from pyjojo.tempdirs import make_temp_dir, remove_temp_dirs
 
 log = logging.getLogger(__name__)
 
@@ -17,22 +22,66 @@ def main():
     options = command_line_options()
     setup_logging()
 
-    # setup the application
-    log.info("Setting up the application")
-    application = create_application(options.debug)
-
     # warn about --force-json
     if options.force_json:
         log.warn("Application started with '--force-json' option.  All calls will be treated as if they passed the 'Content-Type: application/json' header.  This may cause unexpected behavior.")
 
+    # autoreload can't cope with more than one process
+    if options.debug and options.workers > 1:
+        log.warn("Debug mode only supports one worker process, ignoring '--workers'.")
+        options.workers = config['workers'] = 1
+
+    # workers have to share locks, spilled output and jobs through the filesystem
+    if (options.workers > 1 or config['lock_backend'] == 'file') and config['lock_dir'] is None:
+        config['lock_dir'] = make_temp_dir('pyjojo-locks-')
+    if options.workers > 1 and config['spill_dir'] is None:
+        config['spill_dir'] = make_temp_dir('pyjojo-output-')
+    if options.workers > 1 and config['job_dir'] is None:
+        config['job_dir'] = make_temp_dir('pyjojo-jobs-')
+    if options.workers > 1:
+        config['metrics_dir'] = make_temp_dir('pyjojo-metrics-')
+
+    # bind before forking, so every worker shares the sockets
+    sockets = bind(options)
+
+    try:
+        if options.workers > 1:
+            Supervisor(options.workers, lambda worker_id: start_worker(sockets, options, worker_id)).run()
+        else:
+            start_worker(sockets, options)
+    finally:
+        # the supervisor only gets here once every worker has gone
+        remove_temp_dirs()
+
+def start_worker(sockets, options, worker_id=None):
+    """ set up the application and serve it on the sockets """
+
+    # each worker keeps its own metrics, and adds up everyone's for /metrics
+    if worker_id is not None:
+        share_metrics(config['metrics_dir'], worker_id)
+
+    # setup the application
+    log.info("Setting up the application")
+    application = create_application(options.debug)
+
     # server startup
     if options.unix_socket:
-        unix_socket_server(application, options)
+        unix_socket_server(application, sockets, options)
     elif options.certfile and options.keyfile:
-        https_server(application, options)
+        https_server(application, sockets, options)
     else:
-        http_server(application, options)
+        http_server(application, sockets, options)
+
+    # reload the scripts on SIGHUP
+    reloader = application.settings['reloader']
+    signal.signal(signal.SIGHUP, lambda signum, frame: IOLoop.instance().add_callback_from_signal(reloader.reload))
+
+    # stop cleanly on SIGTERM, so the temporary directories are removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: IOLoop.instance().add_callback_from_signal(IOLoop.instance().stop))
 
     # start the ioloop
     log.info("Starting the IOLoop")
-    IOLoop.instance().start()
+    try:
+        IOLoop.instance().start()
+    finally:
+        remove_temp_dirs()
@@ -4,14 +4,23 @@ import logging
 import sys
 
 from tornado.httpserver import HTTPServer
-from tornado.netutil import bind_unix_socket
+from tornado.netutil import bind_sockets, bind_unix_socket
 
 log = logging.getLogger(__name__)
 
-def https_server(application, options):
+def bind(options):
+    """ bind the listening sockets, before any worker processes are forked """
+
+    if options.unix_socket:
+        log.info("Binding application to unix socket {0}".format(options.unix_socket))
+        return [bind_unix_socket(options.unix_socket)]
+
+    log.info("Binding application to port {0}".format(options.port))
+    return bind_sockets(options.port, options.address)
+
+def https_server(application, sockets, options):
     """ https server """
 
-    log.info("Binding application to unix socket {0}".format(options.unix_socket))
     if sys.version_info < (2,7,0):
         server = HTTPServer(application, ssl_options={
             "certfile": options.certfile,
@@ -23,21 +32,17 @@ def https_server(application, options):
             "keyfile": options.keyfile,
             "ciphers": "HIGH,MEDIUM"
         })
-    server.bind(options.port, options.address)
-    server.start()
+    server.add_sockets(sockets)
 
-def http_server(application, options):
+def http_server(application, sockets, options):
     """ http server """
 
     log.warn("Application is running in HTTP mode, this is insecure.  Pass in the --certfile and --keyfile to use SSL.")
     server = HTTPServer(application)
-    server.bind(options.port, options.address)
-    server.start()
+    server.add_sockets(sockets)
 
-def unix_socket_server(application, options):
+def unix_socket_server(application, sockets, options):
     """ unix socket server """
 
-    log.info("Binding application to unix socket {0}".format(options.unix_socket))
     server = HTTPServer(application)
-    socket = bind_unix_socket(options.unix_socket)
-    server.add_socket(socket)
+    server.add_sockets(sockets)
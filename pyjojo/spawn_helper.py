@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""
+a tiny process that starts children for pyjojo
+
+it runs in a fresh interpreter, so forking it stays cheap however large the
+server grows.  it only uses the standard library, and is run by path.
+
+requests come in on stdin and replies go out on stdout, one json object a line:
+
+    {"id": 1, "filename": "/srv/pyjojo/echo.sh", "env": {...}, "stdout": "/tmp/.../1.out", "stderr": "/tmp/.../1.err"}
+    {"id": 1, "pid": 1234}
+    {"id": 1, "retcode": 0}
+
+stdout and stderr are fifos the server already has open for reading.  a
+request that can't be started is answered with {"id": 1, "error": "..."}
+"""
+
+import errno
+import fcntl
+import json
+import os
+import select
+import signal
+import sys
+
+MAXFD = os.sysconf('SC_OPEN_MAX')
+
+
+def main():
+    children = {}
+    pending = ''
+
+    # SIGCHLD wakes up the select through a pipe
+    wake_r, wake_w = os.pipe()
+    for fd in (wake_r, wake_w):
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+    signal.set_wakeup_fd(wake_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    while True:
+        try:
+            readable = select.select([0, wake_r], [], [])[0]
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+
+        if wake_r in readable:
+            drain(wake_r)
+            reap(children)
+
+        if 0 in readable:
+            data = os.read(0, 65536)
+
+            # the server is gone
+            if not data:
+                return
+
+            pending += data
+            while '\n' in pending:
+                line, pending = pending.split('\n', 1)
+                spawn(json.loads(line), children)
+
+
+def spawn(request, children):
+    stdout = stderr = None
+
+    try:
+        stdout = os.open(request['stdout'], os.O_WRONLY)
+        stderr = stdout
+        if request.get('stderr'):
+            stderr = os.open(request['stderr'], os.O_WRONLY)
+
+        env = dict((key.encode('utf-8'), value.encode('utf-8')) for key, value in request['env'].items())
+        filename = request['filename'].encode('utf-8')
+
+        pid = os.fork()
+    except OSError as e:
+        reply({'id': request['id'], 'error': str(e)})
+        close(stdout, stderr)
+        return
+
+    if pid == 0:
+        try:
+            os.setsid()
+            null = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(null, 0)
+            os.dup2(stdout, 1)
+            os.dup2(stderr, 2)
+            os.closerange(3, MAXFD)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            os.execve(filename, [filename], env)
+        except BaseException as e:
+            os.write(2, "Unable to run {0}: {1}\n".format(filename, e))
+        finally:
+            os._exit(127)
+
+    close(stdout, stderr)
+    children[pid] = request['id']
+    reply({'id': request['id'], 'pid': pid})
+
+
+def reap(children):
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except OSError as e:
+            if e.errno == errno.ECHILD:
+                return
+            raise
+
+        if pid == 0:
+            return
+
+        if pid in children:
+            if os.WIFSIGNALED(status):
+                retcode = -os.WTERMSIG(status)
+            else:
+                retcode = os.WEXITSTATUS(status)
+            reply({'id': children.pop(pid), 'retcode': retcode})
+
+
+def reply(message):
+    data = json.dumps(message) + '\n'
+    while data:
+        try:
+            data = data[os.write(1, data):]
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+
+def drain(fd):
+    try:
+        while os.read(fd, 4096):
+            pass
+    except OSError as e:
+        if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+            raise
+
+
+def close(*fds):
+    for fd in set(fds):
+        if fd is not None:
+            os.close(fd)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
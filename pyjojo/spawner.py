@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+import json
+import logging
+import os
+import os.path
+import sys
+
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.process import Subprocess
+
+from pyjojo.tempdirs import make_temp_dir
+
+log = logging.getLogger(__name__)
+
+HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spawn_helper.py')
+
+
+class SpawnedChild(object):
+    """ a child started by the spawn helper, with the parts of Subprocess that scripts use """
+
+    def __init__(self, pid, stdout, stderr):
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        self.exited = False
+        self.exit_callback = None
+
+    def set_exit_callback(self, callback):
+        self.exit_callback = callback
+        if self.exited:
+            self.finish(self.returncode)
+
+    def finish(self, retcode):
+        self.returncode = retcode
+        self.exited = True
+
+        callback, self.exit_callback = self.exit_callback, None
+        if callback is not None:
+            callback(retcode)
+
+
+class SpawnHelper(object):
+    """
+    starts children through a small helper process instead of forking the server
+
+    the helper opens the write ends of fifos we're reading from and hands them
+    to the child, so its output comes back to us like it would over a pipe
+    """
+
+    def __init__(self, io_loop=None):
+        self.io_loop = io_loop or IOLoop.instance()
+        self.directory = make_temp_dir('pyjojo-spawn-')
+        self.helper = None
+        self.next_id = 0
+        self.pending = {}
+        self.children = {}
+
+    def start(self):
+        self.helper = Subprocess(
+                [sys.executable, HELPER],
+                stdin=Subprocess.STREAM,
+                stdout=Subprocess.STREAM,
+                io_loop=self.io_loop
+            )
+        self.helper.stdout.set_close_callback(self.helper_closed)
+        self.read_reply()
+
+        log.info("Started spawn helper with pid {0}".format(self.helper.pid))
+
+    def spawn(self, filename, env, combined, callback):
+        """ start a child, callback((child, None)) once it's running, or callback((None, error)) """
+
+        if self.helper is None:
+            self.start()
+
+        self.next_id += 1
+        spawn_id = self.next_id
+
+        request = {'id': spawn_id, 'filename': filename, 'env': env}
+        streams = {}
+        for stream in (['stdout'] if combined else ['stdout', 'stderr']):
+            path = os.path.join(self.directory, '{0}.{1}'.format(spawn_id, stream))
+            os.mkfifo(path, 0o600)
+
+            # opening the read end first lets the helper's open of the write end go through
+            streams[stream] = os.fdopen(os.open(path, os.O_RDONLY | os.O_NONBLOCK), 'rb', 0)
+            request[stream] = path
+
+        self.pending[spawn_id] = (callback, streams)
+
+        try:
+            self.helper.stdin.write(json.dumps(request) + '\n')
+        except StreamClosedError:
+            self.helper_closed()
+
+    def read_reply(self):
+        try:
+            self.helper.stdout.read_until('\n', self.replied)
+        except StreamClosedError:
+            self.helper_closed()
+
+    def replied(self, line):
+        reply = json.loads(line)
+        spawn_id = reply['id']
+
+        if 'retcode' in reply:
+            child = self.children.pop(spawn_id, None)
+            if child is not None:
+                child.finish(reply['retcode'])
+
+        elif spawn_id in self.pending:
+            callback, streams = self.pending.pop(spawn_id)
+            self.remove_fifos(spawn_id)
+
+            if 'pid' in reply:
+                child = SpawnedChild(reply['pid'], streams['stdout'], streams.get('stderr'))
+                self.children[spawn_id] = child
+                callback((child, None))
+            else:
+                for stream in streams.values():
+                    stream.close()
+                callback((None, reply.get('error')))
+
+        self.read_reply()
+
+    def helper_closed(self):
+        if self.helper is None:
+            return
+
+        log.error("Spawn helper with pid {0} exited".format(self.helper.pid))
+        self.helper = None
+
+        # children it started keep running, but we'll never hear how they exited
+        pending, self.pending = self.pending, {}
+        children, self.children = self.children, {}
+
+        for spawn_id, (callback, streams) in pending.items():
+            self.remove_fifos(spawn_id)
+            for stream in streams.values():
+                stream.close()
+            callback((None, "spawn helper exited"))
+
+        for child in children.values():
+            child.finish(None)
+
+    def remove_fifos(self, spawn_id):
+        for stream in ['stdout', 'stderr']:
+            path = os.path.join(self.directory, '{0}.{1}'.format(spawn_id, stream))
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+_spawner = None
+
+
+def spawner():
+    """ the spawn helper for this process, started on first use """
+
+    global _spawner
+
+    if _spawner is None:
+        _spawner = SpawnHelper()
+
+    return _spawner
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import errno
+import logging
+import os
+import signal
+import time
+
+log = logging.getLogger(__name__)
+
+# don't restart a worker more often than this, so a broken worker can't fork bomb us
+RESTART_DELAY = 1.0
+
+
+class Supervisor(object):
+    """ pre-forks worker processes sharing the listening sockets, restarting any that die """
+
+    def __init__(self, num_workers, start_worker):
+        self.num_workers = num_workers
+        self.start_worker = start_worker
+        self.workers = {}
+        self.stopping = False
+
+    def run(self):
+        """ start the workers and watch them until we're told to stop """
+
+        signal.signal(signal.SIGHUP, self.handle_hup)
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+
+        log.info("Starting {0} worker processes".format(self.num_workers))
+        for worker_id in range(self.num_workers):
+            self.spawn(worker_id)
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            if pid not in self.workers:
+                continue
+
+            worker_id, started = self.workers.pop(pid)
+            if self.stopping:
+                continue
+
+            log.warn("Worker {0} (pid {1}) exited with status {2}, restarting".format(worker_id, pid, status))
+            if time.time() - started < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            self.spawn(worker_id)
+
+        log.info("All workers have exited")
+
+    def spawn(self, worker_id):
+        pid = os.fork()
+
+        if pid == 0:
+            # the worker gets the default signal handling back
+            for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, signal.SIG_DFL)
+
+            try:
+                self.start_worker(worker_id)
+            except Exception:
+                log.exception("Worker {0} failed".format(worker_id))
+                os._exit(1)
+            os._exit(0)
+
+        log.info("Started worker {0} with pid {1}".format(worker_id, pid))
+        self.workers[pid] = (worker_id, time.time())
+
+    def signal_workers(self, signum):
+        for pid in self.workers:
+            try:
+                os.kill(pid, signum)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def handle_hup(self, signum, frame):
+        log.info("Got SIGHUP, telling the workers to reload")
+        self.signal_workers(signal.SIGHUP)
+
+    def handle_stop(self, signum, frame):
+        log.info("Stopping the workers")
+        self.stopping = True
+        self.signal_workers(signal.SIGTERM)
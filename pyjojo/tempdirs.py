@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+import logging
+import os
+import shutil
+import tempfile
+
+log = logging.getLogger(__name__)
+
+# (pid, path) of every temporary directory made, so forked workers leave their parent's alone
+_directories = []
+
+
+def make_temp_dir(prefix):
+    """ a temporary directory, removed by remove_temp_dirs() when the server stops """
+
+    directory = tempfile.mkdtemp(prefix=prefix)
+    _directories.append((os.getpid(), directory))
+    return directory
+
+
+def remove_temp_dirs():
+    """ remove the temporary directories this process made, and everything in them """
+
+    while _directories:
+        pid, directory = _directories.pop()
+        if pid != os.getpid():
+            continue
+
+        log.info("Removing {0}".format(directory))
+        shutil.rmtree(directory, ignore_errors=True)
@@ -3,11 +3,14 @@
 import os
 import pkgutil
 import logging
-import sys
 
 import tornado.web
 
+from pyjojo.auth import create_authenticator
 from pyjojo.config import config
+from pyjojo.jobs import create_job_table
+from pyjojo.logs import create_handler
+from pyjojo.reloader import Reloader
 from pyjojo.scripts import create_collection
 
 log = logging.getLogger(__name__)
@@ -40,13 +43,16 @@ class route(object):
 
 
 def setup_logging():
-    """ setup the logging system """
+    """ setup the logging system, writing to stdout from a background thread """
     
     base_log = logging.getLogger()
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(filename)s:%(lineno)d] %(message)s"))
+    handler = create_handler(config['log_format'], config['log_queue'])
     base_log.addHandler(handler)
-    base_log.setLevel(logging.DEBUG)
+    base_log.setLevel(config['log_level'])
+
+    for category, level in config['log_levels'].items():
+        logging.getLogger(category).setLevel(level)
+
     return handler
 
 def create_application(debug):
@@ -56,7 +62,13 @@ def create_application(debug):
     application = tornado.web.Application(
         route.get_routes(), 
         scripts=create_collection(config['directory']),
+        authenticator=create_authenticator(config['passfile']),
+        jobs=create_job_table(),
         debug=debug
     )
     
+    application.settings['reloader'] = Reloader(application, config['directory'])
+    if config['watch']:
+        application.settings['reloader'].watch()
+    
     return application
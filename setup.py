@@ -8,9 +8,9 @@ from setuptools import setup, find_packages
 
 install_requires = [
     'pyyaml==3.10',
-    'tornado==3.0.1',
-    'toro==0.5',
-    'passlib==1.6'
+    'tornado==3.1.1',
+    'passlib==1.6',
+    'futures==2.1.4'
 ]
 
 #
@@ -0,0 +1,10 @@
+#!/bin/bash
+
+# -- jojo --
+# description: looks a name up, the answer doesn't change for a while
+# param: name - name to look up
+# cache: 30
+# -- jojo --
+
+echo "looked up $NAME at $(date +%s%N)"
+exit 0
@@ -0,0 +1,11 @@
+#!/bin/bash
+
+# -- jojo --
+# description: writes more output than it's allowed to keep in memory
+# http_method: get
+# max_output: 1K
+# -- jojo --
+
+for i in $(seq 1 1000); do
+    echo "line $i"
+done
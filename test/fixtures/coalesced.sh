@@ -0,0 +1,11 @@
+#!/bin/bash
+
+# -- jojo --
+# description: takes a moment, then prints something different every run, shared by requests made meanwhile
+# param: name - name to stamp
+# coalesce: True
+# -- jojo --
+
+sleep 0.3
+echo "$NAME $$ $(date +%s%N)"
+exit 0
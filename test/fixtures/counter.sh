@@ -0,0 +1,18 @@
+#!/bin/bash
+
+# -- jojo --
+# description: answers requests over stdin, counting them, unless asked to crash
+# param: crash - exit instead of answering, if set
+# persistent: True
+# pool_size: 1
+# max_requests: 3
+# -- jojo --
+
+count=0
+while read -r request; do
+    count=$((count + 1))
+    case "$request" in
+        *'"crash": "yes"'*) exit 1 ;;
+    esac
+    echo "{\"retcode\": 0, \"stdout\": \"pid $$ request $count\"}"
+done
@@ -0,0 +1,12 @@
+#!/bin/bash
+
+# -- jojo --
+# description: takes turns with other deploys to the same host
+# param: host - where to deploy
+# tags: ops, deploy
+# lock_key: host
+# -- jojo --
+
+echo "jojo_return_value start=$(date +%s.%N)"
+sleep 0.3
+echo "jojo_return_value end=$(date +%s.%N)"
@@ -0,0 +1,9 @@
+#!/bin/bash
+
+# -- jojo --
+# description: always fails
+# tags: ops
+# -- jojo --
+
+echo 'failing'
+exit 2
@@ -0,0 +1,10 @@
+#!/bin/bash
+
+# -- jojo --
+# description: writes more output than a client can take at once, then touches a marker file
+# param: marker - file to touch once all of the output is written
+# -- jojo --
+
+head -c 20000000 /dev/zero | tr '\0' 'x' | fold -w 1000
+touch "$MARKER"
+exit 0
@@ -0,0 +1,10 @@
+#!/bin/bash
+
+# -- jojo --
+# description: gives up quickly waiting for its lock
+# http_method: get
+# lock: True
+# lock_timeout: 0.2
+# -- jojo --
+
+sleep 0.5
@@ -0,0 +1,9 @@
+#!/bin/bash
+
+# -- jojo --
+# description: may only run twice a minute
+# http_method: get
+# rate_limit: 1/m, 2
+# -- jojo --
+
+echo 'ran'
@@ -0,0 +1,15 @@
+#!/bin/bash
+
+# -- jojo --
+# description: starts children that outlive it unless they're killed, one of them ignoring SIGTERM
+# param: pidfile - file to write the children's pids to
+# timeout: 0.5
+# -- jojo --
+
+sleep 30 &
+echo $! > "$PIDFILE"
+(trap '' TERM; sleep 30) &
+echo $! >> "$PIDFILE"
+
+echo 'started'
+wait
@@ -0,0 +1,12 @@
+#!/bin/bash
+
+# -- jojo --
+# description: passes values back, one of them too large for a small --max-return-bytes
+# http_method: get
+# -- jojo --
+
+echo "jojo_return_value url=http://example.com/?a=b"
+echo 'jojo_return_json person {"name": "bob", "age": 99}'
+echo 'jojo_return_json broken {"name":'
+echo "jojo_return_value padding=$(head -c 200 /dev/zero | tr '\0' 'x')"
+echo "jojo_return_value last=here"
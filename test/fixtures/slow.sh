@@ -0,0 +1,10 @@
+#!/bin/bash
+
+# -- jojo --
+# description: runs for longer than it's allowed to
+# http_method: get
+# timeout: 0.5
+# -- jojo --
+
+echo 'started'
+sleep 30
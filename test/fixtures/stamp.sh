@@ -0,0 +1,10 @@
+#!/bin/bash
+
+# -- jojo --
+# description: takes a moment, then prints something different every run
+# param: name - name to stamp
+# -- jojo --
+
+sleep 0.3
+echo "$NAME $$ $(date +%s%N)"
+exit 0
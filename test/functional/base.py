@@ -8,6 +8,7 @@ from tornado.testing import AsyncHTTPTestCase
 
 from pyjojo.util import create_application
 from pyjojo.config import config
+from pyjojo.options import command_line_options
 
 log = logging.getLogger(__name__)
 
@@ -15,10 +16,32 @@ log = logging.getLogger(__name__)
 class BaseFunctionalTest(AsyncHTTPTestCase):
     """Base class for all functional tests"""
 
+    # command line arguments for the application, every other option is left at its default
+    options = []
+
     def get_app(self):
         # create the application
+        command_line_options(list(self.options))
         config['directory'] = 'test/fixtures'
         return create_application(False)
     
     def get_new_ioloop(self): 
         return IOLoop.instance()
+
+    def fetch_all(self, requests):
+        """ start every (path, kwargs) request at once, returning the responses in order """
+
+        client = AsyncHTTPClient(self.io_loop, force_instance=True, max_clients=len(requests))
+        responses = [None] * len(requests)
+
+        def done(index, response):
+            responses[index] = response
+            if None not in responses:
+                self.stop()
+
+        for index, (path, kwargs) in enumerate(requests):
+            client.fetch(self.get_url(path), lambda response, index=index: done(index, response), **kwargs)
+
+        self.wait(timeout=20)
+        client.close()
+        return responses
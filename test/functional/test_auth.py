@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import base64
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from passlib.apache import HtpasswdFile
+
+from pyjojo.auth import CredentialCache
+
+from test.functional.base import BaseFunctionalTest
+
+
+def basic_auth(username, password):
+    return {'Authorization': 'Basic ' + base64.b64encode('{0}:{1}'.format(username, password))}
+
+
+class AuthTest(BaseFunctionalTest):
+    """ basic auth against an htpasswd file, with the credential cache """
+
+    cache_ttl = '300'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.passfile = os.path.join(self.directory, 'htpasswd')
+
+        htpasswd = HtpasswdFile(self.passfile, new=True)
+        htpasswd.set_password('alice', 'secret')
+        htpasswd.set_password('bob', 'a:b:c')
+        htpasswd.save()
+
+        self.options = ['--auth-cache-ttl', self.cache_ttl, self.passfile]
+        BaseFunctionalTest.setUp(self)
+
+    def tearDown(self):
+        BaseFunctionalTest.tearDown(self)
+        shutil.rmtree(self.directory)
+
+    def cached(self):
+        return len(self._app.settings['authenticator'].cache.entries)
+
+    def test_challenge(self):
+        response = self.fetch('/script_names')
+        self.assertEqual(response.code, 401)
+        self.assertEqual(response.headers['WWW-Authenticate'], 'Basic realm=pyjojo')
+
+    def test_caches_good_credentials(self):
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('alice', 'secret')).code, 200)
+        self.assertEqual(self.cached(), 1)
+
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('alice', 'secret')).code, 200)
+        self.assertEqual(self.cached(), 1)
+
+    def test_bad_credentials_are_not_cached(self):
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('alice', 'wrong')).code, 401)
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('mallory', 'secret')).code, 401)
+        self.assertEqual(self.cached(), 0)
+
+    def test_colons_in_passwords(self):
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('bob', 'a:b:c')).code, 200)
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('bob', 'a:b')).code, 401)
+
+    def test_malformed_credentials(self):
+        self.assertEqual(self.fetch('/script_names', headers={'Authorization': 'Basic ' + base64.b64encode('alice')}).code, 401)
+
+    def test_changed_password_file_clears_the_cache(self):
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('alice', 'secret')).code, 200)
+
+        htpasswd = HtpasswdFile(self.passfile)
+        htpasswd.set_password('alice', 'changed')
+        htpasswd.save()
+        os.utime(self.passfile, (0, 0))
+
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('alice', 'secret')).code, 401)
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('alice', 'changed')).code, 200)
+
+    def test_missing_password_file(self):
+        os.rename(self.passfile, self.passfile + '.old')
+
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('alice', 'secret')).code, 401)
+
+        os.rename(self.passfile + '.old', self.passfile)
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('alice', 'secret')).code, 200)
+
+
+class UncachedAuthTest(AuthTest):
+    """ with --auth-cache-ttl 0, every request checks the password file """
+
+    cache_ttl = '0'
+
+    def test_caches_good_credentials(self):
+        self.assertEqual(self.fetch('/script_names', headers=basic_auth('alice', 'secret')).code, 200)
+        self.assertEqual(self.cached(), 0)
+
+
+class CredentialCacheTest(unittest.TestCase):
+    """ cached credentials are only good for the version of the password file they were checked against """
+
+    def test_new_file_clears_the_cache(self):
+        cache = CredentialCache(300, 10)
+        key = cache.key('alice', 'secret')
+
+        self.assertFalse(cache.verified(key, 'old'))
+        cache.add(key, 'old')
+        self.assertTrue(cache.verified(key, 'old'))
+
+        self.assertFalse(cache.verified(key, 'new'))
+        self.assertEqual(len(cache.entries), 0)
+
+    def test_check_finishing_after_a_change_is_not_cached(self):
+        cache = CredentialCache(300, 10)
+        key = cache.key('alice', 'secret')
+
+        cache.verified(key, 'old')
+        cache.verified(key, 'new')
+        cache.add(key, 'old')
+
+        self.assertFalse(cache.verified(key, 'new'))
+        self.assertEqual(len(cache.entries), 0)
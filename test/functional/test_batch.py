@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import json
+
+from test.functional.base import BaseFunctionalTest
+
+JSON = {'Content-Type': 'application/json'}
+
+
+class BatchTest(BaseFunctionalTest):
+    """ running many scripts in one request """
+
+    def batch(self, body):
+        return self.fetch('/batch', method='POST', headers=JSON, body=json.dumps(body), request_timeout=20)
+
+    def statuses(self, response):
+        self.assertEqual(response.code, 200)
+        return dict((result['id'], result['status']) for result in json.loads(response.body)['results'])
+
+    def test_dependencies(self):
+        response = self.batch({'items': [
+            {'id': 'first', 'script': 'echo', 'params': {'text': 'one'}},
+            {'id': 'second', 'script': 'echo', 'params': {'text': 'two'}, 'after': ['first']},
+            {'id': 'broken', 'script': 'fail', 'after': ['first']},
+            {'id': 'after_broken', 'script': 'echo', 'after': ['broken']}
+        ]})
+
+        self.assertEqual(self.statuses(response), {
+            'first': 'finished',
+            'second': 'finished',
+            'broken': 'finished',
+            'after_broken': 'skipped'
+        })
+
+    def test_runs_after_its_dependencies(self):
+        response = self.batch({'items': [
+            {'id': 'later', 'script': 'deploy', 'params': {'host': 'b'}, 'after': ['sooner']},
+            {'id': 'sooner', 'script': 'deploy', 'params': {'host': 'a'}}
+        ]})
+
+        results = dict((result['id'], result) for result in json.loads(response.body)['results'])
+        self.assertTrue(float(results['sooner']['return_values']['end']) <= float(results['later']['return_values']['start']))
+
+    def test_fail_fast(self):
+        response = self.batch({'concurrency': 1, 'fail_fast': True, 'items': [
+            {'id': 'broken', 'script': 'fail'},
+            {'id': 'never', 'script': 'echo', 'params': {'text': 'hi'}}
+        ]})
+
+        self.assertEqual(self.statuses(response), {'broken': 'finished', 'never': 'skipped'})
+
+    def test_without_fail_fast(self):
+        response = self.batch({'concurrency': 1, 'items': [
+            {'id': 'broken', 'script': 'fail'},
+            {'id': 'still', 'script': 'echo', 'params': {'text': 'hi'}}
+        ]})
+
+        self.assertEqual(self.statuses(response), {'broken': 'finished', 'still': 'finished'})
+
+    def test_bad_batches(self):
+        for body in [
+                {},
+                {'items': []},
+                {'items': [{'script': 'missing'}]},
+                {'items': [{'id': 'a', 'script': 'echo', 'after': ['nowhere']}]},
+                {'items': [{'id': 'a', 'script': 'echo', 'after': ['b']}, {'id': 'b', 'script': 'echo', 'after': ['a']}]},
+                {'items': [{'script': 'echo'}] * 101}]:
+            self.assertEqual(self.batch(body).code, 400)
+
+    def test_methods(self):
+        response = self.batch({'items': [
+            {'id': 'posted', 'script': 'echo', 'method': 'POST', 'params': {'text': 'hi'}},
+            {'id': 'got', 'script': 'chatty', 'method': 'get'}
+        ]})
+        self.assertEqual(self.statuses(response), {'posted': 'finished', 'got': 'finished'})
+
+        # items run scripts the way they could be run on their own
+        for item in [{'script': 'chatty'}, {'script': 'echo', 'method': 'get'}, {'script': 'echo', 'method': None}]:
+            self.assertEqual(self.batch({'items': [item]}).code, 400)
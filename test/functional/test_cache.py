@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import json
+import os.path
+import shutil
+import tempfile
+
+from pyjojo.cache import result_cache
+from pyjojo.config import config
+from pyjojo.options import command_line_options
+from pyjojo.util import create_application
+
+from test.functional.base import BaseFunctionalTest
+
+JSON = {'Content-Type': 'application/json'}
+
+
+def look_up(test, name):
+    """ run the cached script, returning its X-Cache header and output """
+
+    response = test.fetch('/scripts/cached', method='POST', headers=JSON, body=json.dumps({'name': name}))
+    test.assertEqual(response.code, 200)
+    return response.headers['X-Cache'], json.loads(response.body)['stdout']
+
+
+class CacheTest(BaseFunctionalTest):
+    """ scripts with a cache field answer from their earlier results """
+
+    def setUp(self):
+        BaseFunctionalTest.setUp(self)
+        result_cache().purge()
+
+    def test_hit(self):
+        status, first = look_up(self, 'alice')
+        self.assertEqual(status, 'MISS')
+
+        status, second = look_up(self, 'alice')
+        self.assertEqual(status, 'HIT')
+        self.assertEqual(first, second)
+
+    def test_keyed_by_params(self):
+        self.assertEqual(look_up(self, 'alice')[0], 'MISS')
+        self.assertEqual(look_up(self, 'bob')[0], 'MISS')
+        self.assertEqual(look_up(self, 'bob')[0], 'HIT')
+
+    def test_uncached_scripts(self):
+        response = self.fetch('/scripts/echo', method='POST', headers=JSON, body=json.dumps({'text': 'hi'}))
+        self.assertNotIn('X-Cache', response.headers)
+
+    def test_purge(self):
+        look_up(self, 'alice')
+        look_up(self, 'bob')
+
+        response = self.fetch('/cache/cached', method='DELETE')
+        self.assertEqual(json.loads(response.body)['purged'], 2)
+        self.assertEqual(look_up(self, 'alice')[0], 'MISS')
+
+        response = self.fetch('/cache', method='DELETE')
+        self.assertEqual(json.loads(response.body)['purged'], 1)
+        self.assertEqual(look_up(self, 'alice')[0], 'MISS')
+
+
+class ReloadCacheTest(BaseFunctionalTest):
+    """ changing a script drops the results cached for the old one """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        shutil.copy('test/fixtures/cached.sh', self.directory)
+        BaseFunctionalTest.setUp(self)
+        result_cache().purge()
+
+    def tearDown(self):
+        BaseFunctionalTest.tearDown(self)
+        shutil.rmtree(self.directory)
+
+    def get_app(self):
+        command_line_options([])
+        config['directory'] = self.directory
+        return create_application(False)
+
+    def test_reload(self):
+        look_up(self, 'alice')
+
+        with open(os.path.join(self.directory, 'cached.sh'), 'a') as f:
+            f.write("# changed\n")
+
+        self.assertEqual(json.loads(self.fetch('/reload', method='POST', headers=JSON, body='').body)['modified'], ['cached'])
+        self.assertEqual(look_up(self, 'alice')[0], 'MISS')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+import json
+import uuid
+
+from test.functional.base import BaseFunctionalTest
+
+JSON = {'Content-Type': 'application/json'}
+
+
+def stamp_request(script, name, key=None):
+    """ a (path, kwargs) request for fetch_all """
+
+    headers = dict(JSON)
+    if key is not None:
+        headers['Idempotency-Key'] = key
+    return '/scripts/{0}'.format(script), {'method': 'POST', 'headers': headers, 'body': json.dumps({'name': name})}
+
+
+def stdout(response):
+    return json.loads(response.body)['stdout']
+
+
+class IdempotencyTest(BaseFunctionalTest):
+    """ retries with the same Idempotency-Key get the first result back, instead of running again """
+
+    def stamp(self, name, key):
+        path, kwargs = stamp_request('stamp', name, key)
+        return self.fetch(path, **kwargs)
+
+    def test_replay(self):
+        key = uuid.uuid4().hex
+
+        first = self.stamp('alice', key)
+        self.assertEqual(first.code, 200)
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+
+        retry = self.stamp('alice', key)
+        self.assertEqual(retry.code, 200)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(stdout(retry), stdout(first))
+
+        # another key runs the script again
+        self.assertNotEqual(stdout(self.stamp('alice', uuid.uuid4().hex)), stdout(first))
+
+    def test_different_params(self):
+        key = uuid.uuid4().hex
+        self.assertEqual(self.stamp('alice', key).code, 200)
+
+        response = self.stamp('bob', key)
+        self.assertEqual(response.code, 422)
+        self.assertEqual(json.loads(response.body)['error']['type'], 'Unprocessable Entity')
+
+    def test_different_params_while_running(self):
+        key = uuid.uuid4().hex
+        first, second = self.fetch_all([stamp_request('stamp', 'alice', key), stamp_request('stamp', 'bob', key)])
+
+        self.assertEqual(first.code, 200)
+        self.assertEqual(second.code, 422)
+
+    def test_retry_while_running(self):
+        key = uuid.uuid4().hex
+        first, retry = self.fetch_all([stamp_request('stamp', 'alice', key), stamp_request('stamp', 'alice', key)])
+
+        self.assertEqual(first.code, 200)
+        self.assertEqual(retry.code, 200)
+        self.assertEqual(stdout(retry), stdout(first))
+
+
+class CoalesceTest(BaseFunctionalTest):
+    """ requests with the same params share a run of a coalesce: True script that's already going """
+
+    def test_coalesced(self):
+        responses = self.fetch_all([stamp_request('coalesced', 'alice')] * 3 + [stamp_request('coalesced', 'bob')])
+
+        self.assertEqual([response.code for response in responses], [200] * 4)
+        self.assertEqual(stdout(responses[0]), stdout(responses[1]))
+        self.assertEqual(stdout(responses[0]), stdout(responses[2]))
+        self.assertNotEqual(stdout(responses[0]), stdout(responses[3]))
+
+        # once it's done, the next request runs it again
+        path, kwargs = stamp_request('coalesced', 'alice')
+        self.assertNotEqual(stdout(self.fetch(path, **kwargs)), stdout(responses[0]))
+
+    def test_not_coalesced(self):
+        first, second = self.fetch_all([stamp_request('stamp', 'alice')] * 2)
+        self.assertNotEqual(stdout(first), stdout(second))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import json
+import os
+import os.path
+import shutil
+import subprocess
+import tempfile
+import time
+
+from test.functional.base import BaseFunctionalTest
+
+JSON = {'Content-Type': 'application/json'}
+
+
+class JobsTest(BaseFunctionalTest):
+    """ running scripts in the background, and asking after them later """
+
+    def submit(self, text='hello'):
+        response = self.fetch('/scripts/echo?async=1', method='POST', headers=JSON, body=json.dumps({'text': text}))
+        self.assertEqual(response.code, 202)
+
+        job = json.loads(response.body)['job']
+        self.assertEqual(response.headers['Location'], '/jobs/{0}'.format(job['id']))
+        self.assertEqual(job['script'], 'echo')
+        return job['id']
+
+    def poll(self, job_id):
+        """ the job's status, once it isn't running anymore """
+
+        for i in range(100):
+            response = self.fetch('/jobs/{0}'.format(job_id))
+            self.assertEqual(response.code, 200)
+
+            job = json.loads(response.body)['job']
+            if job['status'] != 'running':
+                return job
+
+            self.pause(0.05)
+
+        self.fail("Job {0} never finished".format(job_id))
+
+    def pause(self, seconds):
+        self.io_loop.add_timeout(time.time() + seconds, self.stop)
+        self.wait()
+
+    def test_result(self):
+        job_id = self.submit()
+
+        job = self.poll(job_id)
+        self.assertEqual(job['status'], 'finished')
+        self.assertEqual(job['retcode'], 0)
+
+        response = self.fetch('/jobs/{0}/result'.format(job_id))
+        self.assertEqual(response.code, 200)
+        self.assertIn('hello', ' '.join(json.loads(response.body)['stdout']))
+
+    def test_running(self):
+        response = self.fetch('/scripts/slow', headers={'Prefer': 'respond-async'})
+        self.assertEqual(response.code, 202)
+        job_id = json.loads(response.body)['job']['id']
+
+        response = self.fetch('/jobs/{0}/result'.format(job_id))
+        self.assertEqual(response.code, 202)
+        self.assertEqual(json.loads(response.body)['job']['status'], 'running')
+
+        self.assertEqual(self.poll(job_id)['status'], 'timed_out')
+        self.assertTrue(json.loads(self.fetch('/jobs/{0}/result'.format(job_id)).body)['timed_out'])
+
+    def test_not_found(self):
+        self.assertEqual(self.fetch('/jobs/missing').code, 404)
+        self.assertEqual(self.fetch('/jobs/missing/result').code, 404)
+
+
+class JobExpiryTest(JobsTest):
+    """ finished jobs are forgotten once there are too many, or they're too old """
+
+    options = ['--job-max-count', '1', '--job-max-age', '0.5']
+
+    def test_max_count(self):
+        first = self.submit('one')
+        self.poll(first)
+        second = self.submit('two')
+        self.poll(second)
+
+        self.assertEqual(self.fetch('/jobs/{0}'.format(first)).code, 404)
+        self.assertEqual(self.fetch('/jobs/{0}'.format(second)).code, 200)
+
+    def test_max_age(self):
+        job_id = self.submit()
+        self.poll(job_id)
+
+        self.pause(0.6)
+        self.assertEqual(self.fetch('/jobs/{0}'.format(job_id)).code, 404)
+
+
+class DiskJobsTest(JobExpiryTest):
+    """ jobs kept in a --job-dir, where every worker can find them """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.options = JobExpiryTest.options + ['--job-dir', self.directory]
+        JobExpiryTest.setUp(self)
+
+    def tearDown(self):
+        JobExpiryTest.tearDown(self)
+        shutil.rmtree(self.directory)
+
+    def files(self):
+        # evicted jobs are removed from the thread pool, give it a moment
+        self.pause(0.1)
+        return sorted(os.listdir(self.directory))
+
+    def test_files(self):
+        job_id = self.submit()
+        self.poll(job_id)
+        self.assertEqual(self.files(), ['{0}.job'.format(job_id), '{0}.json'.format(job_id)])
+
+        self.pause(0.6)
+        self.assertEqual(self.fetch('/jobs/{0}'.format(job_id)).code, 404)
+        self.assertEqual(self.files(), [])
+
+    def test_other_workers_jobs(self):
+        # a job started by a worker that has since exited
+        worker = subprocess.Popen(['true'])
+        worker.wait()
+
+        with open(os.path.join(self.directory, 'elsewhere.job'), 'w') as f:
+            json.dump({'id': 'elsewhere', 'script': 'echo', 'status': 'running', 'created': time.time(),
+                       'finished': None, 'retcode': None, 'pid': worker.pid}, f)
+
+        response = self.fetch('/jobs/elsewhere')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body)['job']['status'], 'failed')
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+import json
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from passlib.apache import HtpasswdFile
+from tornado.concurrent import Future
+
+from pyjojo.ratelimit import rate_limiter, parse_rate
+from pyjojo.scheduler import Slots
+
+from test.functional.base import BaseFunctionalTest
+from test.functional.test_auth import basic_auth
+
+JSON = {'Content-Type': 'application/json'}
+
+
+class RateLimitTest(BaseFunctionalTest):
+    """ scripts with a rate_limit are turned away with a 429 past it """
+
+    def setUp(self):
+        BaseFunctionalTest.setUp(self)
+        rate_limiter().scripts.clear()
+
+    def test_rate_limit(self):
+        self.assertEqual(self.fetch('/scripts/limited').code, 200)
+        self.assertEqual(self.fetch('/scripts/limited').code, 200)
+
+        response = self.fetch('/scripts/limited')
+        self.assertEqual(response.code, 429)
+        self.assertEqual(response.headers['Retry-After'], '60')
+        self.assertEqual(json.loads(response.body)['error']['type'], 'Too Many Requests')
+
+    def test_options_are_not_limited(self):
+        for i in range(3):
+            self.assertEqual(self.fetch('/scripts/limited', method='OPTIONS').code, 200)
+        self.assertEqual(self.fetch('/scripts/limited').code, 200)
+
+    def test_batch_items_count(self):
+        self.assertEqual(self.fetch('/scripts/limited').code, 200)
+
+        # one run left, so neither item runs
+        response = self.fetch('/batch', method='POST', headers=JSON,
+                              body=json.dumps({'items': [{'script': 'limited', 'method': 'get'}, {'script': 'limited', 'method': 'get'}]}))
+        self.assertEqual(response.code, 429)
+
+        self.assertEqual(self.fetch('/scripts/limited').code, 200)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('5'), (5.0, 5))
+        self.assertEqual(parse_rate('30/m'), (0.5, 30))
+        self.assertEqual(parse_rate('1/h, 3'), (1 / 3600.0, 3))
+
+        for value in ['0', 'fast', '5/d', '5, 0']:
+            self.assertRaises(ValueError, parse_rate, value)
+
+
+class PriorityTest(BaseFunctionalTest):
+    """ X-Priority may lower a script's priority, only --priority-users may raise it """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.passfile = os.path.join(self.directory, 'htpasswd')
+
+        htpasswd = HtpasswdFile(self.passfile, new=True)
+        htpasswd.set_password('alice', 'secret')
+        htpasswd.set_password('bob', 'secret')
+        htpasswd.save()
+
+        self.options = ['--priority-users', 'alice', self.passfile]
+        BaseFunctionalTest.setUp(self)
+
+    def tearDown(self):
+        BaseFunctionalTest.tearDown(self)
+        shutil.rmtree(self.directory)
+
+    def echo(self, user, priority):
+        headers = dict(basic_auth(user, 'secret'), **JSON)
+        headers['X-Priority'] = priority
+        return self.fetch('/scripts/echo', method='POST', headers=headers, body=json.dumps({'text': 'hi'}))
+
+    def test_lower_priority(self):
+        self.assertEqual(self.echo('bob', 'low').code, 200)
+        self.assertEqual(self.echo('bob', 'normal').code, 200)
+
+    def test_higher_priority(self):
+        self.assertEqual(self.echo('bob', 'high').code, 403)
+        self.assertEqual(self.echo('alice', 'high').code, 200)
+
+    def test_unknown_priority(self):
+        self.assertEqual(self.echo('alice', 'urgent').code, 400)
+
+    def test_batch_priority(self):
+        headers = dict(basic_auth('bob', 'secret'), **JSON)
+        headers['X-Priority'] = 'high'
+        response = self.fetch('/batch', method='POST', headers=headers,
+                              body=json.dumps({'items': [{'script': 'echo', 'params': {'text': 'hi'}}]}))
+        self.assertEqual(response.code, 403)
+
+
+class QueueTest(unittest.TestCase):
+    """ urgent work goes first and users take turns, a full queue makes room for urgent work or light users """
+
+    def acquire(self, slots, requests):
+        results = []
+        for name, user, priority in requests:
+            slots.acquire(lambda admitted, name=name: results.append((name, admitted)), user, priority)
+        return results
+
+    def test_full_queue_rejects(self):
+        slots = Slots('all', 1, 2, 0)
+        results = self.acquire(slots, [('running', 'bob', 'normal'), ('one', 'bob', 'normal'), ('two', 'bob', 'normal'), ('three', 'bob', 'normal')])
+
+        self.assertEqual(results, [('running', True), ('three', False)])
+
+    def test_fair_share(self):
+        slots = Slots('all', 1, 10, 0)
+        results = self.acquire(slots, [('running', 'bulk', 'normal'), ('bulk 1', 'bulk', 'normal'), ('bulk 2', 'bulk', 'normal'),
+                                       ('alice', 'alice', 'normal'), ('urgent', 'bob', 'high')])
+
+        for i in range(4):
+            slots.release()
+        order = [name for name, admitted in results]
+        self.assertEqual(order[:2], ['running', 'urgent'])
+        self.assertTrue(order.index('alice') < order.index('bulk 2'))
+
+    def test_urgent_work_makes_room(self):
+        slots = Slots('all', 1, 2, 0)
+        results = self.acquire(slots, [('running', 'bulk', 'low'), ('one', 'bulk', 'low'), ('two', 'bulk', 'low'), ('urgent', 'alice', 'high')])
+
+        self.assertEqual(results, [('running', True), ('two', False)])
+
+        slots.release()
+        self.assertEqual(results[-1], ('urgent', True))
+
+    def test_light_users_make_room(self):
+        slots = Slots('all', 1, 2, 0)
+        results = self.acquire(slots, [('running', 'bulk', 'normal'), ('one', 'bulk', 'normal'), ('two', 'bulk', 'normal'),
+                                       ('alice', 'alice', 'normal'), ('alice again', 'alice', 'normal')])
+
+        self.assertEqual(results, [('running', True), ('two', False), ('alice again', False)])
+
+    def test_less_urgent_work_does_not_make_room(self):
+        slots = Slots('all', 1, 1, 0)
+        results = self.acquire(slots, [('running', 'bob', 'normal'), ('waiting', 'bob', 'normal'), ('later', 'alice', 'low')])
+
+        self.assertEqual(results, [('running', True), ('later', False)])
+
+    def test_abandoned_waiters_leave_the_queue(self):
+        slots = Slots('all', 1, 2, 0)
+        abandoned = Future()
+        results = []
+        for name, user, gone in [('running', 'bob', None), ('gone', 'alice', abandoned), ('waiting', 'bob', None)]:
+            slots.acquire(lambda admitted, name=name: results.append((name, admitted)), user, 'normal', gone)
+
+        abandoned.set_result(None)
+        self.assertEqual(results, [('running', True), ('gone', False)])
+        self.assertEqual(slots.waiting, 1)
+
+        slots.release()
+        self.assertEqual(results[-1], ('waiting', True))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import json
+
+from tornado.httpclient import AsyncHTTPClient
+
+from test.functional.base import BaseFunctionalTest
+
+JSON = {'Content-Type': 'application/json'}
+
+
+class LockTest(BaseFunctionalTest):
+    """ scripts with a lock, or a lock per value of some params """
+
+    def deploy_spans(self, hosts):
+        """ deploy to each host at once, returning when each run started and ended """
+
+        requests = [('/scripts/deploy', dict(method='POST', headers=JSON, body=json.dumps({'host': host}))) for host in hosts]
+
+        spans = []
+        for response in self.fetch_all(requests):
+            self.assertEqual(response.code, 200)
+            values = json.loads(response.body)['return_values']
+            spans.append((float(values['start']), float(values['end'])))
+
+        return spans
+
+    def overlap(self, first, second):
+        return (first[0] < second[1]) and (second[0] < first[1])
+
+    def test_same_key_takes_turns(self):
+        spans = self.deploy_spans(['web1', 'web1', 'web1'])
+
+        for index, span in enumerate(spans):
+            for other in spans[index + 1:]:
+                self.assertFalse(self.overlap(span, other))
+
+    def test_different_keys_run_together(self):
+        spans = self.deploy_spans(['web1', 'web2'])
+        self.assertTrue(self.overlap(spans[0], spans[1]))
+
+    def test_lock_timeout(self):
+        responses = self.fetch_all([('/scripts/impatient', {}), ('/scripts/impatient', {})])
+        codes = sorted(response.code for response in responses)
+        self.assertEqual(codes, [200, 503])
+
+        rejected = [response for response in responses if response.code == 503][0]
+        self.assertIn('Retry-After', rejected.headers)
+
+    def test_locks_are_dropped_when_idle(self):
+        self.deploy_spans(['web1', 'web2'])
+
+        response = self.fetch('/locks')
+        self.assertEqual(json.loads(response.body)['locks'], [])
+
+    def test_waiters_leave_when_their_client_does(self):
+        body = json.dumps({'host': 'web1'})
+
+        # the second deploy gives up while the first holds the lock, so it never runs
+        impatient = AsyncHTTPClient(self.io_loop, force_instance=True)
+        self.http_client.fetch(self.get_url('/scripts/deploy'), self.stop, method='POST', headers=JSON, body=body)
+        impatient.fetch(self.get_url('/scripts/deploy'), lambda response: None, method='POST', headers=JSON, body=body,
+                        request_timeout=0.1)
+
+        self.assertEqual(self.wait(timeout=10).code, 200)
+        impatient.close()
+
+        response = self.fetch('/locks')
+        self.assertEqual(json.loads(response.body)['locks'], [])
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import json
+import logging
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from pyjojo.config import config
+from pyjojo.logs import LogQueue
+from pyjojo.metrics import Registry, metrics
+from pyjojo.options import command_line_options
+from pyjojo.util import create_application
+
+from test.functional.base import BaseFunctionalTest
+
+JSON = {'Content-Type': 'application/json'}
+
+
+class RemovedScriptTest(BaseFunctionalTest):
+    """ a script removed on reload takes its metrics with it """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        shutil.copy('test/fixtures/echo.sh', self.directory)
+        BaseFunctionalTest.setUp(self)
+
+    def tearDown(self):
+        BaseFunctionalTest.tearDown(self)
+        shutil.rmtree(self.directory)
+
+    def get_app(self):
+        command_line_options([])
+        config['directory'] = self.directory
+        return create_application(False)
+
+    def test_removed(self):
+        self.fetch('/scripts/echo', method='POST', headers=JSON, body=json.dumps({'text': 'hi'}))
+        self.assertIn('script="echo"', self.fetch('/metrics').body)
+
+        os.remove(os.path.join(self.directory, 'echo.sh'))
+        self.assertEqual(json.loads(self.fetch('/reload', method='POST', headers=JSON, body='').body)['removed'], ['echo'])
+        self.assertNotIn('script="echo"', self.fetch('/metrics').body)
+
+
+class RegistryTest(unittest.TestCase):
+
+    def test_remove_series(self):
+        registry = Registry()
+        runs = registry.counter('runs', "Runs.", ('script', 'code'))
+        seconds = registry.histogram('seconds', "Seconds.", ('script',))
+        dropped = registry.counter('dropped', "Dropped.", ('logger',))
+
+        runs.inc(('echo', '200'))
+        runs.inc(('echo', '500'))
+        runs.inc(('deploy', '200'))
+        seconds.observe(('echo',), 0.1)
+        dropped.inc(('echo',))
+
+        registry.remove_series('script', 'echo')
+
+        self.assertEqual(runs.values, {('deploy', '200'): 1})
+        self.assertEqual(seconds.values, {})
+        self.assertEqual(dropped.values, {('echo',): 1})
+
+
+class DroppedLogsTest(BaseFunctionalTest):
+    """ records dropped by a full log queue are counted on the IOLoop """
+
+    def test_dropped(self):
+        handler = LogQueue(logging.NullHandler(), 1)
+        handler.start()
+
+        # stop the writer thread taking anything off the queue
+        handler.queue.put(None)
+        handler.thread.join()
+        handler.queue.put(None)
+
+        before = metrics().log_dropped.values.get(('dropping',), 0)
+        for i in range(3):
+            handler.emit(logging.LogRecord('dropping', logging.INFO, __file__, 1, "dropped", None, None))
+
+        self.assertEqual(metrics().log_dropped.values.get(('dropping',), 0), before)
+        self.io_loop.add_callback(self.stop)
+        self.wait()
+        self.assertEqual(metrics().log_dropped.values.get(('dropping',), 0), before + 3)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+import json
+
+from test.functional.base import BaseFunctionalTest
+
+LINES = ['line {0}'.format(i) for i in range(1, 1001)]
+TEXT = '\n'.join(LINES) + '\n'
+
+
+class SpillTest(BaseFunctionalTest):
+    """ output over max_output is spilled to disk, and served from there with byte ranges """
+
+    def spilled(self):
+        response = self.fetch('/scripts/chatty')
+        self.assertEqual(response.code, 200)
+        return json.loads(response.body)
+
+    def test_truncated(self):
+        result = self.spilled()
+
+        self.assertEqual(result['stdout'], LINES[:100] + LINES[-100:])
+        self.assertEqual(result['truncated']['stdout']['lines'], 1000)
+        self.assertEqual(result['truncated']['stdout']['bytes'], len(TEXT))
+        self.assertEqual(result['truncated']['stdout']['stored_bytes'], len(TEXT))
+
+    def test_whole_output(self):
+        response = self.fetch(self.spilled()['truncated']['stdout']['url'])
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, TEXT)
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(response.headers['Content-Length'], str(len(TEXT)))
+
+    def test_ranges(self):
+        url = self.spilled()['truncated']['stdout']['url']
+
+        for header, start, end in [('bytes=0-9', 0, 10), ('bytes=100-', 100, len(TEXT)), ('bytes=-12', len(TEXT) - 12, len(TEXT)),
+                                   ('bytes=10-100000', 10, len(TEXT))]:
+            response = self.fetch(url, headers={'Range': header})
+            self.assertEqual(response.code, 206)
+            self.assertEqual(response.body, TEXT[start:end])
+            self.assertEqual(response.headers['Content-Range'], 'bytes {0}-{1}/{2}'.format(start, end - 1, len(TEXT)))
+
+    def test_unsatisfiable_ranges(self):
+        url = self.spilled()['truncated']['stdout']['url']
+
+        for header in ['bytes={0}-'.format(len(TEXT)), 'bytes=0-1,5-6', 'lines=1-2', 'bytes=-']:
+            self.assertEqual(self.fetch(url, headers={'Range': header}).code, 416)
+
+    def test_missing_output(self):
+        self.assertEqual(self.fetch('/output/{0}/stdout'.format('0' * 32)).code, 404)
+
+
+class ReturnValuesTest(BaseFunctionalTest):
+    """ values passed back with jojo_return_value and jojo_return_json lines """
+
+    def return_values(self, path):
+        """ from the last line, which is the whole response, or the exit frame of a stream """
+
+        response = self.fetch(path)
+        self.assertEqual(response.code, 200)
+        return json.loads(response.body.splitlines()[-1])['return_values']
+
+    def test_return_values(self):
+        self.assertEqual(self.return_values('/scripts/returns'), {
+            'url': 'http://example.com/?a=b',
+            'person': {'name': 'bob', 'age': 99},
+            'padding': 'x' * 200,
+            'last': 'here'
+        })
+
+    def test_streamed(self):
+        self.assertEqual(self.return_values('/scripts/returns?stream=ndjson')['person'], {'name': 'bob', 'age': 99})
+
+
+class MaxReturnBytesTest(ReturnValuesTest):
+    """ values that would take the return values past --max-return-bytes are dropped """
+
+    options = ['--max-return-bytes', '100']
+
+    def test_return_values(self):
+        self.assertEqual(self.return_values('/scripts/returns'), {
+            'url': 'http://example.com/?a=b',
+            'person': {'name': 'bob', 'age': 99},
+            'last': 'here'
+        })
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+import json
+
+from test.functional.base import BaseFunctionalTest
+
+JSON = {'Content-Type': 'application/json'}
+
+
+class PersistentTest(BaseFunctionalTest):
+    """ persistent scripts answer requests from a pool of long lived children """
+
+    def tearDown(self):
+        for script in self._app.settings['scripts'].values():
+            script.close()
+        BaseFunctionalTest.tearDown(self)
+
+    def count(self, crash=''):
+        return self.fetch('/scripts/counter', method='POST', headers=JSON, body=json.dumps({'crash': crash}))
+
+    def answer(self):
+        """ the pid of the child that answered, and how many requests it has had """
+
+        response = self.count()
+        self.assertEqual(response.code, 200)
+
+        pid, count = json.loads(response.body)['stdout'][0].split()[1::2]
+        return pid, int(count)
+
+    def test_recycled(self):
+        answers = [self.answer() for i in range(4)]
+
+        # the same child answers max_requests times, then a new one takes over
+        pid = answers[0][0]
+        self.assertEqual(answers[:3], [(pid, 1), (pid, 2), (pid, 3)])
+        self.assertNotEqual(answers[3][0], pid)
+        self.assertEqual(answers[3][1], 1)
+
+    def test_crashed(self):
+        pid = self.answer()[0]
+
+        self.assertEqual(self.count('yes').code, 502)
+
+        replacement = self.answer()
+        self.assertNotEqual(replacement[0], pid)
+        self.assertEqual(replacement[1], 1)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+import errno
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pyjojo import scripts
+from pyjojo.scripts import parse_script
+from pyjojo.spawner import spawner
+
+from test.functional.base import BaseFunctionalTest
+
+JSON = {'Content-Type': 'application/json'}
+
+
+class ScriptListTest(BaseFunctionalTest):
+    """ listing the scripts, filtered by tags, with etags """
+
+    def names(self, query):
+        response = self.fetch('/script_names?' + query)
+        self.assertEqual(response.code, 200)
+        return sorted(json.loads(response.body)['script_names'])
+
+    def test_all(self):
+        fixtures = sorted(name[:-len('.sh')] for name in os.listdir('test/fixtures') if name.endswith('.sh'))
+        self.assertEqual(self.names(''), fixtures)
+
+    def test_tags(self):
+        self.assertEqual(self.names('tags=ops'), ['deploy', 'fail'])
+        self.assertEqual(self.names('tags=ops,deploy'), ['deploy'])
+        self.assertEqual(self.names('tags=ops&tags=deploy'), ['deploy'])
+
+    def test_not_tags(self):
+        self.assertEqual(self.names('tags=ops&not_tags=deploy'), ['fail'])
+
+    def test_any_tags(self):
+        self.assertEqual(self.names('any_tags=deploy,nothing'), ['deploy'])
+        self.assertEqual(self.names('any_tags=nothing'), [])
+
+    def test_not_modified(self):
+        response = self.fetch('/scripts?tags=ops')
+        etag = response.headers['Etag']
+        self.assertEqual(len(json.loads(response.body)['scripts']), 2)
+
+        response = self.fetch('/scripts?tags=ops', headers={'If-None-Match': etag})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(response.body, '')
+
+        # another query has another etag
+        response = self.fetch('/scripts?tags=deploy', headers={'If-None-Match': etag})
+        self.assertEqual(response.code, 200)
+
+    def test_same_query_same_etag(self):
+        self.assertEqual(self.fetch('/scripts?tags=ops').headers['Etag'], self.fetch('/scripts?tags=ops').headers['Etag'])
+
+
+def alive(pid):
+    """ is the process still running, rather than gone or a zombie waiting to be reaped """
+
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        if e.errno == errno.ESRCH:
+            return False
+        raise
+
+    try:
+        with open('/proc/{0}/stat'.format(pid)) as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except IOError:
+        return False
+
+
+class RunScriptTest(BaseFunctionalTest):
+    """ running scripts """
+
+    def test_echo(self):
+        response = self.fetch('/scripts/echo', method='POST', headers=JSON, body=json.dumps({'text': 'hello'}))
+        self.assertEqual(response.code, 200)
+
+        result = json.loads(response.body)
+        self.assertEqual(result['retcode'], 0)
+        self.assertIn('hello', ' '.join(result['stdout']))
+
+    def test_wrong_method(self):
+        self.assertEqual(self.fetch('/scripts/echo').code, 405)
+
+    def test_not_found(self):
+        self.assertEqual(self.fetch('/scripts/missing').code, 404)
+
+    def test_timeout(self):
+        response = self.fetch('/scripts/slow', request_timeout=10)
+        self.assertEqual(response.code, 504)
+
+        result = json.loads(response.body)
+        self.assertTrue(result['timed_out'])
+        self.assertEqual(result['stdout'], ['started'])
+
+    def test_timeout_kills_children(self):
+        directory = tempfile.mkdtemp()
+        pidfile = os.path.join(directory, 'pids')
+        grace, scripts.KILL_GRACE = scripts.KILL_GRACE, 0.5
+
+        try:
+            response = self.fetch('/scripts/orphans', method='POST', headers=JSON, body=json.dumps({'pidfile': pidfile}),
+                                  request_timeout=10)
+            self.assertEqual(response.code, 504)
+            self.assertEqual(json.loads(response.body)['stdout'], ['started'])
+
+            with open(pidfile) as f:
+                pids = [int(pid) for pid in f.read().split()]
+        finally:
+            scripts.KILL_GRACE = grace
+            shutil.rmtree(directory)
+
+        # the one ignoring SIGTERM went once its pipes closed, the other may still be on its way out
+        self.assertEqual(len(pids), 2)
+        for i in range(50):
+            if not any(alive(pid) for pid in pids):
+                break
+            time.sleep(0.1)
+
+        self.assertEqual([pid for pid in pids if alive(pid)], [])
+
+
+class HelperRunScriptTest(RunScriptTest):
+    """ running scripts, started by the spawn helper instead of a fork """
+
+    options = ['--spawner', 'helper']
+
+    def test_started_by_helper(self):
+        self.test_echo()
+        self.assertIsNotNone(spawner().helper)
+
+
+class ParseScriptTest(unittest.TestCase):
+    """ reading the jojo block at the top of a script """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.warnings = []
+
+        self.handler = logging.Handler()
+        self.handler.emit = lambda record: self.warnings.append(record.getMessage())
+        logging.getLogger('pyjojo.scripts').addHandler(self.handler)
+
+    def tearDown(self):
+        logging.getLogger('pyjojo.scripts').removeHandler(self.handler)
+        shutil.rmtree(self.directory)
+
+    def parse(self, *lines):
+        filename = os.path.join(self.directory, 'script.sh')
+        with open(filename, 'w') as f:
+            f.write("#!/bin/bash\n# see: the wiki\n\n# -- jojo --\n")
+            f.write(''.join("# {0}\n".format(line) for line in lines))
+            f.write("# -- jojo --\n\necho hi\n")
+        os.chmod(filename, 0o755)
+        return parse_script(filename)
+
+    def test_colons_in_values(self):
+        fields = self.parse("description: restarts the service: nginx, gracefully",
+                            "param: url - where to go, like http://example.com:8080 - or not")
+
+        self.assertEqual(fields['description'], "restarts the service: nginx, gracefully")
+        self.assertEqual(fields['params'], [{'name': 'url', 'description': "where to go, like http://example.com:8080 - or not"}])
+        self.assertEqual(self.warnings, [])
+
+    def test_bad_lines_are_pointed_at(self):
+        fields = self.parse("description: fine", "timeout: soon", "not a field", "colour: blue")
+
+        self.assertEqual(fields['description'], "fine")
+        self.assertEqual(fields['timeout'], None)
+
+        filename = os.path.join(self.directory, 'script.sh')
+        self.assertEqual(self.warnings, [
+            "unrecognized timeout in jojo block of {0}, line 6: soon".format(filename),
+            "skipping line without a field in jojo block of {0}, line 7: not a field".format(filename),
+            "unrecognized line in jojo block of {0}, line 8: colour: blue".format(filename)
+        ])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import json
+import os
+import os.path
+import shutil
+import socket
+import tempfile
+import time
+
+from tornado.iostream import IOStream
+
+from test.functional.base import BaseFunctionalTest
+
+JSON = {'Content-Type': 'application/json'}
+
+
+class StreamTest(BaseFunctionalTest):
+    """ streaming output as it's written, with ?stream= or an Accept header """
+
+    def test_ndjson(self):
+        response = self.fetch('/scripts/chatty?stream=ndjson')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson; charset=UTF-8')
+
+        frames = [json.loads(line) for line in response.body.splitlines()]
+        self.assertEqual(frames[:-1], [{'stream': 'stdout', 'line': 'line {0}'.format(i)} for i in range(1, 1001)])
+        self.assertEqual(frames[-1], {'retcode': 0, 'timed_out': False, 'return_values': {}})
+
+    def test_sse(self):
+        response = self.fetch('/scripts/echo', method='POST', body=json.dumps({'text': 'hello'}),
+                              headers={'Content-Type': 'application/json', 'Accept': 'text/event-stream'})
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'text/event-stream; charset=UTF-8')
+
+        events = [event.split('\n') for event in response.body.split('\n\n') if event]
+        self.assertEqual(len(events), 2)
+
+        self.assertEqual(events[0][0], 'event: stdout')
+        self.assertIn('hello', json.loads(events[0][1][len('data: '):])['line'])
+
+        self.assertEqual(events[1][0], 'event: exit')
+        self.assertEqual(json.loads(events[1][1][len('data: '):])['retcode'], 0)
+
+    def test_timed_out(self):
+        response = self.fetch('/scripts/slow?stream=true', request_timeout=10)
+        self.assertEqual(response.code, 200)
+
+        frames = [json.loads(line) for line in response.body.splitlines()]
+        self.assertEqual(frames[0], {'stream': 'stdout', 'line': 'started'})
+        self.assertTrue(frames[-1]['timed_out'])
+
+    def test_not_streamed(self):
+        response = self.fetch('/scripts/chatty')
+        self.assertEqual(response.headers['Content-Type'], 'application/json; charset=UTF-8')
+
+
+class SlowConsumerTest(BaseFunctionalTest):
+    """ a client that doesn't read holds up the script, rather than its output piling up in memory """
+
+    def setUp(self):
+        BaseFunctionalTest.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.marker = os.path.join(self.directory, 'finished')
+
+    def tearDown(self):
+        BaseFunctionalTest.tearDown(self)
+        shutil.rmtree(self.directory)
+
+    def pause(self, seconds):
+        self.io_loop.add_timeout(time.time() + seconds, self.stop)
+        self.wait(timeout=seconds + 5)
+
+    def test_paused(self):
+        # a plain socket with a small buffer, that takes nothing until it's asked to
+        client = socket.socket()
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
+        client.connect(('127.0.0.1', self.get_http_port()))
+
+        body = json.dumps({'marker': self.marker})
+        client.sendall("POST /scripts/flood?stream=ndjson HTTP/1.0\r\nContent-Type: application/json\r\n"
+                       "Content-Length: {0}\r\n\r\n{1}".format(len(body), body))
+
+        # nobody is reading, so the script is still stuck writing
+        self.pause(1)
+        self.assertFalse(os.path.exists(self.marker))
+
+        stream = IOStream(client, io_loop=self.io_loop)
+        stream.read_until_close(self.stop)
+        response = self.wait(timeout=60)
+
+        self.assertTrue(os.path.exists(self.marker))
+        self.assertEqual(response.count('"stream": "stdout"'), 20000)
+        self.assertEqual(json.loads(response.splitlines()[-1])['retcode'], 0)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from tornado.httpclient import HTTPClient, HTTPError
+
+JSON = {'Content-Type': 'application/json'}
+
+
+def unused_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class WorkersTest(unittest.TestCase):
+    """ a real server with several worker processes, which share what they know """
+
+    workers = 4
+
+    def setUp(self):
+        self.port = unused_port()
+
+        # where the server makes its temporary directories
+        self.tmp = tempfile.mkdtemp()
+        env = dict(os.environ, TMPDIR=self.tmp)
+
+        self.server = subprocess.Popen([sys.executable, '-c', 'from pyjojo.server import main; main()',
+                                        '--dir', 'test/fixtures', '--address', '127.0.0.1', '--port', str(self.port),
+                                        '--workers', str(self.workers), '--log-level', 'error'], env=env)
+        self.client = HTTPClient()
+
+        # wait for the workers to start answering
+        for i in range(100):
+            try:
+                self.fetch('/script_names')
+                return
+            except (HTTPError, socket.error):
+                time.sleep(0.1)
+
+        self.fail("Server didn't start")
+
+    def tearDown(self):
+        self.client.close()
+        self.stop()
+        shutil.rmtree(self.tmp)
+
+    def stop(self):
+        if self.server.poll() is None:
+            self.server.send_signal(signal.SIGTERM)
+            self.server.wait()
+
+    def fetch(self, path, **kwargs):
+        response = self.client.fetch('http://127.0.0.1:{0}{1}'.format(self.port, path), **kwargs)
+        return json.loads(response.body)
+
+    def test_any_worker_answers_for_a_job(self):
+        jobs = []
+        for i in range(self.workers):
+            job = self.fetch('/scripts/echo?async=1', method='POST', headers=JSON, body=json.dumps({'text': str(i)}))['job']
+            jobs.append(job['id'])
+
+        # each request goes to whichever worker accepts it first
+        for job_id in jobs:
+            for i in range(3):
+                self.assertEqual(self.fetch('/jobs/{0}'.format(job_id))['job']['id'], job_id)
+
+        for index, job_id in enumerate(jobs):
+            for i in range(50):
+                job = self.fetch('/jobs/{0}'.format(job_id))['job']
+                if job['status'] != 'running':
+                    break
+                time.sleep(0.1)
+
+            self.assertEqual(job['status'], 'finished')
+            for i in range(3):
+                result = self.fetch('/jobs/{0}/result'.format(job_id))
+                self.assertIn(str(index), ' '.join(result['stdout']))
+
+    def test_temporary_directories_are_removed(self):
+        self.assertEqual(self.fetch('/scripts/chatty')['truncated']['stdout']['lines'], 1000)
+        self.assertNotEqual(os.listdir(self.tmp), [])
+
+        self.stop()
+        self.assertEqual(os.listdir(self.tmp), [])
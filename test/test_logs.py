@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+import json
+import logging
+import random
+import sys
+import time
+import unittest
+
+from pyjojo.config import config
+from pyjojo.logs import JsonFormatter, TextFormatter, LogQueue, log_execution
+from pyjojo.metrics import metrics
+from pyjojo.options import command_line_options
+
+
+def make_record(name='pyjojo.test', level=logging.INFO, message="hello %s", args=('world',), fields=None, exc_info=None):
+    record = logging.LogRecord(name, level, __file__, 42, message, args, exc_info)
+    if fields is not None:
+        record.fields = fields
+    return record
+
+
+class Recorder(logging.Handler):
+    """ keeps the records it is handed """
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class FakeScript(object):
+    name = 'deploy'
+    priority = 'normal'
+
+    def filter_params(self, params):
+        return dict((key, 'FILTERED' if key == 'password' else value) for key, value in params.items())
+
+
+class FormatterTest(unittest.TestCase):
+
+    def test_json(self):
+        line = JsonFormatter().format(make_record(fields={'script': 'deploy', 'retcode': 0}))
+        self.assertNotIn('\n', line)
+
+        entry = json.loads(line)
+        self.assertEqual(entry['message'], 'hello world')
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['logger'], 'pyjojo.test')
+        self.assertEqual(entry['file'], 'test_logs.py:42')
+        self.assertEqual(entry['script'], 'deploy')
+        self.assertEqual(entry['retcode'], 0)
+
+    def test_json_exception(self):
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            record = LogQueue(Recorder(), 1).prepare(make_record(level=logging.ERROR, exc_info=sys.exc_info()))
+
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertIn('ValueError: broken', entry['exception'])
+
+    def test_text(self):
+        line = TextFormatter().format(make_record(fields={'script': 'deploy'}))
+        self.assertTrue(line.endswith('hello world {"script": "deploy"}'))
+
+
+class LogExecutionTest(unittest.TestCase):
+
+    def setUp(self):
+        command_line_options([])
+        self.recorder = Recorder()
+        self.logger = logging.getLogger('pyjojo.execution')
+        self.logger.addHandler(self.recorder)
+        self.level = self.logger.level
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.recorder)
+        self.logger.setLevel(self.level)
+
+    def run_script(self, retcode=0, status='finished'):
+        log_execution(FakeScript(), 'alice', {'host': 'a', 'password': 'secret'}, time.time(), retcode, status)
+
+    def test_logged(self):
+        self.run_script()
+
+        record, = self.recorder.records
+        self.assertEqual(record.levelno, logging.INFO)
+        self.assertEqual(record.fields['params'], {'host': 'a', 'password': 'FILTERED'})
+        self.assertEqual(record.fields['user'], 'alice')
+        self.assertNotIn('sample_rate', record.fields)
+
+    def test_sampled(self):
+        config['log_sample'] = 0.25
+
+        state = random.getstate()
+        random.seed(1)
+        try:
+            for i in range(400):
+                self.run_script()
+        finally:
+            random.setstate(state)
+
+        # about a quarter of the successes, each saying how they were sampled
+        self.assertTrue(50 < len(self.recorder.records) < 150)
+        self.assertEqual(set(record.fields['sample_rate'] for record in self.recorder.records), set([0.25]))
+
+    def test_failures_are_not_sampled(self):
+        config['log_sample'] = 0
+
+        self.run_script()
+        self.run_script(retcode=1)
+        self.run_script(retcode=None, status='timed_out')
+
+        self.assertEqual([(record.levelno, record.fields['status']) for record in self.recorder.records],
+                         [(logging.WARNING, 'finished'), (logging.WARNING, 'timed_out')])
+
+
+class LogQueueTest(unittest.TestCase):
+
+    def test_written(self):
+        recorder = Recorder()
+        handler = LogQueue(recorder, 10)
+
+        for i in range(3):
+            handler.emit(make_record(args=(i,)))
+        handler.close()
+
+        self.assertEqual([record.msg for record in recorder.records], ['hello 0', 'hello 1', 'hello 2'])
+
+    def test_dropped(self):
+        handler = LogQueue(Recorder(), 1)
+        handler.start()
+
+        # stop the writer thread, then fill the queue
+        handler.queue.put(None)
+        handler.thread.join()
+        handler.queue.put(None)
+
+        before = metrics().log_dropped.values.get(('pyjojo.dropped',), 0)
+        for i in range(5):
+            handler.emit(make_record(name='pyjojo.dropped'))
+        self.assertEqual(handler.dropped, {'pyjojo.dropped': 5})
+
+        handler.count_dropped()
+        self.assertEqual(handler.dropped, {})
+        self.assertEqual(metrics().log_dropped.values[('pyjojo.dropped',)], before + 5)